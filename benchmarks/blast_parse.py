@@ -0,0 +1,146 @@
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import Alignments
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def make_queries(n_queries, n_hits, seed=1):
+    '''
+    Random queries with `n_hits` gapped hits each.
+
+    Returns
+    -------
+    queries: list
+        (title, length, hits) tuple for each query. hits is a list of dicts.
+    '''
+    rng = random.Random(seed)
+    ret = list()
+    for q in range(n_queries):
+        length = rng.randint(200, 800)
+        hits = list()
+        for h in range(n_hits):
+            align_len = rng.randint(100, length)
+            qseq = ''.join(rng.choice(AMINO_ACIDS + '-') for _ in range(align_len))
+            hseq = ''.join(rng.choice(AMINO_ACIDS + '-') for _ in range(align_len))
+            midline = ''.join(a if a == b else ' ' for a, b in zip(qseq, hseq))
+            hits.append({'id': 'sp|H{:05d}|H{:05d}_MOUSE'.format(q * n_hits + h, q * n_hits + h),
+                         'accession': 'H{:05d}'.format(q * n_hits + h),
+                         'title': 'Homolog {} of query {} OS=Mus musculus'.format(h, q),
+                         'len': length + 20,
+                         'evalue': '{:g}'.format(10 ** -rng.uniform(1, 150) * rng.uniform(1, 9)),
+                         'query_from': 1, 'query_to': align_len - qseq.count('-'),
+                         'hit_from': 1, 'hit_to': align_len - hseq.count('-'),
+                         'align_len': align_len, 'qseq': qseq, 'hseq': hseq, 'midline': midline})
+        ret.append((str(q), length, hits))
+    return ret
+
+
+def to_xml(queries):
+    ''' BLAST XML (-outfmt 5) for `queries`. '''
+    lines = ['<?xml version="1.0"?>', '<BlastOutput>',
+             '  <BlastOutput_program>blastp</BlastOutput_program>',
+             '  <BlastOutput_version>BLASTP 2.10.0+</BlastOutput_version>',
+             '  <BlastOutput_db>mouse_nr_uniprot</BlastOutput_db>',
+             '  <BlastOutput_iterations>']
+    for i, (title, length, hits) in enumerate(queries):
+        lines += ['<Iteration>',
+                  '  <Iteration_iter-num>{}</Iteration_iter-num>'.format(i + 1),
+                  '  <Iteration_query-ID>Query_{}</Iteration_query-ID>'.format(i + 1),
+                  '  <Iteration_query-def>{}</Iteration_query-def>'.format(title),
+                  '  <Iteration_query-len>{}</Iteration_query-len>'.format(length),
+                  '  <Iteration_hits>']
+        for n, hit in enumerate(hits):
+            lines += ['<Hit>',
+                      '  <Hit_num>{}</Hit_num>'.format(n + 1),
+                      '  <Hit_id>{}</Hit_id>'.format(hit['id']),
+                      '  <Hit_def>{}</Hit_def>'.format(escape(hit['title'])),
+                      '  <Hit_accession>{}</Hit_accession>'.format(hit['accession']),
+                      '  <Hit_len>{}</Hit_len>'.format(hit['len']),
+                      '  <Hit_hsps>', '    <Hsp>']
+            for key, tag in Alignments._JSON_HSP_KEYS:
+                if key in hit:
+                    lines.append('      <{0}>{1}</{0}>'.format(tag, hit[key]))
+            lines += ['    </Hsp>', '  </Hit_hsps>', '</Hit>']
+        lines += ['  </Iteration_hits>', '</Iteration>']
+    lines += ['  </BlastOutput_iterations>', '</BlastOutput>', '']
+    return '\n'.join(lines).encode('utf-8')
+
+
+def to_json(queries):
+    ''' Single file BLAST JSON (-outfmt 15) for `queries`. '''
+    reports = list()
+    for i, (title, length, hits) in enumerate(queries):
+        json_hits = list()
+        for n, hit in enumerate(hits):
+            hsp = {key: hit[key] for key, _ in Alignments._JSON_HSP_KEYS if key in hit}
+            hsp['evalue'] = float(hit['evalue'])
+            json_hits.append({'num': n + 1,
+                              'description': [{k: hit[k] for k in ('id', 'accession', 'title')}],
+                              'len': hit['len'], 'hsps': [hsp]})
+        reports.append({'report': {'program': 'blastp', 'version': 'BLASTP 2.10.0+',
+                                   'search_target': {'db': 'mouse_nr_uniprot'},
+                                   'results': {'search': {'query_id': 'Query_{}'.format(i + 1),
+                                                          'query_title': title, 'query_len': length,
+                                                          'hits': json_hits}}}})
+    return json.dumps({'BlastOutput2': reports}, indent=2).encode('utf-8')
+
+
+def time_parser(parser, data, repeats):
+    ''' Best time of `repeats` runs of parser on data. '''
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parser(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the time to parse blastp XML and JSON output.')
+    parser.add_argument('-q', '--queries', type=int, default=256, help='Number of queries. 256 is the default.')
+    parser.add_argument('-n', '--hits', type=int, default=5, help='Number of hits per query. 5 is the default.')
+    parser.add_argument('-r', '--repeats', type=int, default=5, help='Number of times to run each parser. 5 is the default.')
+    args = parser.parse_args()
+
+    queries = make_queries(args.queries, args.hits)
+    xml_data = to_xml(queries)
+    json_data = to_json(queries)
+
+    # Check that both parsers give the same answers
+    xml_results = Alignments.read_blast(io.BytesIO(xml_data))
+    json_results = Alignments.read_json(json_data)
+    if [x[0] for x in xml_results] != [x[0] for x in json_results]:
+        raise RuntimeError('Queries do not match!')
+    for (_, xml_result), (_, json_result), (_, length, _) in zip(xml_results, json_results, queries):
+        xml_alignment = Alignments.Alignment(xml_result)
+        json_alignment = Alignments.Alignment(json_result)
+        if (xml_alignment.get_best_id() != json_alignment.get_best_id() or
+                xml_alignment.get_best_evalue() != json_alignment.get_best_evalue()):
+            raise RuntimeError('Best hits do not match!')
+        for pos in range(1, length + 1):
+            if (xml_alignment.conserved_at_position(pos) != json_alignment.conserved_at_position(pos) or
+                    xml_alignment.alignment_at_position(pos) != json_alignment.alignment_at_position(pos)):
+                raise RuntimeError('Alignments do not match at position {}!'.format(pos))
+
+    xml_time = time_parser(lambda x: Alignments.read_blast(io.BytesIO(x)), xml_data, args.repeats)
+    json_time = time_parser(Alignments.read_json, json_data, args.repeats)
+    sys.stdout.write('{} queries, {} hits each\n'.format(args.queries, args.hits))
+    sys.stdout.write('\txml:  {:.1f} ms ({:.1f} MB)\n'.format(xml_time * 1000, len(xml_data) / 1e6))
+    sys.stdout.write('\tjson: {:.1f} ms ({:.1f} MB)\n'.format(json_time * 1000, len(json_data) / 1e6))
+    sys.stdout.write('\tspeedup: {:.1f}x\n'.format(xml_time / json_time))
+
+
+if __name__ == '__main__':
+    main()
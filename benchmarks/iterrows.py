@@ -0,0 +1,86 @@
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules.dataframe import DataFrame
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def make_data(n_rows, n_cols, seed=1):
+    '''
+    Random peptide table with an id and sequence column followed by `n_cols` - 2 other columns.
+
+    Returns
+    -------
+    data: dict
+        Key value pairs of column names and lists of strings.
+    '''
+    rng = random.Random(seed)
+    data = {'id': ['P{:05d}'.format(rng.randint(0, n_rows // 10)) for _ in range(n_rows)],
+            'sequence': [''.join(rng.choice(AMINO_ACIDS) for _ in range(rng.randint(6, 20))) for _ in range(n_rows)]}
+    for c in range(n_cols - 2):
+        values = ['', 'run{}'.format(c), '{:.2f}'.format(rng.random())]
+        data['col_{}'.format(c)] = [rng.choice(values) for _ in range(n_rows)]
+    return data
+
+
+def old_iterrows(data, nrow):
+    ''' DataFrame.iterrows before typed columns: a new dict with every column for each row of list columns. '''
+    for i in range(nrow):
+        yield i, {col: data[col][i] for col in data}
+
+
+def read_fields(rows):
+    ''' Read the id and sequence of each row, like the loops in main. '''
+    n = 0
+    for i, row in rows:
+        n += len(row['id']) + len(row['sequence'])
+    return n
+
+
+def time_loop(make_rows, repeats):
+    ''' Best time of `repeats` runs of read_fields over make_rows(). '''
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        read_fields(make_rows())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the time to iterate over DataFrame rows as dicts and with RowView.')
+    parser.add_argument('-n', '--rows', type=int, default=100000, help='Number of rows. 100000 is the default.')
+    parser.add_argument('-c', '--cols', type=int, default=100, help='Number of columns. 100 is the default.')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='Number of times to run each loop. 3 is the default.')
+    args = parser.parse_args()
+
+    data = make_data(args.rows, args.cols)
+    dat = DataFrame(data)
+
+    # Check that every method gives the same rows
+    for (i, old_row), (j, new_row) in zip(old_iterrows(data, args.rows), dat.iterrows()):
+        if i != j or old_row != dict(new_row):
+            raise RuntimeError('Rows do not match at row {}!'.format(i))
+    for (i, old_row), (j, new_row) in zip(old_iterrows(data, args.rows), dat.iterrows(columns=['id', 'sequence'])):
+        if old_row['id'] != new_row['id'] or old_row['sequence'] != new_row['sequence']:
+            raise RuntimeError('Rows do not match at row {}!'.format(i))
+
+    times = [('dict per row', time_loop(lambda: old_iterrows(data, args.rows), args.repeats)),
+             ('RowView, all columns', time_loop(dat.iterrows, args.repeats)),
+             ('RowView, columns=[id, sequence]', time_loop(lambda: dat.iterrows(columns=['id', 'sequence']), args.repeats))]
+
+    sys.stdout.write('{} rows, {} columns\n'.format(args.rows, args.cols))
+    for name, elapsed in times:
+        sys.stdout.write('\t{:<32} {:.2f} us/row\n'.format(name + ':', elapsed / args.rows * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules.dataframe import DataFrame, resolve_compression
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def make_data(n_rows, n_cols, seed=1):
+    '''
+    Random annotated peptide table. Half of the columns after the id and
+    sequence columns are mostly blank, like the added annotation columns.
+
+    Returns
+    -------
+    data: dict
+        Key value pairs of column names and lists of strings.
+    '''
+    rng = random.Random(seed)
+    data = {'id': ['P{:05d}'.format(rng.randint(0, n_rows // 10)) for _ in range(n_rows)],
+            'sequence': [''.join(rng.choice(AMINO_ACIDS) for _ in range(rng.randint(6, 20))) for _ in range(n_rows)]}
+    for c in range(n_cols - 2):
+        if c % 2:
+            values = [''] * 9 + ['DOMAIN--{}'.format(c)]
+        else:
+            values = ['{:.3f}'.format(rng.random()) for _ in range(100)]
+        data['col_{}'.format(c)] = [rng.choice(values) for _ in range(n_rows)]
+    return data
+
+
+def old_to_tsv(fname, data, sep='\t'):
+    ''' DataFrame.to_tsv before typed columns: one write per cell of list columns. '''
+    columns = list(data)
+    nrow = len(data[columns[0]])
+    with open(fname, 'w') as outF:
+        outF.write('{}'.format(sep).join(columns))
+        outF.write('\n')
+        for i in range(nrow):
+            for row_i, c in enumerate(columns):
+                if row_i == 0:
+                    outF.write(data[c][i])
+                else:
+                    outF.write('{}{}'.format(sep, data[c][i]))
+            outF.write('\n')
+
+
+def time_writer(writer, fname, repeats):
+    ''' Best time of `repeats` runs of writer(fname). '''
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        writer(fname)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the time to write a DataFrame with per cell writes and with to_tsv.')
+    parser.add_argument('-n', '--rows', type=int, default=200000, help='Number of rows. 200000 is the default.')
+    parser.add_argument('-c', '--cols', type=int, default=14, help='Number of columns. 14 is the default.')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='Number of times to run each writer. 3 is the default.')
+    args = parser.parse_args()
+
+    data = make_data(args.rows, args.cols)
+    dat = DataFrame(data)
+    tmp = tempfile.mkdtemp()
+    try:
+        fnames = {x: os.path.join(tmp, 'out.{}'.format(x)) for x in ('old.tsv', 'tsv', 'tsv.gz', 'tsv.zst')}
+        writers = [('per cell writes', 'old.tsv', lambda x: old_to_tsv(x, data)),
+                   ('to_tsv', 'tsv', dat.to_tsv),
+                   ('to_tsv, gzip', 'tsv.gz', dat.to_tsv)]
+        try:
+            resolve_compression(fnames['tsv.zst'])
+            writers.append(('to_tsv, zstd', 'tsv.zst', dat.to_tsv))
+        except RuntimeError:
+            sys.stderr.write('zstandard is not installed. Skipping zstd.\n')
+
+        # Check that both writers give the same file
+        old_to_tsv(fnames['old.tsv'], data)
+        dat.to_tsv(fnames['tsv'])
+        with open(fnames['old.tsv'], 'rb') as old_file, open(fnames['tsv'], 'rb') as new_file:
+            if old_file.read() != new_file.read():
+                raise RuntimeError('Output files do not match!')
+
+        sys.stdout.write('{} rows, {} columns\n'.format(args.rows, args.cols))
+        for name, ext, writer in writers:
+            elapsed = time_writer(writer, fnames[ext], args.repeats)
+            sys.stdout.write('\t{:<16} {:.2f} s ({:.1f} MB)\n'.format(name + ':', elapsed,
+                                                                    os.path.getsize(fnames[ext]) / 1e6))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
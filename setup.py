@@ -17,8 +17,10 @@ setup(name='cimage_annotation',
       package_dir={'':'src'},
       packages=find_packages(where='src'),
       python_requires='>=3.6.*',
-      install_requires=['biopython==1.78', 'tqdm'],
-      entry_points={'console_scripts': ['cimage_annotation=cimage_annotation:main', 'qsub_cimage_annotation=cimage_annotation:qsubmit_main']},
+      install_requires=['biopython==1.78', 'tqdm', 'numpy'],
+      extras_require={'zstd': ['zstandard']},
+      entry_points={'console_scripts': ['cimage_annotation=cimage_annotation:main', 'qsub_cimage_annotation=cimage_annotation:qsubmit_main',
+                                          'merge_cimage_annotation=cimage_annotation:merge_main']},
 )
 
 
@@ -1,2 +1,3 @@
 from .main import main
 from .qsubmit import main as qsubmit_main
+from .merge import main as merge_main
@@ -1,10 +1,12 @@
 
 import sys
+import shutil
 import argparse
-import re
 from multiprocessing import cpu_count
 
-from .submodules import MSParser, UniProt, Alignments, fasta, parent_parser
+from .submodules import MSParser, UniProt, Alignments, RecordCache, SwissProtIndex, Retry, PeptideMapper, ThreadPlan
+from .submodules import AlignmentCache, Journal, Shards, WorkQueue
+from .submodules import fasta, parent_parser, dataframe
 
 PROG_VERSION = 2.1
 SEQ_PATH = 'sequences.fasta'
@@ -16,7 +18,7 @@ def read_input(args):
     if args.file_type == 'cimage':
         ret = MSParser.Cimage_file()
     elif args.file_type == 'tsv':
-        ret = MSParser.Tsv_file(id_col=args.id_col, seq_col=args.seq_col)
+        ret = MSParser.Tsv_file(id_col=args.id_col, seq_col=args.seq_col, chunksize=args.tsv_chunk_size)
     elif args.file_type == 'dtaselect':
         ret = MSParser.Dtaselect()
     else:
@@ -27,6 +29,10 @@ def read_input(args):
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        from . import worker
+        return worker.main(sys.argv[2:])
+
     parser = argparse.ArgumentParser(prog='cimage_annotation', parents=[parent_parser.PARENT_PARSER],
                                      description='Annotate functional cysteine residues in cimage output.',
                                      epilog='cimage_annotation was written by Dan Bak and Aaron Maurais.\n')
@@ -37,9 +43,15 @@ def main():
                         '1 is the default.')
 
     parser.add_argument('-t', '--nThread', type=int, default=None,
-                        help='Chose how many threads to use for parllel processing.'
+                        help='Chose how many cores to use for parllel processing. '
+                        'The cores are split between UniProt requests and blastp processes unless '
+                        '--net_threads, --blast_procs or --blast_threads are specified. '
                         'This option overrides the --parallel option.')
 
+    parser.add_argument('--shard_ids', default=None, type=str,
+                        help='Path to file with one protein ID per line. If specified, only peptides of these proteins '
+                             'are annotated. Used by qsub_cimage_annotation --shards.')
+
     parser.add_argument('--debug', choices=['none', 'pdb', 'pudb'], default='none',
                         help='Start the main method in the selected debugger.')
 
@@ -63,11 +75,34 @@ def main():
     if args.align and args.database_dir is None:
         sys.stderr.write('--database_dir must be specified when --align 1 is set\n')
         return -1
+    if args.align and args.queue_dir is None and shutil.which(args.blastp_exe) is None:
+        sys.stderr.write('blastp executable "{}" could not be found\n'.format(args.blastp_exe))
+        return -1
+    try:
+        dataframe.resolve_compression(args.ofname)
+    except RuntimeError as e:
+        sys.stderr.write('{}\n'.format(e))
+        return -1
+    blast_env = dict()
+    for var in args.blast_env or []:
+        name, sep, value = var.partition('=')
+        if not sep or not name:
+            sys.stderr.write('Invalid --blast_env value: "{}". Must be NAME=VALUE\n'.format(var))
+            return -1
+        blast_env[name] = value
     _nThread = args.nThread
     if args.parallel and args.nThread is None:
         _nThread = cpu_count()
     elif not args.parallel and args.nThread is None:
         _nThread=1
+    _net_threads = args.net_threads
+    if _net_threads is None and not args.parallel and args.nThread is None:
+        _net_threads = 1
+    thread_plan = ThreadPlan.plan_threads(_nThread, net_threads=_net_threads,
+                                          blast_procs=args.blast_procs, blast_threads=args.blast_threads)
+    if args.verbose:
+        sys.stdout.write('Using {} UniProt request thread(s), {} blastp process(es) and {} thread(s) per blastp process.\n'.format(
+                         thread_plan.net_threads, thread_plan.blast_procs, thread_plan.blast_threads))
 
 
     # Open input file
@@ -77,27 +112,63 @@ def main():
         sys.stderr.write('ERROR: No peptides found in {}!\n\tExiting...\n'.format(args.input_file))
         return -1
 
+    # Only annotate proteins in shard
+    if args.shard_ids is not None:
+        input_file.unique_ids = input_file.unique_ids & Shards.read_shard_ids(args.shard_ids)
+        sys.stdout.write('Annotating {} protein(s) in {}\n'.format(len(input_file.unique_ids), args.shard_ids))
+
+    cache = None
+    dat_index = None
+    if args.uniprot_dat is not None:
+        dat_index = SwissProtIndex.SwissProtIndex(args.uniprot_dat, verbose=args.verbose)
+    elif not args.no_cache:
+        cache = RecordCache.RecordCache(args.cache_dir, ttl=args.cache_ttl, max_size=args.cache_size)
+
+    queue = None
+    if args.queue_dir is not None:
+        queue = WorkQueue.WorkQueue(args.queue_dir, lease=args.queue_lease)
+
+    # Finished work is recorded so the run can be resumed if it is interrupted
+    journal = Journal.Journal(Journal.DEFAULT_JOURNAL_FNAME, resume=args.resume)
+
+    scheduler = Retry.RetryScheduler(n_retry=args.n_retry, timeout=args.request_timeout,
+                                     hedge_after=args.hedge_after, verbose=args.verbose)
+
     sys.stdout.write('\nRetreiving protein Uniprot records...\n')
-    record_dict = UniProt.get_uniprot_records(input_file.unique_ids, _nThread, verbose=args.verbose,
-            show_bar = not(args.verbose and args.parallel == 0))
+    record_dict = UniProt.get_uniprot_records(input_file.unique_ids, thread_plan.net_threads, verbose=args.verbose,
+            show_bar = not(args.verbose and args.parallel == 0),
+            cache=cache, dat_index=dat_index,
+            engine=args.fetch_engine, max_in_flight=args.max_in_flight, scheduler=scheduler,
+            journal=journal, queue=queue)
+
+    # Map all peptides to their parent proteins
+    peptide_matches = PeptideMapper.map_all([(p[args.id_col], p[args.seq_col])
+                                             for _, p in input_file.iterpeptides(columns=(args.id_col, args.seq_col))
+                                             if p[args.id_col] in input_file.unique_ids],
+                                            record_dict)
+
+    # Protein level data is computed once per protein and residue annotations are memoized
+    annotator = UniProt.Annotator(record_dict, all_features=args.all_features, res_sep=RESIDUE_SEP, fxn_sep=FXN_SEP)
 
     sequences = dict()
     seq_written = False
-    for i, p in input_file.iterpeptides():
+    updates = MSParser.ColumnBuffer()
+    for i, p in input_file.iterpeptides(columns=(args.id_col, args.seq_col, args.description_col, 'description')):
+        if p[args.id_col] not in input_file.unique_ids:
+            continue
+
         # Get and Parse Uniprot entry for protein
-        try:
-            seq_temp = re.match(r'.?\.?([A-z\*]+)\.?/?', p[args.seq_col]).group(1)
-        except AttributeError as e:
+        match = peptide_matches[(p[args.id_col], p[args.seq_col])]
+        if match is None:
             sys.stdout.write('Error parsing sequence: {}'.format(p[args.seq_col]))
             continue
 
-        UniProt_data = UniProt.ExPasy(seq_temp, record_dict[p[args.id_col]],
-                                      all_features=args.all_features, res_sep=RESIDUE_SEP, fxn_sep=FXN_SEP)
+        UniProt_data = annotator.annotate(p[args.id_col], match.sites)
 
-        input_file.set_peptide_value(i, 'position', UniProt_data[1])   # cysteine position
-        input_file.set_peptide_value(i, 'res_function', UniProt_data[2]) # cysteine function (if known)
-        input_file.set_peptide_value(i, 'domains', UniProt_data[3]) # Domain at position (if known)
-        input_file.set_peptide_value(i, 'protein_location', UniProt_data[5]) # protein subcellular localization (if known)
+        updates.set(i, 'position', UniProt_data[1])   # cysteine position
+        updates.set(i, 'res_function', UniProt_data[2]) # cysteine function (if known)
+        updates.set(i, 'domains', UniProt_data[3]) # Domain at position (if known)
+        updates.set(i, 'protein_location', UniProt_data[5]) # protein subcellular localization (if known)
 
         if args.write_seq:
             if p[args.id_col] not in sequences: #only write sequence if it is not currently in file
@@ -108,6 +179,7 @@ def main():
                                         append=seq_written)
                 seq_written = True
         sequences[p[args.id_col]] = ('' if args.description_col not in p else p[args.description_col], UniProt_data[4])
+    updates.flush(input_file)
 
     # Replace alignment files with empty string so they won't be continuously appended to.
     if args.write_alignment_data and args.align:
@@ -121,90 +193,131 @@ def main():
             sys.stdout.write('Done!\n')
 
     if args.align:
-        alignment_data = Alignments.align_all(input_file.unique_ids, sequences, args.database_dir, Alignments.organism_list,
-                                              nThread=_nThread, verbose=args.verbose,
-                                              show_bar=not(args.verbose and args.parallel == 0))
-        
         for o in Alignments.organism_list:
             input_file.add_column('{}_conserved'.format(o))
-
         if args.defined_organism != 'none':
-            
             for o in MSParser.ALLIGNMENT_COLUMNS:
                 input_file.add_column('{}_{}'.format(args.defined_organism, o))
 
-            org_ids = set()
-            for a in alignment_data.values():
-                org_ids.add(a[args.defined_organism].get_best_id())
+        # Row indices and residue positions of the peptides for each protein
+        protein_peptides = dict()
+        for i, p in input_file.iterpeptides(columns=(args.id_col, 'position')):
+            if p[args.id_col] in input_file.unique_ids:
+                protein_peptides.setdefault(p[args.id_col], list()).append((i, p['position']))
+
+        # Alignment files are written in the order proteins first appear in the input
+        write_order = list(protein_peptides)
+        pending_writes = dict()
+        next_write = 0
+
+        alignment_cache = None
+        if not args.no_cache:
+            alignment_cache = AlignmentCache.AlignmentCache(args.cache_dir, max_size=args.blast_cache_size)
+        alignments = Alignments.iter_alignments(input_file.unique_ids, sequences, args.database_dir, Alignments.organism_list,
+                                                nThread=thread_plan.blast_procs, verbose=args.verbose,
+                                                show_bar=not(args.verbose and args.parallel == 0),
+                                                chunk_size=args.blast_chunk_size,
+                                                blast_threads=thread_plan.blast_threads,
+                                                cache=alignment_cache,
+                                                output_format=args.blast_format,
+                                                blastp_exe=args.blastp_exe, blast_env=blast_env,
+                                                journal=journal, queue=queue)
+
+        # Proteins are annotated as their alignments finish.
+        # Homolog functions are added once all the homolog UniProt records are retrieved.
+        org_ids = set()
+        homolog_positions = list()
+        for protein_id, alignment_data in alignments:
+            if args.write_alignment_data and protein_id in protein_peptides:
+                pending_writes[protein_id] = alignment_data
+                while next_write < len(write_order) and write_order[next_write] in pending_writes:
+                    for organism, alignment in pending_writes.pop(write_order[next_write]).items():
+                        alignment.write('{}_alignments.{}'.format(organism, args.align_format),
+                                        file_format=args.align_format, mode='a')
+                    next_write += 1
+
+            if args.defined_organism != 'none':
+                org_ids.add(alignment_data[args.defined_organism].get_best_id())
+
+            for i, position in protein_peptides.get(protein_id, []):
+                for organism in Alignments.organism_list:
+                    evalue = alignment_data[organism].get_best_evalue()
+                    conserved_temp = list()
+                    for pos in position.split(RESIDUE_SEP):
+                        cp_temp = '--'
+                        if pos in ('BAD_ID', 'RESIDUE_NOT_FOUND'):
+                            cp_temp = 'Error'
+                        else:
+                            assert(pos.isdigit())
+                            if evalue is None:
+                                cp_temp == '--'
+                            elif evalue <= args.evalue_co:
+                                cp_temp = 'Yes' if alignment_data[organism].conserved_at_position(int(pos)) else 'No'
+                        conserved_temp.append(cp_temp)
+
+                    updates.set(i, '{}_conserved'.format(str(organism)), RESIDUE_SEP.join(conserved_temp))
+
+                    # for comparative organism find homologous positions in best blast hit
+                    if organism == args.defined_organism.lower():
+                        org_dict_temp = {x: '' for x in MSParser.ALLIGNMENT_COLUMNS}
+
+                        id_temp = alignment_data[organism].get_best_id()
+                        org_dict_temp['id'] = id_temp
+                        org_dict_temp['description'] = alignment_data[organism].get_best_description()
+                        if id_temp != '':
+                            org_dict_temp['evalue'] = alignment_data[organism].get_best_evalue()
+                            if org_dict_temp['evalue'] <= args.evalue_co:
+                                positions_temp = list()
+                                for pos in position.split(RESIDUE_SEP):
+                                    homolog_position = None if not pos.isdigit() else alignment_data[organism].alignment_at_position(int(pos))[1]
+                                    positions_temp.append(0 if homolog_position is None else homolog_position)
+                                org_dict_temp['position'] = RESIDUE_SEP.join([str(x) for x in positions_temp])
+                                homolog_positions.append((i, id_temp, positions_temp))
+
+                        # add alignment data to peptides
+                        for k, v in org_dict_temp.items():
+                            key_temp = '{}_{}'.format(args.defined_organism, k)
+                            updates.set(i, key_temp, v)
+        updates.flush(input_file)
+
+        if alignment_cache is not None:
+            alignment_cache.close()
 
+        if args.defined_organism != 'none':
             sys.stdout.write('\nRetreiving Uniprot records for {} alignments...\n'.format(args.defined_organism))
-            org_record_dict = UniProt.get_uniprot_records(org_ids, _nThread, verbose=args.verbose,
-                                                          show_bar=not(args.verbose and args.parallel==0))
-
-        seen=set() # Keep track of seen protein IDs
-        for i, p in input_file.iterpeptides():
-            for organism in Alignments.organism_list:
-                if p[args.id_col] in seen and args.write_alignment_data:
-                    alignment_data[p[args.id_col]][organism].write('{}_alignments.{}'.format(organism, args.align_format),
-                                                            file_format=args.align_format, mode='a')
-                seen.add(p[args.id_col])
-
-                evalue = alignment_data[p[args.id_col]][organism].get_best_evalue()
-                conserved_temp = list()
-                for pos in p['position'].split(RESIDUE_SEP):
-                    cp_temp = '--'
-                    if pos in ('BAD_ID', 'RESIDUE_NOT_FOUND'):
-                        cp_temp = 'Error'
+            org_record_dict = UniProt.get_uniprot_records(org_ids, thread_plan.net_threads, verbose=args.verbose,
+                                                          show_bar=not(args.verbose and args.parallel==0),
+                                                          cache=cache, dat_index=dat_index,
+                                                          engine=args.fetch_engine, max_in_flight=args.max_in_flight,
+                                                          scheduler=scheduler, journal=journal, queue=queue)
+            org_annotator = UniProt.Annotator(org_record_dict, all_features=args.all_features)
+
+            # add function of homologous residues
+            for i, id_temp, positions_temp in homolog_positions:
+                functions_temp = list()
+                for homolog_position in positions_temp:
+                    if org_record_dict[id_temp] is None:
+                        functions_temp.append('')
+                    else:
+                        functions_temp.append(org_annotator.site(id_temp, homolog_position - 1)[0])
+
+                if ''.join(functions_temp):
+                    if len(functions_temp) == 1:
+                        function = functions_temp[0]
                     else:
-                        assert(pos.isdigit())
-                        if evalue is None:
-                            cp_temp == '--'
-                        elif evalue <= args.evalue_co:
-                            cp_temp = 'Yes' if alignment_data[p[args.id_col]][organism].conserved_at_position(int(pos)) else 'No'
-                    conserved_temp.append(cp_temp)
-
-                input_file.set_peptide_value(i, '{}_conserved'.format(str(organism)), RESIDUE_SEP.join(conserved_temp))
-
-                # for comparative organism analyze Uniprot entry of best blast hit
-                if organism == args.defined_organism.lower():
-                    org_dict_temp = {x: '' for x in MSParser.ALLIGNMENT_COLUMNS}
-
-                    id_temp = alignment_data[p[args.id_col]][organism].get_best_id()
-                    org_dict_temp['id'] = id_temp
-                    org_dict_temp['description'] = alignment_data[p[args.id_col]][organism].get_best_description()
-                    if id_temp != '':
-                        org_dict_temp['evalue'] = alignment_data[p[args.id_col]][organism].get_best_evalue()
-                        if org_dict_temp['evalue'] <= args.evalue_co:
-
-                            positions_temp = list()
-                            functions_temp = list()
-                            for pos in p['position'].split(RESIDUE_SEP):
-                                homolog_position = None if not pos.isdigit() else alignment_data[p[args.id_col]][organism].alignment_at_position(int(pos))[1]
-                                if homolog_position is None:
-                                    homolog_position = 0
-                                positions_temp.append(str(homolog_position))
-                                if org_record_dict[id_temp] is None:
-                                    functions_temp.append('')
-                                else:
-                                    functions_temp.append(UniProt.res_features(org_record_dict[id_temp],
-                                                                               homolog_position - 1,
-                                                                               all_features=args.all_features)[0])
-
-                        org_dict_temp['position'] = RESIDUE_SEP.join(positions_temp)
-                        if ''.join(functions_temp):
-                            if len(functions_temp) == 1:
-                                org_dict_temp['function'] = functions_temp[0]
-                            else:
-                                org_dict_temp['function'] = FXN_SEP.join(['{}:{}'.format(p, s) for p, s in zip(positions_temp,
-                                                                                                              functions_temp)])
-
-                    # add alignment data to peptides
-                    for k, v in org_dict_temp.items():
-                        key_temp = '{}_{}'.format(args.defined_organism, k)
-                        input_file.set_peptide_value(i, key_temp, v)
+                        function = FXN_SEP.join(['{}:{}'.format(p, s) for p, s in zip(positions_temp, functions_temp)])
+                    updates.set(i, '{}_function'.format(args.defined_organism), function)
+            updates.flush(input_file)
+
+    if cache is not None:
+        sys.stdout.write('\nUniProt cache totals: {} hit(s), {} miss(es)\n'.format(cache.hits, cache.misses))
+        cache.close()
+    if dat_index is not None:
+        dat_index.close()
 
     # file output
     input_file.write(args.ofname)
+    journal.close(remove=True)
     sys.stdout.write('\nResults written to {}\n\n'.format(args.ofname))
 
 
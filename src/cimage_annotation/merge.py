@@ -0,0 +1,55 @@
+
+import sys
+import os
+import argparse
+
+from .submodules import Shards, Alignments
+from .main import SEQ_PATH
+
+
+def main():
+
+    parser = argparse.ArgumentParser(prog='merge_cimage_annotation',
+                                     description='Merge output of cimage_annotation jobs submitted with '
+                                                 'qsub_cimage_annotation --shards.')
+
+    parser.add_argument('-n', '--n_shards', type=int, required=True,
+                        help='Number of shards.')
+
+    parser.add_argument('--ofname', default='residue_annotation.tsv',
+                        help='Name of output file of each shard and of merged file.')
+
+    parser.add_argument('--id_col', default='id',
+                        help='Column header containing protein IDs in output files. "id" is the default.')
+
+    parser.add_argument('shard_dir', type=str, help='Path to directory containing shards.')
+
+    args = parser.parse_args()
+
+    shard_ids = list()
+    shard_fnames = list()
+    for i in range(args.n_shards):
+        shard_ids.append(Shards.read_shard_ids(Shards.shard_ids_fname(args.shard_dir, i)))
+        shard_fnames.append(os.path.join(Shards.shard_wd(args.shard_dir, i), os.path.basename(args.ofname)))
+        if not os.path.isfile(shard_fnames[-1]):
+            sys.stderr.write('ERROR: Output for shard {} not found: {}\n'.format(i, shard_fnames[-1]))
+            return -1
+
+    sys.stdout.write('Merging output of {} shard(s)...'.format(args.n_shards))
+    ids = Shards.merge_output(shard_fnames, shard_ids, args.ofname, id_col=args.id_col)
+    sys.stdout.write('Done!\n')
+
+    # sequence and alignment records are written in the order proteins first appear in the merged output
+    aux_fnames = [(SEQ_PATH, 'fasta')] + [('{}_alignments.{}'.format(o, f), f) for o in Alignments.organism_list for f in ('txt', 'xml')]
+    for fname, file_format in aux_fnames:
+        fnames = [os.path.join(Shards.shard_wd(args.shard_dir, i), fname) for i in range(args.n_shards)]
+        if any(os.path.isfile(x) for x in fnames):
+            sys.stdout.write('Writing {}...'.format(fname))
+            Shards.merge_records(fnames, ids, fname, file_format)
+            sys.stdout.write('Done!\n')
+
+    sys.stdout.write('\nResults written to {}\n\n'.format(args.ofname))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,15 +5,18 @@ import argparse
 import subprocess
 import os.path
 
-from .submodules import parent_parser
+from .submodules import parent_parser, ThreadPlan, Shards, RecordCache, SwissProtIndex
+from .main import read_input
 
 # BLAST_PBS_VERSION = 'blast'
 # PBS_MODULE_LOAD_COMMAND = 'module load'
 CIMAGE_ANNOTATION_EXE = 'cimage_annotation'
+MERGE_EXE = 'merge_cimage_annotation'
 
 def makePBS(mem, ppn, walltime, wd, cimage_annotation_args):
     pbsName = '{}/cimage_annotation.pbs'.format(wd)
-    _flags = ' '.join(['--{} {}'.format(k,v) for k, v in cimage_annotation_args.items() if v is not None and k != 'input_file'])
+    _flags = ' '.join(['--{} {}'.format(k,x) for k, v in cimage_annotation_args.items() if v is not None and k != 'input_file'
+                       for x in (v if isinstance(v, list) else [v])])
 
     sys.stdout.write('Writing {}...'.format(pbsName))
     with open(pbsName, 'w') as outF:
@@ -27,6 +30,88 @@ def makePBS(mem, ppn, walltime, wd, cimage_annotation_args):
     return pbsName
 
 
+def makeArrayPBS(mem, ppn, walltime, wd, n_shards, cimage_annotation_args):
+    '''
+    Write array job with one task for each shard.
+    Each task is run in its own directory in the shard directory.
+    '''
+    pbsName = '{}/cimage_annotation_array.pbs'.format(wd)
+    _flags = ' '.join(['--{} {}'.format(k,x) for k, v in cimage_annotation_args.items() if v is not None and k != 'input_file'
+                       for x in (v if isinstance(v, list) else [v])])
+    shard_dir = os.path.join(wd, Shards.SHARD_DIR)
+
+    sys.stdout.write('Writing {}...'.format(pbsName))
+    with open(pbsName, 'w') as outF:
+        outF.write("#!/bin/tcsh\n")
+        outF.write('#PBS -l mem={}gb,nodes=1:ppn={},walltime={}\n'.format(mem, ppn, walltime))
+        outF.write('#PBS -t 0-{}\n\n'.format(n_shards - 1))
+        outF.write('cd {}\n'.format(Shards.shard_wd(shard_dir, '$PBS_ARRAYID')))
+        outF.write('{} {} --shard_ids {} {} > stdout.txt\n'.format(CIMAGE_ANNOTATION_EXE, _flags,
+                                                                    Shards.shard_ids_fname(shard_dir, '$PBS_ARRAYID'),
+                                                                    cimage_annotation_args['input_file']))
+
+    sys.stdout.write('Done!\n')
+    return pbsName
+
+
+def makeMergePBS(mem, walltime, wd, n_shards, ofname, id_col):
+    ''' Write job to merge output of shards. '''
+    pbsName = '{}/cimage_annotation_merge.pbs'.format(wd)
+
+    sys.stdout.write('Writing {}...'.format(pbsName))
+    with open(pbsName, 'w') as outF:
+        outF.write("#!/bin/tcsh\n")
+        outF.write('#PBS -l mem={}gb,nodes=1:ppn=1,walltime={}\n\n'.format(mem, walltime))
+        outF.write('cd {}\n'.format(wd))
+        outF.write('{} -n {} --ofname {} --id_col {} {} > stdout.txt\n'.format(MERGE_EXE, n_shards, ofname, id_col,
+                                                                                os.path.join(wd, Shards.SHARD_DIR)))
+
+    sys.stdout.write('Done!\n')
+    return pbsName
+
+
+def makeShards(args, wd):
+    '''
+    Split unique protein IDs in input file into shards with about the same total sequence length.
+
+    Sequence lengths are read from the local UniProt flat file or the UniProt record cache.
+    Proteins which are not found are given the median length of the proteins which were found.
+
+    Returns
+    -------
+    n_shards: int
+        Number of shards written.
+    '''
+
+    input_file = read_input(args)
+
+    lengths = dict()
+    if args.uniprot_dat is not None:
+        dat_index = SwissProtIndex.SwissProtIndex(args.uniprot_dat, verbose=args.verbose)
+        lengths = Shards.sequence_lengths(input_file.unique_ids, dat_index=dat_index)
+        dat_index.close()
+    elif not args.no_cache:
+        cache = RecordCache.RecordCache(args.cache_dir, ttl=args.cache_ttl, max_size=args.cache_size)
+        lengths = Shards.sequence_lengths(input_file.unique_ids, cache=cache)
+        cache.close()
+
+    default_length = Shards.DEFAULT_SEQUENCE_LENGTH
+    if lengths:
+        default_length = sorted(lengths.values())[len(lengths) // 2]
+    weights = {x: lengths.get(x, default_length) for x in input_file.unique_ids}
+    sys.stdout.write('Found sequence lengths for {} of {} protein(s).\n'.format(len(lengths), len(weights)))
+
+    n_shards = max(1, min(args.shards, len(weights)))
+    shard_dir = os.path.join(wd, Shards.SHARD_DIR)
+    for i, ids in enumerate(Shards.partition(weights, n_shards)):
+        os.makedirs(Shards.shard_wd(shard_dir, i), exist_ok=True)
+        Shards.write_shard_ids(Shards.shard_ids_fname(shard_dir, i), ids)
+        if args.verbose:
+            sys.stdout.write('\tShard {}: {} protein(s), {} residues\n'.format(i, len(ids), sum(weights[x] for x in ids)))
+
+    return n_shards
+
+
 def main():
 
     parser = argparse.ArgumentParser(prog='qsub_cimage_annotation', parents=[parent_parser.PARENT_PARSER],
@@ -41,6 +126,12 @@ def main():
     parser.add_argument('-t', '--walltime', default='12:00:00',
                         help='Walltime per job in the format hh:mm:ss. Default is 12:00:00.')
 
+    parser.add_argument('--shards', default=1, type=int,
+                        help='Number of jobs to split proteins between. If > 1, an array job with one task for '
+                             'each shard is submitted along with a job which merges the output once all the tasks '
+                             'finish. Proteins are split so each shard has about the same total sequence length. '
+                             'Default is 1.')
+
     parser.add_argument('-g', '--go', action='store_true', default=False,
                         help='Should job be submitted? If this flag is not supplied, program will be a dry run. '
                              '.pbs file will written but job will not be submitted.')
@@ -48,8 +139,9 @@ def main():
     args = parser.parse_args()
     parent_args = parent_parser.PARENT_PARSER.parse_known_args()[0]
 
-    # calc nThread
-    _nThread = args.ppn * 2
+    # split processors between UniProt requests and blastp
+    thread_plan = ThreadPlan.plan_threads(args.ppn, net_threads=args.net_threads,
+                                          blast_procs=args.blast_procs, blast_threads=args.blast_threads)
 
     # Manually check args
     n_arg_errors = 0
@@ -58,6 +150,9 @@ def main():
         error_message += '\n\tSpecified input file: {} does not exist on path:\n\t\t{}\n'.format(args.input_file,
                                                                                                  os.path.abspath(args.input_file))
         n_arg_errors += 1
+    if args.uniprot_dat is not None and not os.path.isfile(args.uniprot_dat):
+        error_message += '\n\tSpecified UniProt flat file: {} does not exist\n'.format(args.uniprot_dat)
+        n_arg_errors += 1
     if args.align and args.database_dir is None:
         error_message += '\n\t--database_dir must be specified when --align is set\n'
         n_arg_errors += 1
@@ -66,16 +161,41 @@ def main():
         return -1
 
     sys.stdout.write('\nRequested job with {} processor and {}gb of memory...\n'.format(args.ppn, args.mem))
+    sys.stdout.write('Using {} UniProt request thread(s), {} blastp process(es) and {} thread(s) per blastp process.\n'.format(
+                     thread_plan.net_threads, thread_plan.blast_procs, thread_plan.blast_threads))
     #get wd
     wd = os.path.dirname(os.path.abspath(args.input_file))
 
     cimage_annotation_args = {arg: getattr(args, arg) for arg in vars(parent_args)}
-    cimage_annotation_args['nThread'] = _nThread
+    cimage_annotation_args['nThread'] = args.ppn
+    cimage_annotation_args['net_threads'] = thread_plan.net_threads
+    cimage_annotation_args['blast_procs'] = thread_plan.blast_procs
+    cimage_annotation_args['blast_threads'] = thread_plan.blast_threads
     cimage_annotation_args['align'] = '' if args.align else None
     cimage_annotation_args['verbose'] = '' if args.verbose else None
     cimage_annotation_args['write_seq'] = '' if args.write_seq else None
     cimage_annotation_args['write_alignment_data'] = '' if args.write_alignment_data else None
     cimage_annotation_args['all_features'] = '' if args.all_features else None
+    cimage_annotation_args['no_cache'] = '' if args.no_cache else None
+    cimage_annotation_args['resume'] = '' if args.resume else None
+
+    if args.shards > 1:
+        n_shards = makeShards(args, wd)
+        sys.stdout.write('Split proteins into {} shard(s).\n'.format(n_shards))
+
+        # each task writes output files in its own directory
+        cimage_annotation_args['ofname'] = os.path.basename(args.ofname)
+        cimage_annotation_args['input_file'] = os.path.abspath(args.input_file)
+        arrayName = makeArrayPBS(args.mem, args.ppn, args.walltime, wd, n_shards, cimage_annotation_args)
+        mergeName = makeMergePBS(args.mem, args.walltime, wd, n_shards, args.ofname,
+                                 'id' if args.file_type == 'cimage' else args.id_col)
+        if args.verbose:
+            sys.stdout.write('qsub {}\nqsub -W depend=afterokarray:<array_job_id> {}\n'.format(arrayName, mergeName))
+        if args.go:
+            job_id = subprocess.check_output(['qsub', arrayName], cwd=wd).decode('utf-8').strip()
+            sys.stdout.write('Submitted array job {}\n'.format(job_id))
+            subprocess.check_call(['qsub', '-W', 'depend=afterokarray:{}'.format(job_id), mergeName], cwd=wd)
+        return
 
     pbsName = makePBS(args.mem, args.ppn, args.walltime, wd, cimage_annotation_args)
     command = 'qsub {}'.format(pbsName)
@@ -0,0 +1,180 @@
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+
+from .RecordCache import DEFAULT_CACHE_DIR
+
+CACHE_FNAME = 'blast_alignments.sqlite'
+
+
+def alignment_key(sequence, organism, params, db_fingerprint):
+    '''
+    Content address of an alignment.
+
+    Parameters
+    ----------
+    sequence: str
+        Query sequence.
+    organism: str
+        Organism database the sequence was aligned to.
+    params: str
+        Description of search parameters. See Blast.search_params.
+    db_fingerprint: str
+        Fingerprint of the database files. See Blast.database_fingerprint.
+
+    Returns
+    -------
+    key: str
+        Hex digest.
+    '''
+
+    h = hashlib.sha256()
+    for x in (sequence, organism, params, db_fingerprint):
+        h.update(x.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class AlignmentCache():
+    '''
+    Persistent on-disk store of BLAST results for single query sequences.
+
+    Results are stored compressed in a SQLite database keyed by alignment_key, so
+    a cached result is only used if the query sequence, organism, search parameters
+    and database files are all unchanged. The least recently used results are evicted
+    when the cache grows past `max_size`.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory containing cache database. Created if it does not exist.
+    max_size: float
+        Maximum size of cached results in MB. If None or <= 0, the cache is not size limited.
+
+    Examples
+    --------
+    >>> cache = AlignmentCache('~/.cache/cimage_annotation')
+    >>> key = alignment_key(seq, 'human', Blast.search_params(), Blast.database_fingerprint('human', db_dir))
+    >>> cache.put(key, raw_xml)
+    >>> cache.get_many([key])[key] == raw_xml
+    True
+    '''
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=4096):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size = None if max_size is None or max_size <= 0 else int(max_size * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.fname = os.path.join(self.cache_dir, CACHE_FNAME)
+        self._conn = sqlite3.connect(self.fname, timeout=60)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS alignments (
+                              key TEXT PRIMARY KEY,
+                              data BLOB NOT NULL,
+                              accessed REAL NOT NULL,
+                              size INTEGER NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS alignments_accessed ON alignments (accessed)')
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM alignments').fetchone()[0]
+
+    def __contains__(self, key):
+        return self._conn.execute('SELECT 1 FROM alignments WHERE key = ?', (key,)).fetchone() is not None
+
+    def get_many(self, keys, count=True):
+        '''
+        Get cached results for all entries in `keys`.
+
+        Parameters
+        ----------
+        keys: list like
+            Keys created with alignment_key.
+        count: bool
+            Should the lookups be added to the hit/miss counts?
+
+        Returns
+        -------
+        results: dict
+            Key value pairs of keys and BLAST output text for keys which were found.
+        '''
+
+        _keys = list(set(keys))
+        now = time.time()
+        ret = dict()
+        for i in range(0, len(_keys), 500):
+            chunk = _keys[i:i + 500]
+            query = 'SELECT key, data FROM alignments WHERE key IN ({})'.format(','.join('?' * len(chunk)))
+            for key, data in self._conn.execute(query, chunk):
+                ret[key] = zlib.decompress(data).decode('utf-8')
+
+        if ret:
+            self._conn.executemany('UPDATE alignments SET accessed = ? WHERE key = ?',
+                                   [(now, k) for k in ret.keys()])
+            self._conn.commit()
+
+        if count:
+            self.hits += len(ret)
+            self.misses += len(_keys) - len(ret)
+        return ret
+
+    def put(self, key, text):
+        ''' Add result to cache. '''
+        self.put_many({key: text})
+
+    def put_many(self, results):
+        '''
+        Add results to cache and evict least recently used results if the cache is too large.
+
+        Parameters
+        ----------
+        results: dict
+            Key value pairs of keys and BLAST output text.
+        '''
+
+        if not results:
+            return
+        now = time.time()
+        rows = list()
+        for k, v in results.items():
+            data = zlib.compress(v.encode('utf-8'))
+            rows.append((k, data, now, len(data)))
+        self._conn.executemany('INSERT OR REPLACE INTO alignments (key, data, accessed, size) VALUES (?, ?, ?, ?)', rows)
+        self._conn.commit()
+        self.evict()
+
+    def size(self):
+        ''' Total size of cached results in bytes. '''
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM alignments').fetchone()[0]
+
+    def evict(self):
+        '''
+        Remove least recently used results until the cache is smaller than max_size.
+
+        Returns
+        -------
+        n_evicted: int
+            Number of results removed.
+        '''
+
+        n_evicted = 0
+        if self.max_size is not None:
+            excess = self.size() - self.max_size
+            if excess > 0:
+                remove = list()
+                for key, size in self._conn.execute('SELECT key, size FROM alignments ORDER BY accessed ASC'):
+                    if excess <= 0:
+                        break
+                    remove.append((key,))
+                    excess -= size
+                self._conn.executemany('DELETE FROM alignments WHERE key = ?', remove)
+                n_evicted += len(remove)
+                self._conn.commit()
+        return n_evicted
+
+    def close(self):
+        self._conn.close()
@@ -1,28 +1,57 @@
 
 import sys
+import io
 import re
+import json
 import xml.etree.ElementTree as ET
-from multiprocessing import Pool
+import numpy as np
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 from multiprocessing import cpu_count
 import functools
 from math import ceil
 from tqdm import tqdm
 
-from .Blast import blastp
+from .Blast import blastp, blastp_batch, search_params, database_fingerprint, BLASTP_EXE
+from .AlignmentCache import alignment_key
 
 # List of organisms for conservation analysis
 organism_list = ['human', 'mouse', 'fly', 'yeast', 'mustard', 'worms']
 
+# Format of results stored in AlignmentCache
+_CACHE_FORMAT = 'json-1'
+
+BlastResult = namedtuple('BlastResult', ['header', 'hits'])
+BlastResult.__doc__ = '''
+BLAST results for a single query.
+
+header: dict
+    Text of top level BlastOutput and Iteration elements.
+hits: list
+    (fields, hsps) tuple for each Hit. fields is a dict of Hit element text
+    and hsps is a list of dicts of element text for each Hsp.
+'''
+
+def _residue_mask(seq):
+    '''
+    int32 array which is 1 where characters in `seq` are letters and 0 elsewhere.
+    '''
+    codes = np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)
+    lower = codes | 0x20
+    return ((lower >= ord('a')) & (lower <= ord('z'))).astype(np.int32)
+
+
 class Alignment():
     '''
-    Read BLAST XML file and provide methods to access underlying alignment data.
+    Hold BLAST results for a single query and provide methods to access underlying alignment data.
+
+    Only the header and hits of the query are stored.
     '''
 
-    _XML_HEADER_ELEMENTS = {'query_length': './BlastOutput_iterations/Iteration/Iteration_query-len',
-                            'query_description': './BlastOutput_iterations/Iteration/Iteration_query-def',
-                            'query_id': './BlastOutput_iterations/Iteration/Iteration_query-ID'}
+    _HEADER_ELEMENTS = {'query_length': 'Iteration_query-len',
+                        'query_description': 'Iteration_query-def',
+                        'query_id': 'Iteration_query-ID'}
 
-    _XML_HITS_PATH = './BlastOutput_iterations/Iteration/Iteration_hits/Hit'
     _XML_HSP_PATH = 'Hit_hsps/Hsp/'
     _XML_QUERY_SEQ_NAME = 'Hsp_qseq'
     _XML_HIT_SEQ_NAME = 'Hsp_hseq'
@@ -44,14 +73,15 @@ class Alignment():
                            'match_length': 'Hit_hsps/Hsp/Hsp_align-len'}
 
 
-    def __init__(self, raw_xml, query_id=None, query_description=None, query_organism=None):
+    def __init__(self, result, query_id=None, query_description=None, query_organism=None):
         '''
         Default constructor
 
         Parameters
         ----------
-        raw_xml: str
-            BLAST XML file as text.
+        result: BlastResult or str
+            BLAST results for query from iterparse_blast or BLAST XML file as text.
+            If XML text has more than one query, only the first is used.
         query_id: str
             Acession of query.
         query_description: str
@@ -63,55 +93,41 @@ class Alignment():
         self.query_id = query_id
         self.query_description = query_description
         self.query_organism = query_organism
+        self._hsp = None
+        self._header = dict()
+        self._hits = list()
 
-        if raw_xml:
-            self._tree = ET.fromstring(raw_xml)
-            self._best_hit = self._tree.find(self._XML_HITS_PATH)
-            self._hsp = None
-            self._add_text_to_path('BlastOutput_iterations/Iteration/Iteration_query-ID',
-                                   self.query_id,
-                                   error_level=1 if self._VERBOSE else 0)
-            self._add_text_to_path('BlastOutput_iterations/Iteration/Iteration_query-def',
-                                   self.query_description,
-                                   error_level=1 if self._VERBOSE else 0)
-
-            if self._best_hit is None:
-                self._empty = True
-            else:
-                self._empty = False
-        else:
-            self._empty = True
+        if isinstance(result, str):
+            result = next((r for _, r in iterparse_blast(io.BytesIO(result.encode('utf-8')))), None)
 
+        if result is not None:
+            self._header = dict(result.header)
+            self._hits = result.hits
+            self._set_header('Iteration_query-ID', self.query_id)
+            self._set_header('Iteration_query-def', self.query_description)
 
-    def _add_text_to_path(self, path, text, error_level=0):
-        '''
-        Add path to element in self._tree
+        self._empty = len(self._hits) == 0
 
-        Parameters
-        ----------
-        path: str
-            Xpath to element
-        text: str
-            Test to add to element
-        error_level: int
-            Specify what to do if `path` does not exist.
-            0: do nothing, exit from function silently.
-            1: Print a warning and exit.
-            2: Raise an AttributeError.
-        '''
 
-        try:
-            self._tree.find(path).text = text
-        except AttributeError as e:
-            if error_level != 0:
-                sys.stderr.write('WARN: No element at path {}'.format(path))
-            if error_level != 1 or error_level != 0:
-                raise AttributeError(e)
+    def _set_header(self, tag, text):
+        if tag not in self._header:
+            if self._VERBOSE:
+                sys.stderr.write('WARN: No element at path {}'.format(tag))
+            return
+        self._header[tag] = text
 
 
-    def _get_hit_path_text(self, path):
-        temp = self._best_hit.find(path)
-        return None if temp is None else temp.text
+    @classmethod
+    def _hit_text(cls, hit, path, empty_value=None):
+        '''
+        Get text of element at `path` in hit. Paths in Hit_hsps refer to the first Hsp.
+        '''
+        fields, hsps = hit
+        if path.startswith(cls._XML_HSP_PATH):
+            if not hsps:
+                return empty_value
+            return hsps[0].get(path[len(cls._XML_HSP_PATH):], empty_value)
+        return fields.get(path, empty_value)
 
 
     def get_best_id(self):
@@ -124,7 +140,7 @@ class Alignment():
         '''
         if self._empty:
             return ''
-        return self._get_hit_path_text('./Hit_accession')
+        return self._hit_text(self._hits[0], 'Hit_accession')
 
 
     def get_best_description(self):
@@ -137,7 +153,7 @@ class Alignment():
         '''
         if self._empty:
             return ''
-        return self._get_hit_path_text('./Hit_def')
+        return self._hit_text(self._hits[0], 'Hit_def')
 
 
     def get_best_evalue(self):
@@ -150,23 +166,19 @@ class Alignment():
         '''
         if self._empty:
             return None
-        return float(self._get_hit_path_text('./Hit_hsps/Hsp/Hsp_evalue'))
+        return float(self._hit_text(self._hits[0], 'Hit_hsps/Hsp/Hsp_evalue'))
 
 
     def _populate_hsp(self):
-        self._hsp={x.tag: x.text for x in self._best_hit.findall(self._XML_HSP_PATH)}
-
-        self._hsp['hit_seq_map'] = list()
-        seq_index=0
-        for i, c in enumerate(self._hsp[self._XML_HIT_SEQ_NAME]):
-            self._hsp['hit_seq_map'].append(seq_index)
-            if re.match('[A-Za-z]', c):
-                seq_index += 1
+        self._hsp = dict()
+        for hsp in self._hits[0][1]:
+            self._hsp.update(hsp)
 
-        self._hsp['query_seq_map'] = list()
-        for i, c in enumerate(self._hsp[self._XML_QUERY_SEQ_NAME]):
-            if re.match('[A-Za-z]', c):
-                self._hsp['query_seq_map'].append(i)
+        # hit_seq_map is the number of hit residues before each alignment index
+        # and query_seq_map is the alignment index of each query residue
+        self._hsp['hit_mask'] = _residue_mask(self._hsp[self._XML_HIT_SEQ_NAME])
+        self._hsp['hit_seq_map'] = np.cumsum(self._hsp['hit_mask'], dtype=np.int32) - self._hsp['hit_mask']
+        self._hsp['query_seq_map'] = np.flatnonzero(_residue_mask(self._hsp[self._XML_QUERY_SEQ_NAME])).astype(np.int32)
 
         # make the things which need to be numbers, numbers
         for entry in ('Hsp_hit-to', 'Hsp_hit-from', 'Hsp_query-to', 'Hsp_query-from'):
@@ -195,7 +207,7 @@ class Alignment():
             return False
 
         align_index = pos - self._hsp['Hsp_query-from']
-        query_index = self._hsp['query_seq_map'][align_index]
+        query_index = int(self._hsp['query_seq_map'][align_index])
         if query_index == -1:
             return False
         query_residue = self._hsp[self._XML_QUERY_SEQ_NAME][query_index]
@@ -239,9 +251,9 @@ class Alignment():
         res_temp = self._hsp[self._XML_HIT_SEQ_NAME][align_index]
 
         # res_temp is gap, return None, None
-        if not re.match('[A-Za-z]', res_temp):
+        if not self._hsp['hit_mask'][align_index]:
             return None, None
-        pos_temp = self._hsp['hit_seq_map'][align_index] + self._hsp['Hsp_hit-from']
+        pos_temp = int(self._hsp['hit_seq_map'][align_index]) + self._hsp['Hsp_hit-from']
 
         return res_temp, pos_temp
 
@@ -251,9 +263,33 @@ class Alignment():
         out.write('{}\t{}\t{}\n'.format(tag, name, value))
 
 
-    @staticmethod
-    def _search_path_text(result, empty_value = ''):
-        return empty_value if result is None else result.text
+    def _to_element(self):
+        '''
+        Build BLAST XML tree from stored data.
+        '''
+
+        root = ET.Element('BlastOutput')
+        for tag, text in self._header.items():
+            if not tag.startswith('Iteration_'):
+                ET.SubElement(root, tag).text = text
+        iteration = ET.SubElement(ET.SubElement(root, 'BlastOutput_iterations'), 'Iteration')
+        for tag, text in self._header.items():
+            if tag.startswith('Iteration_') and tag != 'Iteration_message':
+                ET.SubElement(iteration, tag).text = text
+
+        hits = ET.SubElement(iteration, 'Iteration_hits')
+        for fields, hsps in self._hits:
+            hit = ET.SubElement(hits, 'Hit')
+            for tag, text in fields.items():
+                ET.SubElement(hit, tag).text = text
+            hit_hsps = ET.SubElement(hit, 'Hit_hsps')
+            for hsp in hsps:
+                hsp_element = ET.SubElement(hit_hsps, 'Hsp')
+                for tag, text in hsp.items():
+                    ET.SubElement(hsp_element, tag).text = text
+        if 'Iteration_message' in self._header:
+            ET.SubElement(iteration, 'Iteration_message').text = self._header['Iteration_message']
+        return root
 
 
     def write(self, fname, file_format='txt', mode='w'):
@@ -282,26 +318,26 @@ class Alignment():
         with open(fname, mode) as outF:
             if file_format == 'txt':
                 # print header
-                for name, path in self._XML_HEADER_ELEMENTS.items():
-                    text = self._search_path_text(self._tree.find(path))
+                for name, path in self._HEADER_ELEMENTS.items():
+                    text = self._header.get(path, '')
                     if text == '' and self._VERBOSE:
                         sys.stderr.write('WARN: No element at path {}'.format(path))
                     self._write_element(outF, 'H', name, text)
 
                 # print hits
-                for hit in self._tree.findall(self._XML_HITS_PATH):
+                for hit in self._hits:
                     outF.write('\n')
                     # print hit header
                     for name, path in self._XML_MATCH_ELEMENTS.items():
-                        text = self._search_path_text(hit.find(path))
+                        text = self._hit_text(hit, path, '')
                         if text == '' and self._VERBOSE:
                             sys.stderr.write('WARN: No element at path {}'.format(path))
                         self._write_element(outF, 'M', name, text)
 
                     # print alignment data
-                    hit_seq = self._search_path_text(hit.find(self._XML_HIT_SEQ_PATH))
-                    query_seq = self._search_path_text(hit.find(self._XML_QUERY_SEQ_PATH))
-                    midline_seq = self._search_path_text(hit.find(self._XML_MIDLINE_SEQ_PATH))
+                    hit_seq = self._hit_text(hit, self._XML_HIT_SEQ_PATH, '')
+                    query_seq = self._hit_text(hit, self._XML_QUERY_SEQ_PATH, '')
+                    midline_seq = self._hit_text(hit, self._XML_MIDLINE_SEQ_PATH, '')
                     max_name_len = max([len(x) for x in [self._XML_HIT_SEQ_NAME, self._XML_QUERY_SEQ_NAME, self._XML_MIDLINE_SEQ_NAME]])
                     length = len(query_seq)
                     n_lines = ceil(length / self._ALIGNMENT_LINE_LENGTH)
@@ -324,62 +360,516 @@ class Alignment():
                         outF.write('\n')
 
             elif file_format == 'xml':
-                outF.write(ET.totexting(self._tree, encoding = 'unicode'))
+                outF.write(ET.tostring(self._to_element(), encoding = 'unicode'))
                 if mode == 'a':
                     outF.write('\n')
             else:
                 raise RuntimeError('{} is an unknown file_format!'.format(file_format))
 
 
-def _blastp_worker(search_item, db=None, verbose=False):
+# BlastOutput header elements which describe the first query of a blastp process,
+# and the Iteration element with the same value for each query
+_QUERY_HEADER_KEYS = {'BlastOutput_query-ID': 'Iteration_query-ID',
+                      'BlastOutput_query-def': 'Iteration_query-def',
+                      'BlastOutput_query-len': 'Iteration_query-len'}
+
+
+def _query_header(blast_header, iteration_header):
+    '''
+    Combine the BlastOutput and Iteration header elements of one query.
+
+    When several queries are aligned by one blastp process, the BlastOutput_query-*
+    elements describe the first query. They are replaced by the values for this query
+    (or left out if there is no matching Iteration element), so each result has the
+    header blastp writes when the query is aligned on its own.
+    '''
+    header = dict()
+    for tag, text in blast_header.items():
+        if tag.startswith('BlastOutput_query-'):
+            iteration_tag = _QUERY_HEADER_KEYS.get(tag)
+            if iteration_tag not in iteration_header:
+                continue
+            text = iteration_header[iteration_tag]
+        header[tag] = text
+    header.update(iteration_header)
+    return header
+
+
+def iterparse_blast(source):
+    '''
+    Incrementally parse BLAST XML output.
+
+    Elements are discarded as soon as the data for each hit has been extracted,
+    so memory use does not grow with the size of the output.
+
+    Parameters
+    ----------
+    source: str or file object
+        File name or binary file object (such as the stdout pipe of a blastp process).
+
+    Yields
+    ------
+    query_def, result: str, BlastResult
+        Iteration_query-def and results for each query in `source`.
+        Parsing stops at the last complete query if the output is truncated.
+    '''
+
+    blast_header = dict()
+    iteration_header = dict()
+    hits = list()
+    hsps = list()
+    stack = list()
+    try:
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                continue
+            stack.pop()
+            parent = stack[-1].tag if stack else None
+            if elem.tag == 'Hsp':
+                hsps.append({x.tag: x.text for x in elem})
+            elif elem.tag == 'Hit':
+                hits.append(({x.tag: x.text for x in elem if x.tag != 'Hit_hsps'}, hsps))
+                hsps = list()
+                stack[-1].clear()
+            elif elem.tag == 'Iteration':
+                header = _query_header(blast_header, iteration_header)
+                yield iteration_header.get('Iteration_query-def'), BlastResult(header, hits)
+                iteration_header = dict()
+                hits = list()
+                stack[-1].clear()
+            elif elem.tag in ('Iteration_hits', 'BlastOutput_iterations') or len(elem):
+                continue
+            elif parent == 'Iteration':
+                iteration_header[elem.tag] = elem.text
+            elif parent == 'BlastOutput':
+                blast_header[elem.tag] = elem.text
+    except ET.ParseError:
+        # blastp did not finish writing the output
+        return
+
+
+def read_blast(source):
+    '''
+    Parse BLAST XML output.
+
+    Returns
+    -------
+    results: list
+        (query_def, BlastResult) tuple for each query in `source`.
+    '''
+    return list(iterparse_blast(source))
+
+
+# Keys of single file BLAST JSON output and the corresponding BLAST XML elements
+_JSON_REPORT_KEYS = [('program', 'BlastOutput_program'),
+                     ('version', 'BlastOutput_version'),
+                     ('reference', 'BlastOutput_reference')]
+_JSON_HSP_KEYS = [('num', 'Hsp_num'),
+                  ('bit_score', 'Hsp_bit-score'),
+                  ('score', 'Hsp_score'),
+                  ('evalue', 'Hsp_evalue'),
+                  ('query_from', 'Hsp_query-from'),
+                  ('query_to', 'Hsp_query-to'),
+                  ('hit_from', 'Hsp_hit-from'),
+                  ('hit_to', 'Hsp_hit-to'),
+                  ('identity', 'Hsp_identity'),
+                  ('positive', 'Hsp_positive'),
+                  ('gaps', 'Hsp_gaps'),
+                  ('align_len', 'Hsp_align-len'),
+                  ('qseq', 'Hsp_qseq'),
+                  ('hseq', 'Hsp_hseq'),
+                  ('midline', 'Hsp_midline')]
+
+
+def iterparse_json(source):
+    '''
+    Parse single file BLAST JSON output (blastp -outfmt 15).
+
+    Results are converted to the same header and hit data as iterparse_blast.
+    Numbers are kept as the text blastp wrote, so e-values are the same as in XML output.
+
+    Parameters
+    ----------
+    source: str or file object
+        JSON text or text or binary file object (such as the stdout pipe of a blastp process).
+
+    Yields
+    ------
+    query_def, result: str, BlastResult
+        query_title and results for each query in `source`.
+        Nothing is yielded if the output is truncated.
+    '''
+
+    if not isinstance(source, (str, bytes)):
+        source = source.read()
+    try:
+        reports = json.loads(source, parse_float=str, parse_int=str)['BlastOutput2']
+    except (ValueError, KeyError, TypeError):
+        # blastp did not finish writing the output
+        return
+
+    for i, item in enumerate(reports):
+        report = item['report']
+        search = report['results']['search']
+        header = {tag: report[key] for key, tag in _JSON_REPORT_KEYS if key in report}
+        header['BlastOutput_db'] = report.get('search_target', dict()).get('db', '')
+        header['Iteration_iter-num'] = str(i + 1)
+        header['Iteration_query-ID'] = search.get('query_id', '')
+        header['Iteration_query-def'] = search.get('query_title', '')
+        header['Iteration_query-len'] = search.get('query_len', '')
+        if 'message' in search:
+            header['Iteration_message'] = search['message']
+
+        hits = list()
+        for hit in search.get('hits', []):
+            descriptions = hit['description']
+            fields = {'Hit_num': hit['num'],
+                      'Hit_id': descriptions[0]['id'],
+                      'Hit_def': ' >'.join([descriptions[0].get('title', '')] +
+                                           ['{} {}'.format(x['id'], x.get('title', '')) for x in descriptions[1:]]),
+                      'Hit_accession': descriptions[0].get('accession', ''),
+                      'Hit_len': hit['len']}
+            hsps = [{tag: hsp[key] for key, tag in _JSON_HSP_KEYS if key in hsp} for hsp in hit['hsps']]
+            hits.append((fields, hsps))
+        yield header['Iteration_query-def'], BlastResult(header, hits)
+
+
+def read_json(source):
+    '''
+    Parse single file BLAST JSON output.
+
+    Returns
+    -------
+    results: list
+        (query_def, BlastResult) tuple for each query in `source`.
+    '''
+    return list(iterparse_json(source))
+
+
+_READERS = {'xml': read_blast, 'json': read_json}
+
+
+def _dump_result(result):
+    return json.dumps(result, separators=(',', ':'))
+
+
+def _load_result(text):
+    header, hits = json.loads(text)
+    return BlastResult(header, [(fields, hsps) for fields, hsps in hits])
+
+
+def _blastp_worker(search_item, db=None, verbose=False, num_threads=1, output_format='xml', exe=BLASTP_EXE, env=None):
     query = search_item[3]
-    return_code, dat = blastp(search_item[1], db, query, verbose = verbose)
-    return dat
+    return_code, results = blastp(search_item[1], db, query, verbose = verbose, num_threads=num_threads,
+                                  parser=_READERS[output_format], output_format=output_format,
+                                  exe=exe, env=env)
+    if results:
+        return results[0][1]
+    return None
 
 
-def align_all(unique_ids, sequences, db_path, organisms, nThread=None, show_bar=True, verbose=False):
+def _blastp_batch_worker(chunk, db=None, verbose=False, num_threads=1, output_format='xml', exe=BLASTP_EXE, env=None):
+    '''
+    Align a chunk of (id, organism, description, sequence) tuples which all have the same organism.
+
+    Queries are named by their index in `chunk`.
+    Queries with an empty sequence are not sent to blastp.
+    '''
+    queries = [(str(i), x[3]) for i, x in enumerate(chunk) if x[3]]
+    if not queries:
+        return dict()
+    return_code, results = blastp_batch(chunk[0][1], db, queries, verbose=verbose, num_threads=num_threads,
+                                        parser=_READERS[output_format], output_format=output_format,
+                                        exe=exe, env=env)
+    return dict(results)
+
+
+def _indexed_blastp_worker(indexed_item, **kwargs):
+    ''' Call _blastp_worker on an (index, search_item) tuple and return (index, result). '''
+    return indexed_item[0], _blastp_worker(indexed_item[1], **kwargs)
+
+
+def _make_chunks(search_list, chunk_size):
+    '''
+    Group search_list by organism and split each group into chunks of at most `chunk_size` queries.
+
+    Returns
+    -------
+    chunks: list
+        Lists of (index, search_item) tuples.
+    '''
+    by_organism = dict()
+    for i, it in enumerate(search_list):
+        by_organism.setdefault(it[1], list()).append((i, it))
+    ret = list()
+    for items in by_organism.values():
+        for i in range(0, len(items), chunk_size):
+            ret.append(items[i:i + chunk_size])
+    return ret
+
+
+def _batch_worker(indexed_chunk, verbose=False, **kwargs):
+    '''
+    Call _blastp_batch_worker on a chunk of (index, search_item) tuples.
+
+    Returns
+    -------
+    results: list
+        (index, BlastResult or None) tuple for each item in `indexed_chunk`.
+    '''
+    chunk = [x[1] for x in indexed_chunk]
+    dat = _blastp_batch_worker(chunk, verbose=verbose, **kwargs)
+    ret = list()
+    for i, (index, it) in enumerate(indexed_chunk):
+        result = dat.get(str(i))
+        if result is None and it[3] and verbose:
+            sys.stderr.write('WARN: No BLAST output for {} in {} database\n'.format(it[0], it[1]))
+        ret.append((index, result))
+    return ret
+
+
+def blast_task(payload):
+    '''
+    Align a chunk of queries for a WorkQueue task.
+
+    Parameters
+    ----------
+    payload: dict
+        'chunk' is a list of [index, search_item] lists which all have the same organism.
+        'blast_args' are keyword arguments for _blastp_worker.
+
+    Returns
+    -------
+    results: list
+        [index, serialized BlastResult or None] list for each query in the chunk.
+    '''
+    chunk = [(i, tuple(it)) for i, it in payload['chunk']]
+    if len(chunk) > 1:
+        results = _batch_worker(chunk, **payload['blast_args'])
+    else:
+        results = [_indexed_blastp_worker(chunk[0], **payload['blast_args'])]
+    return [[i, None if r is None else _dump_result(r)] for i, r in results]
+
+
+def _iter_searches(search_list, nThread, chunk_size, show_bar, blast_args, queue=None):
+    '''
+    Align search_list and yield results in the order the searches finish.
+
+    blast_args are keyword arguments for _blastp_worker.
+    If `queue` is not None, the searches are performed by worker processes.
+
+    Yields
+    ------
+    result: tuple
+        (index, BlastResult or None) tuple for each item in search_list.
+    '''
+
+    if queue is not None:
+        sys.stdout.write('Waiting for workers to perform alignments from {}...\n'.format(queue.queue_dir))
+        payloads = [{'chunk': chunk, 'blast_args': blast_args} for chunk in _make_chunks(search_list, max(1, chunk_size))]
+        with tqdm(total=len(search_list), miniters=1, file=sys.stdout, disable=not show_bar) as pbar:
+            for _, results in queue.map('blast', payloads):
+                pbar.update(len(results))
+                for i, text in results:
+                    yield i, None if text is None else _load_result(text)
+        return
+
+    if chunk_size > 1:
+        # Make sure there are enough chunks to keep every thread busy
+        chunk_size = max(1, min(chunk_size, ceil(len(search_list) / nThread)))
+        jobs = _make_chunks(search_list, chunk_size)
+        worker = functools.partial(_batch_worker, **blast_args)
+    else:
+        jobs = list(enumerate(search_list))
+        worker = functools.partial(_indexed_blastp_worker, **blast_args)
+
+    if show_bar:
+        with ThreadPool(processes=nThread) as pool:
+            with tqdm(total=len(search_list), miniters=1, file=sys.stdout) as pbar:
+                for dat in pool.imap_unordered(worker, jobs):
+                    dat = dat if chunk_size > 1 else [dat]
+                    pbar.update(len(dat))
+                    yield from dat
+    else:
+        length = len(jobs)
+        for i, job in enumerate(jobs):
+            sys.stdout.write('Working on {} of {}'.format(i, length))
+            dat = worker(job)
+            yield from (dat if chunk_size > 1 else [dat])
+
+
+def iter_alignments(unique_ids, sequences, db_path, organisms, nThread=None, show_bar=True, verbose=False, chunk_size=1,
+                    blast_threads=1, cache=None, output_format='xml', blastp_exe=BLASTP_EXE, blast_env=None,
+                    journal=None, queue=None):
+    '''
+    Align protein sequences to each organism database and yield the alignments for each
+    protein as soon as the protein has been aligned to every organism.
+
+    Proteins are yielded in the order their alignments finish, so the order is
+    not deterministic when alignments are performed in parallel.
+    Results are not kept after the alignments for a protein are yielded.
+
+    Parameters
+    ----------
+    unique_ids: list
+        Protein IDs to align.
+    sequences: dict
+        Key value pairs of protein IDs and (description, sequence) tuples.
+    db_path: str
+        Path to directory containing sequence databases.
+    organisms: list
+        Organisms to align each protein to.
+    nThread: int
+        Number of blastp processes to run in parallel.
+    show_bar: bool
+        Show progress bar?
+    verbose: bool
+        Verbose output?
+    chunk_size: int
+        Maximum number of queries sent to each blastp process.
+        If 1, a separate blastp process is used for each protein and organism.
+    blast_threads: int
+        Number of threads used by each blastp process.
+    cache: AlignmentCache.AlignmentCache
+        Persistent alignment cache. If not None, only sequences which are not
+        in the cache are aligned and new results are added to the cache.
+    output_format: str
+        blastp output format. One of Blast.OUTPUT_FORMATS.
+    blastp_exe: str
+        Name of or path to blastp executable.
+    blast_env: dict
+        Additional environment variables for blastp.
+    journal: Journal.Journal
+        Run journal. If not None, alignments recorded in the journal are not repeated
+        and each new alignment is recorded as soon as it finishes.
+    queue: WorkQueue.WorkQueue
+        Shared work queue. If not None, alignments are performed by worker processes
+        (cimage_annotation worker) instead of in this process.
+
+    Yields
+    ------
+    alignments: tuple
+        (protein_id, alignments) tuple for each protein in `unique_ids`, where
+        alignments is a dict of organisms and Alignment objects.
+    '''
+
+    Alignment._VERBOSE = verbose
 
     #construct list to pass to blastp worker
     search_list = list()
+    protein_indices = dict()
     for id in unique_ids:
+        protein_indices[id] = list()
         for o in organisms:
             # search_list is tuple of (id, organisms, description, sequence)
+            protein_indices[id].append(len(search_list))
             search_list.append((id, o, sequences[id][0], sequences[id][1]))
+    results = [None for _ in search_list]
+    remaining = {id: len(indices) for id, indices in protein_indices.items()}
+
+    def _finish(id):
+        ret = dict()
+        for i in protein_indices.pop(id):
+            sl = search_list[i]
+            ret[sl[1]] = Alignment(results[i], query_id=sl[0],
+                                   query_description=sl[2],
+                                   query_organism=sl[1])
+            results[i] = None
+        return id, ret
+
+    # look up cached results and align each missing sequence once
+    keys = [None for _ in search_list]
+    align_indices = list(range(len(search_list)))
+    waiting = dict()
+    if cache is not None or journal is not None:
+        params = '{} {}'.format(search_params(output_format), _CACHE_FORMAT)
+        fingerprints = {o: database_fingerprint(o, db_path) for o in organisms}
+        keys = [None if not x[3] else alignment_key(x[3], x[1], params, fingerprints[x[1]]) for x in search_list]
+        cached = dict()
+        if journal is not None:
+            cached = {k: journal.alignments[k] for k in keys if k in journal.alignments}
+        n_journal = len(cached)
+        if cache is not None:
+            cached.update(cache.get_many([k for k in keys if k is not None and k not in cached]))
+        align_indices = list()
+        for i, k in enumerate(keys):
+            if k in cached:
+                results[i] = _load_result(cached[k])
+                remaining[search_list[i][0]] -= 1
+            elif k is None or k not in waiting:
+                align_indices.append(i)
+                if k is not None:
+                    waiting[k] = list()
+            else:
+                # duplicate sequence, filled in when the first copy is aligned
+                waiting[k].append(i)
+        if cache is not None:
+            sys.stdout.write('BLAST cache: {} hit(s), {} miss(es)\n'.format(len(cached) - n_journal, len(waiting)))
+        del cached
+
+    for id in [id for id, n in remaining.items() if n == 0]:
+        yield _finish(id)
+
+    if not align_indices:
+        return
+
+    align_list = [search_list[i] for i in align_indices]
 
     #calculate number of threads required
     _nThread = int(1)
-    listLen = len(search_list)
+    listLen = len(align_list)
     cpuCount = cpu_count()
     if nThread is None:
         _nThread = cpuCount if cpuCount < listLen else listLen
     else:
         _nThread = nThread
 
-    sys.stdout.write('Performing alignment with {} thread(s)...\n'.format(_nThread))
-    results = list()
-    if show_bar:
-        with Pool(processes=_nThread) as pool:
-            results = list(tqdm(pool.imap(functools.partial(_blastp_worker, db=db_path, verbose=verbose),
-                                          search_list),
-                                          total=listLen,
-                                          miniters=1,
-                                          file=sys.stdout))
-    else:
-        length = len(search_list)
-        for i, it in enumerate(search_list):
-            sys.stdout.write('Working on {} of {}'.format(i, length))
-            results.append(_blastp_worker(it, db=db_path, verbose=verbose))
-
-    assert len(search_list) == len(results)
+    blast_args = dict(db=db_path, verbose=verbose, num_threads=blast_threads,
+                      output_format=output_format, exe=blastp_exe, env=blast_env)
+    new_results = dict()
+    if queue is None:
+        sys.stdout.write('Performing alignment with {} process(es) and {} blastp thread(s) each...\n'.format(_nThread, blast_threads))
+    for j, r in _iter_searches(align_list, _nThread, chunk_size, show_bar, blast_args, queue=queue):
+        i = align_indices[j]
+        done = [i]
+        results[i] = r
+        if keys[i] is not None:
+            dependents = waiting.pop(keys[i])
+            # don't cache failed searches
+            if r is not None:
+                text = _dump_result(r)
+                new_results[keys[i]] = text
+                if journal is not None:
+                    journal.add_alignment(keys[i], search_list[i][0], search_list[i][1], text)
+                for d in dependents:
+                    results[d] = _load_result(text)
+            done += dependents
+            if cache is not None and len(new_results) >= 100:
+                cache.put_many(new_results)
+                new_results = dict()
+
+        for d in done:
+            id = search_list[d][0]
+            remaining[id] -= 1
+            if remaining[id] == 0:
+                yield _finish(id)
+
+    if cache is not None:
+        cache.put_many(new_results)
+
+
+def align_all(unique_ids, sequences, db_path, organisms, **kwargs):
+    '''
+    Align protein sequences to each organism database.
 
-    ret = dict()
-    Alignment._VERBOSE = verbose
-    for sl, r in zip(search_list, results):
-        if sl[0] not in ret:
-            ret[sl[0]] = dict()
-        ret[sl[0]][sl[1]] = Alignment(r, query_id=sl[0],
-                                      query_description=sl[2],
-                                      query_organism=sl[1])
+    Takes the same arguments as iter_alignments.
 
-    return ret
+    Returns
+    -------
+    alignments: dict
+        Alignment objects in a nested dict of protein IDs and organisms.
+    '''
 
+    alignments = dict(iter_alignments(unique_ids, sequences, db_path, organisms, **kwargs))
+    return {id: alignments[id] for id in unique_ids}
@@ -0,0 +1,279 @@
+
+import sys
+import ssl
+import asyncio
+from urllib.parse import urlsplit, urljoin
+
+from .Retry import RetryScheduler, Throttled
+
+UNIPROT_URL = 'https://rest.uniprot.org/uniprotkb/{}.txt'
+USER_AGENT = 'cimage_annotation'
+
+def _run(coro):
+    '''
+    Run coroutine in a new event loop and close the loop.
+    Same as asyncio.run, which requires python >= 3.7.
+    '''
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            all_tasks = asyncio.all_tasks if hasattr(asyncio, 'all_tasks') else asyncio.Task.all_tasks
+            pending = [t for t in all_tasks(loop) if not t.done()]
+            for t in pending:
+                t.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+class HTTPStatusError(OSError):
+    def __init__(self, status, headers):
+        super().__init__('HTTP status {}'.format(status))
+        self.status = status
+        self.headers = headers
+
+
+class _Connection():
+    '''
+    Persistent HTTP/1.1 connection to a single host.
+
+    The connection is opened lazily and reused for consecutive requests
+    as long as the server keeps it alive.
+    '''
+
+    def __init__(self, scheme, host, port):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    def _is_open(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def _open(self):
+        _ssl = ssl.create_default_context() if self.scheme == 'https' else None
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=_ssl)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+
+    async def _read_headers(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise ConnectionError('Invalid HTTP status line: {}'.format(status_line)) from None
+        headers = dict()
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, value = line.decode('latin-1').split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+        return status, headers
+
+    async def _read_body(self, headers):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = list()
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0].strip(), 16)
+                if size == 0:
+                    # consume trailers
+                    while (await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            return b''.join(chunks)
+        if 'content-length' in headers:
+            return await self._reader.readexactly(int(headers['content-length']))
+        body = await self._reader.read()
+        self.close()
+        return body
+
+    async def get(self, path):
+        '''
+        Make GET request for `path`.
+
+        Returns
+        -------
+        status, headers, body: int, dict, bytes
+        '''
+
+        reused = self._is_open()
+        if not reused:
+            await self._open()
+        request = ('GET {} HTTP/1.1\r\n'
+                   'Host: {}\r\n'
+                   'User-Agent: {}\r\n'
+                   'Accept-Encoding: identity\r\n'
+                   'Connection: keep-alive\r\n\r\n').format(path, self.host, USER_AGENT)
+        try:
+            self._writer.write(request.encode('ascii'))
+            await self._writer.drain()
+            status, headers = await self._read_headers()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            self.close()
+            if not reused:
+                raise
+            # The server closed an idle keep-alive connection. Retry on a new one.
+            return await self.get(path)
+
+        body = await self._read_body(headers)
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, headers, body
+
+
+class AsyncFetcher():
+    '''
+    Fetch UniProt flat file records with a bounded number of concurrent keep-alive connections.
+
+    Parameters
+    ----------
+    url: str
+        URL template with a {} placeholder for the UniProt accession.
+    max_in_flight: int
+        Maximum number of concurrent requests (and open connections).
+    scheduler: Retry.RetryScheduler
+        Scheduler used to retry failed requests. If None, a scheduler with the default settings is used.
+        If the server throttles requests, the number of concurrent requests is lowered
+        to the scheduler's current limit.
+    verbose: bool
+        Verbose output?
+
+    Examples
+    --------
+    >>> fetcher = AsyncFetcher(max_in_flight=16)
+    >>> raw = fetcher.fetch_all(['P26641', 'Q9NTZ6'])
+    >>> ok, text = raw['P26641']
+    '''
+
+    _THROTTLE_POLL = 0.5
+
+    def __init__(self, url=UNIPROT_URL, max_in_flight=16, scheduler=None, verbose=False):
+        self.url = url
+        self.max_in_flight = max(1, max_in_flight)
+        self.scheduler = RetryScheduler(verbose=verbose) if scheduler is None else scheduler
+        self.scheduler.set_concurrency(self.max_in_flight)
+        self.verbose = verbose
+
+    @staticmethod
+    def _split_url(url):
+        parts = urlsplit(url)
+        port = parts.port if parts.port is not None else (443 if parts.scheme == 'https' else 80)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        return parts.scheme, parts.hostname, port, path
+
+    async def _request(self, conn, uniprot_id):
+        url = self.url.format(uniprot_id)
+        try:
+            for _ in range(5):
+                scheme, host, port, path = self._split_url(url)
+                if (scheme, host, port) == (conn.scheme, conn.host, conn.port):
+                    status, headers, body = await conn.get(path)
+                else:
+                    # redirect to another host
+                    other = _Connection(scheme, host, port)
+                    try:
+                        status, headers, body = await other.get(path)
+                    finally:
+                        other.close()
+                if status in (301, 302, 303, 307, 308) and 'location' in headers:
+                    # Location can be relative to the request URL
+                    url = urljoin(url, headers['location'])
+                    continue
+                if status in (400, 404):
+                    return None
+                if status in (429, 503):
+                    raise Throttled(headers.get('retry-after'))
+                if status != 200:
+                    raise HTTPStatusError(status, headers)
+                return body.decode('utf-8')
+            raise HTTPStatusError(status, headers)
+        except BaseException:
+            # The connection is in an unknown state if the request failed or was cancelled.
+            conn.close()
+            raise
+
+    async def _request_hedge(self, conn, uniprot_id):
+        other = _Connection(conn.scheme, conn.host, conn.port)
+        try:
+            return await self._request(other, uniprot_id)
+        finally:
+            other.close()
+
+    async def _fetch_one(self, conn, uniprot_id):
+        def _coro(hedge):
+            if hedge:
+                return self._request_hedge(conn, uniprot_id)
+            return self._request(conn, uniprot_id)
+
+        ok, raw = await self.scheduler.call_async(_coro, uniprot_id)
+        if ok and raw is None and self.verbose:
+            sys.stderr.write('No UniProt page found for {}\n'.format(uniprot_id))
+        return ok, raw
+
+    async def _worker(self, index, queue, callback):
+        scheme, host, port, _ = self._split_url(self.url)
+        conn = _Connection(scheme, host, port)
+        try:
+            while True:
+                # pause workers above the current limit while the server is throttling requests
+                while index >= self.scheduler.limiter.limit and not queue.empty():
+                    conn.close()
+                    await asyncio.sleep(self._THROTTLE_POLL)
+                try:
+                    uniprot_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                ok, raw = await self._fetch_one(conn, uniprot_id)
+                callback(uniprot_id, ok, raw)
+        finally:
+            conn.close()
+
+    async def _fetch_all(self, ids, callback):
+        queue = asyncio.Queue()
+        for uniprot_id in ids:
+            queue.put_nowait(uniprot_id)
+        n_workers = min(self.max_in_flight, queue.qsize())
+        await asyncio.gather(*[self._worker(i, queue, callback) for i in range(n_workers)])
+
+    def fetch_all(self, ids, callback=None):
+        '''
+        Fetch all records in `ids`.
+
+        Parameters
+        ----------
+        ids: list like
+            UniProt accessions to retrieve.
+        callback: callable
+            Function called with (uniprot_id, ok, raw) as each request completes.
+            If None, results are collected and returned.
+
+        Returns
+        -------
+        results: dict
+            If `callback` is None, key value pairs of IDs and (ok, raw) tuples.
+            ok is False if the request failed after all retries, and raw
+            is None if the accession does not exist. Otherwise, an empty dict.
+        '''
+
+        ret = dict()
+        if callback is None:
+            def callback(uniprot_id, ok, raw):
+                ret[uniprot_id] = (ok, raw)
+        if ids:
+            _run(self._fetch_all(list(ids), callback))
+        return ret
+
@@ -1,5 +1,10 @@
 
 import sys
+import os
+import glob
+import shlex
+import hashlib
+import threading
 import subprocess
 
 
@@ -10,28 +15,217 @@ DATABASES={'human':'human_nr_uniprot',
            'mustard':'mustard_nr_uniprot',
            'worms':'worms_nr_uniprot'}
 
+BLASTP_EXE = 'blastp'
+OUTFMT = 5
+JSON_OUTFMT = 15
+NUM_ALIGNMENTS = 5
 
-def blastp(organism, database_path, query, verbose=False):
+OUTPUT_FORMATS = ('xml', 'json')
 
+
+def _format_args(output_format):
+    '''
+    blastp arguments for `output_format`.
+    '''
+    if output_format == 'xml':
+        return ['-outfmt', str(OUTFMT), '-num_alignments', str(NUM_ALIGNMENTS)]
+    if output_format == 'json':
+        return ['-outfmt', str(JSON_OUTFMT), '-num_alignments', str(NUM_ALIGNMENTS)]
+    raise RuntimeError('{} is an unknown output_format!'.format(output_format))
+
+
+def search_params(output_format='xml'):
+    '''
+    String describing the blastp options which affect alignment results.
+    '''
+    return ' '.join(['blastp'] + _format_args(output_format))
+
+
+def database_fingerprint(organism, database_path):
+    '''
+    Fingerprint of the files in an organism database.
+
+    The fingerprint changes if any database file is added, removed, resized or modified,
+    or if the contents of the alias (.pal) file change.
+
+    Parameters
+    ----------
+    organism: str
+        Organism database. Must be a key in DATABASES.
+    database_path: str
+        Path to directory containing sequence databases.
+
+    Returns
+    -------
+    fingerprint: str
+        Hex digest.
+    '''
+
+    _db_path = os.path.abspath(os.path.join(database_path, DATABASES[organism]))
+    fnames = sorted(set(glob.glob(_db_path) + glob.glob(_db_path + '.*')))
+    h = hashlib.sha256(_db_path.encode('utf-8'))
+    for fname in fnames:
+        stat = os.stat(fname)
+        h.update('\0{}\0{}\0{}'.format(os.path.basename(fname), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+        if fname.endswith('.pal'):
+            with open(fname, 'rb') as inF:
+                h.update(inF.read())
+    return h.hexdigest()
+
+
+def _run(cmd, query=None, verbose=False, parser=None, env=None):
+    '''
+    Run blastp command.
+
+    Parameters
+    ----------
+    cmd: list
+        Command to run as a list of arguments.
+    query: bytes
+        Data to write to stdin of process. If None, nothing is written.
+    verbose: bool
+        Should stderr of process be written to sys.stderr?
+    parser: callable
+        If not None, called with the binary stdout pipe of the process while it is running
+        and its return value is returned instead of the output text.
+        Output not read by `parser` is discarded.
+    env: dict
+        Environment variables to set for the process in addition to the current environment.
+
+    Returns
+    -------
+    return_code, output: int, str or parser return type
+    '''
+
+    stdin = None if query is None else subprocess.PIPE
+    _env = None if not env else dict(os.environ, **env)
+    if parser is None:
+        p = subprocess.Popen(cmd, stdin=stdin, env=_env,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        out, err = p.communicate(query)
+        if err and verbose:
+            sys.stderr.write(err.decode('utf-8'))
+        return p.returncode, out.decode('utf-8')
+
+    p = subprocess.Popen(cmd, stdin=stdin, env=_env,
+                         stdout=subprocess.PIPE,
+                         stderr=None if verbose else subprocess.DEVNULL)
+
+    # Write queries from a separate thread so blastp can't block on a full stdout pipe
+    writer = None
+    if query is not None:
+        def _write():
+            try:
+                p.stdin.write(query)
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+        writer = threading.Thread(target=_write, daemon=True)
+        writer.start()
+
+    try:
+        result = parser(p.stdout)
+        while p.stdout.read(65536):
+            pass
+    except BaseException:
+        p.kill()
+        raise
+    finally:
+        p.stdout.close()
+        if writer is not None:
+            writer.join()
+        p.wait()
+    return p.returncode, result
+
+
+def _blastp_cmd(organism, database_path, num_threads, output_format, exe):
     assert database_path is not None
     _db_path = '{}/{}'.format(database_path, DATABASES[organism])
+    return [exe, '-query', '-',
+            '-db', _db_path,
+            *_format_args(output_format),
+            '-num_threads', str(num_threads)]
+
+
+def blastp(organism, database_path, query, verbose=False, num_threads=1, parser=None, output_format='xml',
+           exe=BLASTP_EXE, env=None):
+    '''
+    Align a single query sequence.
+
+    Parameters
+    ----------
+    organism: str
+        Organism database to search. Must be a key in DATABASES.
+    database_path: str
+        Path to directory containing sequence databases.
+    query: str
+        Query sequence.
+    verbose: bool
+        Verbose output?
+    num_threads: int
+        Number of threads blastp should use.
+    parser: callable
+        Function to parse BLAST output directly from the blastp stdout pipe.
+        If None, the output is returned as text.
+    output_format: str
+        One of OUTPUT_FORMATS. 'xml' for BLAST XML or 'json' for single file BLAST JSON.
+    exe: str
+        Name of or path to blastp executable.
+    env: dict
+        Additional environment variables for blastp (such as BLASTDB).
 
-    # TODO: make blastp exe an option in setup.py
-    exe = 'blastp'
-    cmd = 'echo "{}"| {}'.format(query, exe)
-    cmd += ' -query /dev/stdin'
-    cmd += ' -db {}'.format(_db_path)
-    cmd += ' -outfmt ' + '5'
-    cmd += ' -num_alignments {}'.format(5)
+    Returns
+    -------
+    return_code, output: int, str
+        blastp return code and BLAST output (or the value returned by `parser`).
+    '''
 
+    cmd = _blastp_cmd(organism, database_path, num_threads, output_format, exe)
     if verbose:
-        sys.stdout.write('\n{}\n'.format(cmd))
+        sys.stdout.write('\n{}\n'.format(' '.join([shlex.quote(x) for x in cmd])))
 
-    p = subprocess.Popen(cmd, shell=True,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-    out, err = p.communicate()
-    if err and verbose:
-        sys.stderr.write(err.decode('utf-8'))
-    return p.returncode, out.decode('utf-8')
+    return _run(cmd, query='{}\n'.format(query).encode('utf-8'), verbose=verbose, parser=parser, env=env)
+
+
+def blastp_batch(organism, database_path, queries, verbose=False, num_threads=1, parser=None, output_format='xml',
+                 exe=BLASTP_EXE, env=None):
+    '''
+    Align multiple query sequences in a single blastp process.
+
+    Parameters
+    ----------
+    organism: str
+        Organism database to search. Must be a key in DATABASES.
+    database_path: str
+        Path to directory containing sequence databases.
+    queries: list
+        List of (name, sequence) tuples. name is used as the fasta header
+        of the query and appears as Iteration_query-def in XML output and query_title in JSON output.
+    verbose: bool
+        Verbose output?
+    num_threads: int
+        Number of threads blastp should use.
+    parser: callable
+        Function to parse BLAST output directly from the blastp stdout pipe.
+        If None, the output is returned as text.
+    output_format: str
+        One of OUTPUT_FORMATS. 'xml' for BLAST XML or 'json' for single file BLAST JSON.
+    exe: str
+        Name of or path to blastp executable.
+    env: dict
+        Additional environment variables for blastp (such as BLASTDB).
+
+    Returns
+    -------
+    return_code, output: int, str
+        blastp return code and BLAST output for all queries
+        (or the value returned by `parser`).
+    '''
+
+    cmd = _blastp_cmd(organism, database_path, num_threads, output_format, exe)
+    if verbose:
+        sys.stdout.write('\n{} ({} queries)\n'.format(' '.join([shlex.quote(x) for x in cmd]), len(queries)))
 
+    query_text = ''.join(['>{}\n{}\n'.format(name, seq) for name, seq in queries])
+    return _run(cmd, query=query_text.encode('utf-8'), verbose=verbose, parser=parser, env=env)
@@ -0,0 +1,167 @@
+
+import os
+import sys
+import json
+import zlib
+
+DEFAULT_JOURNAL_FNAME = 'cimage_annotation_journal.txt'
+
+# entry types
+UNIPROT = 'uniprot'
+ALIGNMENT = 'alignment'
+
+
+def _encode(entry):
+    text = json.dumps(entry, separators=(',', ':'))
+    return '{:08x}\t{}\n'.format(zlib.crc32(text.encode('utf-8')), text).encode('utf-8')
+
+
+def _decode(line):
+    '''
+    Decode a journal line.
+
+    Returns
+    -------
+    entry: dict
+        Decoded entry or None if the line is incomplete or corrupt.
+    '''
+    if not line.endswith(b'\n'):
+        return None
+    crc, sep, text = line[:-1].partition(b'\t')
+    if not sep:
+        return None
+    try:
+        if int(crc, 16) != zlib.crc32(text):
+            return None
+        return json.loads(text.decode('utf-8'))
+    except ValueError:
+        return None
+
+
+class Journal():
+    '''
+    Append-only record of work finished during a run.
+
+    Completed UniProt fetches and (protein, organism) alignments are appended to
+    the journal as they finish so an interrupted run can be resumed without
+    repeating them. Each entry is written as a single checksummed line with one
+    write call, so if the process is killed part way through a write, only the
+    last entry is lost and it is ignored when the journal is read.
+
+    Parameters
+    ----------
+    fname: str
+        Path to journal file.
+    resume: bool
+        If True, entries in an existing journal are loaded and new entries are
+        appended to it. If False, any existing journal is overwritten.
+
+    Attributes
+    ----------
+    uniprot: dict
+        UniProt records loaded from an existing journal when resuming.
+    alignments: dict
+        Alignments loaded from an existing journal when resuming.
+        Entries added during the run are only written to the file,
+        so memory does not grow with the number of results.
+
+    Examples
+    --------
+    >>> journal = Journal('cimage_annotation_journal.txt', resume=True)
+    >>> 'P26641' in journal.uniprot # entries from the interrupted run
+    True
+    >>> journal.add_uniprot('Q9NTZ6', raw_text)
+    '''
+
+    def __init__(self, fname=DEFAULT_JOURNAL_FNAME, resume=False):
+        self.fname = fname
+        self.uniprot = dict()
+        self.alignments = dict()
+
+        if resume and os.path.isfile(self.fname):
+            good_size = self._load()
+            # remove torn entry at the end of the file so new entries start on a new line
+            if good_size != os.path.getsize(self.fname):
+                with open(self.fname, 'r+b') as inF:
+                    inF.truncate(good_size)
+            sys.stdout.write('Resuming from {}: {} UniProt record(s) and {} alignment(s) already finished.\n'.format(
+                             self.fname, len(self.uniprot), len(self.alignments)))
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if not resume:
+            flags |= os.O_TRUNC
+        self._fd = os.open(self.fname, flags, 0o644)
+
+    def _load(self):
+        '''
+        Read entries in journal.
+
+        Returns
+        -------
+        good_size: int
+            Size in bytes of the file up to the end of the last valid entry.
+        '''
+        good_size = 0
+        offset = 0
+        with open(self.fname, 'rb') as inF:
+            for line in inF:
+                offset += len(line)
+                entry = _decode(line)
+                if entry is None:
+                    continue
+                good_size = offset
+                if entry['type'] == UNIPROT:
+                    self.uniprot[entry['id']] = entry['raw']
+                elif entry['type'] == ALIGNMENT:
+                    self.alignments[entry['key']] = entry['result']
+        return good_size
+
+    def _append(self, entry):
+        os.write(self._fd, _encode(entry))
+
+    def add_uniprot(self, uniprot_id, raw):
+        '''
+        Record a finished UniProt request.
+
+        Parameters
+        ----------
+        uniprot_id: str
+            UniProt ID.
+        raw: str
+            SwissProt flat file text of the record, or None if the ID does not exist.
+        '''
+        self._append({'type': UNIPROT, 'id': uniprot_id, 'raw': raw})
+
+    def add_alignment(self, key, protein_id, organism, result):
+        '''
+        Record a finished alignment.
+
+        Parameters
+        ----------
+        key: str
+            Key created with AlignmentCache.alignment_key.
+        protein_id: str
+            Query protein ID.
+        organism: str
+            Organism the protein was aligned to.
+        result: str
+            Serialized BLAST result.
+        '''
+        self._append({'type': ALIGNMENT, 'key': key, 'id': protein_id,
+                      'organism': organism, 'result': result})
+
+    def close(self, remove=False):
+        '''
+        Close journal file.
+
+        Parameters
+        ----------
+        remove: bool
+            Remove journal file? Should be True once the run has finished.
+        '''
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if remove and os.path.isfile(self.fname):
+            os.remove(self.fname)
@@ -1,6 +1,10 @@
 
+import sys
+
+import numpy as np
+
 from .Alignments import organism_list
-from .dataframe import DataFrame, read_tsv
+from .dataframe import DataFrame, StringColumn, read_tsv, open_file
 
 PRINT_COLS=['index', 'id', 'symbol', 'description', 'protein_location', 'sequence', 'mass', 'position', 'res_function', 'domains']
 ALLIGNMENT_COLUMNS = ['id', 'evalue', 'description', 'position', 'function']
@@ -22,10 +26,13 @@ Data access
 ----------
 __len__():
     Return number of peptides (or rows).
-iterpeptides():
-    Iterate over peptides as (index, dict) pairs.
+iterpeptides(columns=None):
+    Iterate over peptides as (index, dict like) pairs.
+    If columns is given, only those columns are required to be in each row.
 set_peptide_value(index, key, value):
     Set value of peptide value at index.
+set_peptide_values(key, indices, values):
+    Set value of peptide value at each index in indices.
 add_column(name):
     Add empty column with specified name.
 
@@ -36,6 +43,76 @@ unique_ids:
 '''
 
 
+# Columns at the start of each line of a cimage file
+CIMAGE_COLS = ['index', 'id', 'description', 'symbol', 'sequence', 'mass']
+_CIMAGE_COL_INDEX = {c: i for i, c in enumerate(CIMAGE_COLS)}
+
+# Header values of annotation columns which are not the same as the column key
+HEADER_LABELS = {'protein_location': 'protein location',
+                 'position': 'residue position',
+                 'res_function': 'residue function'}
+
+
+class CimageRow():
+    '''
+    Line of a cimage file.
+
+    Rows can be used like a dict with the keys in CIMAGE_COLS, integer keys 1, 2, ...
+    for the remaining columns of the line, and the annotation columns in `annotation_keys`.
+    Only the fields of the line are stored. Annotation values are stored when they are set
+    and are otherwise blank, or the column name for header rows.
+
+    Parameters
+    ----------
+    fields: tuple
+        Line split by tab characters.
+    annotation_keys: frozenset
+        Names of annotation columns.
+    is_header: bool
+        Is the row a header line?
+    '''
+
+    __slots__ = ('fields', 'annotations', 'annotation_keys', 'is_header')
+
+    def __init__(self, fields, annotation_keys, is_header=False):
+        self.fields = fields
+        self.annotations = None
+        self.annotation_keys = annotation_keys
+        self.is_header = is_header
+
+    def __getitem__(self, key):
+        if self.annotations is not None and key in self.annotations:
+            return self.annotations[key]
+        if isinstance(key, int):
+            if 1 <= key < len(self.fields) - len(CIMAGE_COLS) + 1:
+                return self.fields[key + len(CIMAGE_COLS) - 1]
+            raise KeyError(key)
+        i = _CIMAGE_COL_INDEX.get(key)
+        if i is not None:
+            return 'id' if self.is_header and key == 'id' else self.fields[i]
+        if key in self.annotation_keys:
+            return HEADER_LABELS.get(key, key) if self.is_header else ''
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if self.annotations is None:
+            self.annotations = dict()
+        self.annotations[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
 class Cimage_file():
     '''
     Container for cimage output file.
@@ -45,6 +122,7 @@ class Cimage_file():
         self.fname = str()
         self.peptides = list()
         self.residues = list()
+        self.residue_peptides = dict()
         self.unique_ids = set()
         self.header = dict()
         self.defined_organism = str()
@@ -52,66 +130,38 @@ class Cimage_file():
     def __len__(self):
         return len(self.peptides)
 
-    def iterpeptides(self):
+    def iterpeptides(self, columns=None):
         for i, p in enumerate(self.peptides):
             yield i, p
 
     def set_peptide_value(self, index, key, value):
         self.peptides[index][key] = value
 
+    def set_peptide_values(self, key, indices, values):
+        peptides = self.peptides
+        for i, v in zip(indices, values):
+            peptides[i][key] = v
+
     def add_column(self, name):
         pass
 
     @staticmethod
-    def _parser(line, organism_list, defined_organism):
-        line_list = line.split('\t')
-        line_dict = {}
-        dict_terms = ['index', 'id', 'description', 'symbol', 'sequence', 'mass']
-
-        i = 0
-        for item in dict_terms:
-            line_dict[item] = line_list[i]
-            i += 1
-
-        n = 1
-        m = len(line_dict)
-        while n + m <= len(line_list):
-            line_dict[n] = line_list[n + m -1]
-            n += 1
-
-        if line_dict['description'].strip() == 'description':
-            line_dict['id'] = 'id'
-            line_dict['protein_location'] = 'protein location'
-            line_dict['position'] = 'residue position'
-            line_dict['res_function'] = 'residue function'
-            line_dict['domains'] = 'domains'
-            line_dict[defined_organism + '_id'] = defined_organism + '_id'
-            line_dict[defined_organism + '_evalue'] = defined_organism + '_evalue'
-            line_dict[defined_organism + '_description'] = defined_organism + '_description'
-            line_dict[defined_organism + '_position'] = defined_organism + '_position'
-            line_dict[defined_organism + '_function'] = defined_organism + '_function'
-            for organism in organism_list:
-                line_dict[organism + '_conserved'] = organism + '_conserved'
+    def _parser(line, annotation_keys):
+        fields = line.split('\t')
 
-        else:
-            line_dict['protein_location'] = ''
-            line_dict['position'] = ''
-            line_dict['res_function'] = ''
-            line_dict['domains'] = ''
-            line_dict[defined_organism + '_id'] = ''
-            line_dict[defined_organism + '_evalue'] = ''
-            line_dict[defined_organism + '_description'] = ''
-            line_dict[defined_organism + '_position'] = ''
-            line_dict[defined_organism + '_function'] = ''
-            for organism in organism_list:
-                line_dict[organism + '_conserved'] = ''
-
-        return line_dict
+        # protein columns are repeated on every line of a protein
+        for i in range(1, 4):
+            fields[i] = sys.intern(fields[i])
+
+        return CimageRow(tuple(fields), annotation_keys,
+                         is_header=fields[_CIMAGE_COL_INDEX['description']].strip() == 'description')
 
     def read(self, fname, defined_organism):
         '''
         Read and parse cimage output file.
 
+        The file is read one line at a time.
+
         Paramaters
         ----------
         fname: str
@@ -121,40 +171,36 @@ class Cimage_file():
         '''
 
         self.defined_organism = defined_organism
-        with open(fname, 'r') as inF:
-            lines = inF.readlines()
+        annotation_keys = frozenset(ADDED_COLUMNS +
+                                    ['{}_{}'.format(defined_organism, x) for x in ALLIGNMENT_COLUMNS] +
+                                    ['{}_conserved'.format(o) for o in organism_list])
 
         index_temp = ''
-        for i, line in enumerate(lines):
-            line_dict = self._parser(line, organism_list, defined_organism)
+        with open(fname, 'r') as inF:
+            for line in inF:
+                row = self._parser(line, annotation_keys)
 
-            if line_dict['index'].strip() == 'index':  # create header line(s)
-                self.header = line_dict
+                if row['index'].strip() == 'index':  # create header line(s)
+                    self.header = row
 
-            elif line_dict['index'].strip() != '':  # create peptide lines (no protein information - includes overall ratio)
-                index_temp = line_dict['index'].strip()
-                self.residues.append(line_dict)
-            else:
-                self.peptides.append(line_dict)
-                self.peptides[-1]['index'] = index_temp
-                self.unique_ids.add(line_dict['id'])
+                elif row['index'].strip() != '':  # create peptide lines (no protein information - includes overall ratio)
+                    index_temp = row['index'].strip()
+                    self.residues.append(row)
+                else:
+                    self.residue_peptides.setdefault(index_temp, list()).append(len(self.peptides))
+                    row.fields = (index_temp,) + row.fields[1:]
+                    self.peptides.append(row)
+                    self.unique_ids.add(row['id'])
 
 
     @staticmethod
     def _write_line(outF, line_dict, defined_organism):
 
-        outF.write('\t'.join([line_dict[x] for x in PRINT_COLS]))
-
-        for organism in organism_list:
-            outF.write('\t{}'.format(line_dict[organism + '_conserved']))
-        outF.write('\t')
-        outF.write('\t'.join([str(line_dict['{}_{}'.format(defined_organism, x)]) for x in ALLIGNMENT_COLUMNS]))
-
-        n = 1
-        while n < (len(line_dict) - 20):
-            outF.write(('\t{}'.format(line_dict[n].strip())))
-            n += 1
-        outF.write('\n')
+        fields = [line_dict[x] for x in PRINT_COLS]
+        fields += [str(line_dict[organism + '_conserved']) for organism in organism_list]
+        fields += [str(line_dict['{}_{}'.format(defined_organism, x)]) for x in ALLIGNMENT_COLUMNS]
+        fields += [line_dict[n].strip() for n in range(1, len(line_dict.fields) - len(CIMAGE_COLS) + 1)]
+        outF.write('\t'.join(fields) + '\n')
 
 
     def write(self, fname):
@@ -172,48 +218,131 @@ class Cimage_file():
             If output directory does not exist.
         '''
 
-        with open(fname, 'w') as outF:
+        with open_file(fname, 'w') as outF:
             self._write_line(outF, self.header, self.defined_organism)
             for residue in self.residues:
                 self._write_line(outF, residue, self.defined_organism)
-                for peptide in self.peptides:
-                    if peptide['index'].strip() == residue['index'].strip():
-                        self._write_line(outF, peptide, self.defined_organism)
+                for i in self.residue_peptides.get(residue['index'].strip(), []):
+                    self._write_line(outF, self.peptides[i], self.defined_organism)
 
 class Tsv_file():
-    def __init__(self, id_col='protein_ID', seq_col='sequence'):
+    '''
+    Container for tsv input file.
+
+    If `chunksize` is given, only the protein IDs and the added columns are kept in memory.
+    The input file is read again in blocks of `chunksize` rows each time the peptides
+    are iterated over and when the output file is written.
+    '''
+
+    def __init__(self, id_col='protein_ID', seq_col='sequence', chunksize=None):
         self.dat = DataFrame()
         self.unique_ids = set()
+        self.fname = str()
+        self.chunksize = chunksize
 
         # column names
         self.id_col = id_col
         self.seq_col = seq_col
 
     def read(self, fname, defined_organism):
-        self.dat = read_tsv(fname)
+        self.fname = fname
+        if self.chunksize is None:
+            self.dat = read_tsv(fname)
+            columns = self.dat.columns
+        else:
+            # self.dat only holds the added columns
+            self.dat = DataFrame()
+            for chunk in read_tsv(fname, chunksize=self.chunksize):
+                columns = chunk.columns
+                if self.id_col in columns:
+                    self.unique_ids.update(chunk[self.id_col])
+                self.dat.nrow += chunk.nrow
+
         for col in (self.id_col, self.seq_col):
-            if col not in self.dat.columns:
+            if col not in columns:
                 raise KeyError('Required column: "{}" not found!'.format(col))
 
         for col in ADDED_COLUMNS:
             self.add_column(col)
 
-        self.unique_ids = set(self.dat[self.id_col])
+        if self.chunksize is None:
+            self.unique_ids = set(self.dat[self.id_col])
 
     def __len__(self):
         return len(self.dat)
 
-    def iterpeptides(self):
-        return self.dat.iterrows()
+    def _iter_chunks(self):
+        '''
+        Read input file in blocks and add the added columns to each block.
+
+        Yields
+        ------
+        offset: int
+            Index of first row in block.
+        chunk: DataFrame
+        '''
+        offset = 0
+        for chunk in read_tsv(self.fname, chunksize=self.chunksize):
+            rows = np.arange(offset, offset + chunk.nrow)
+            for col in self.dat.columns:
+                chunk[col] = self.dat[col].take(rows)
+            yield offset, chunk
+            offset += chunk.nrow
+
+    def iterpeptides(self, columns=None):
+        if self.chunksize is None:
+            chunks = [(0, self.dat)]
+        else:
+            chunks = self._iter_chunks()
+
+        for offset, chunk in chunks:
+            columns_temp = columns
+            if columns is not None:
+                # columns which are not in the file are left out of the row
+                columns_temp = [x for x in columns if x in chunk.columns]
+            for i, row in chunk.iterrows(columns=columns_temp):
+                yield offset + i, row
 
     def write(self, fname):
-        self.dat.to_tsv(fname)
+        if self.chunksize is None:
+            self.dat.to_tsv(fname)
+        else:
+            with open_file(fname, 'w') as outF:
+                for offset, chunk in self._iter_chunks():
+                    chunk.to_tsv(outF, header=offset == 0)
 
     def set_peptide_value(self, index, key, value):
-        self.dat[key][index] = value
+        self.dat.set_values(key, [index], [value])
+
+    def set_peptide_values(self, key, indices, values):
+        self.dat.set_values(key, indices, values)
 
     def add_column(self, name):
-        self.dat[name] = ['' for _ in range(self.dat.nrow)]
+        self.dat[name] = StringColumn.full(self.dat.nrow, '')
+
+
+class ColumnBuffer():
+    '''
+    Collect peptide values by column so each column can be set in an
+    input file container at once with set_peptide_values.
+    '''
+
+    def __init__(self):
+        self.columns = dict()
+
+    def set(self, index, key, value):
+        if key not in self.columns:
+            self.columns[key] = (list(), list())
+        indices, values = self.columns[key]
+        indices.append(index)
+        values.append(value)
+
+    def flush(self, input_file):
+        ''' Set buffered values in `input_file` and clear buffer. '''
+        for key, (indices, values) in self.columns.items():
+            input_file.set_peptide_values(key, indices, values)
+        self.columns = dict()
+
 
 class Dtaselect():
     def __init__(self):
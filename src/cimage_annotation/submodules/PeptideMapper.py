@@ -0,0 +1,213 @@
+
+import re
+from collections import namedtuple
+
+PEPTIDE_RE = re.compile(r'.?\.?([A-z\*]+)\.?/?')
+MOD_CHAR = '*'
+
+PeptideMatch = namedtuple('PeptideMatch', ['sequence', 'bare', 'mod_locs', 'starts', 'sites'])
+PeptideMatch.__doc__ = '''
+Location of a peptide in its parent protein.
+
+sequence: str
+    Peptide sequence with modifications and without flanking residues.
+bare: str
+    Peptide sequence without modifications.
+mod_locs: tuple
+    Indices of modified residues in `bare`.
+starts: tuple
+    Every start index of `bare` in the parent protein sequence (starting from 0).
+sites: tuple
+    Index of each modified residue in the parent protein (starting from 0) for every
+    occurrence of the peptide. -1 if the peptide was not found in the protein.
+'''
+
+
+def normalize_peptide(sequence):
+    '''
+    Remove flanking residues and modifications from peptide sequence.
+
+    Parameters
+    ----------
+    sequence: str
+        Peptide sequence. Can include flanking residues (K.PEPTIDEC*K.R) and modifications.
+
+    Returns
+    -------
+    sequence, bare, mod_locs: str, str, tuple
+        Peptide sequence without flanking residues, peptide sequence without modifications
+        and the indices of modified residues in the bare sequence.
+        None if `sequence` could not be parsed.
+    '''
+
+    match = PEPTIDE_RE.match(sequence)
+    if match is None:
+        return None
+    _sequence = match.group(1)
+    mod_locs = list()
+    n_mods = 0
+    for i, c in enumerate(_sequence):
+        if c == MOD_CHAR:
+            n_mods += 1
+            mod_locs.append(i - n_mods)
+    return _sequence, _sequence.replace(MOD_CHAR, ''), tuple(mod_locs)
+
+
+def site_positions(starts, mod_locs):
+    '''
+    Get the index of each modified residue in the parent protein for every peptide occurrence.
+
+    Returns
+    -------
+    sites: tuple
+        -1 for each modification if `starts` is empty.
+    '''
+
+    if not starts:
+        return tuple(-1 for _ in mod_locs)
+    return tuple(s + m for s in starts for m in mod_locs)
+
+
+class AhoCorasick():
+    '''
+    Aho-Corasick automaton to find every occurrence of a set of patterns in a single pass over a text.
+
+    Parameters
+    ----------
+    patterns: list like
+        Strings to search for. Empty strings are ignored.
+
+    Examples
+    --------
+    >>> automaton = AhoCorasick(['ACK', 'CK'])
+    >>> list(automaton.finditer('MACKACK'))
+    [(1, 0), (2, 1), (4, 0), (5, 1)]
+    '''
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [dict()]
+        self._fail = [0]
+        self._out = [list()]
+
+        for pattern_i, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for c in pattern:
+                child = self._goto[node].get(c)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto.append(dict())
+                    self._fail.append(0)
+                    self._out.append(list())
+                    self._goto[node][c] = child
+                node = child
+            self._out[node].append(pattern_i)
+
+        # breadth first traversal to set failure links
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and c not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(c, 0) if node != 0 else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def finditer(self, text):
+        '''
+        Find all (possibly overlapping) occurrences of patterns in `text`.
+
+        Yields
+        ------
+        start, pattern_index: int, int
+            Start index of match in `text` and index of matching pattern.
+        '''
+
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        lengths = [len(x) for x in self.patterns]
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            for pattern_i in out[node]:
+                yield i - lengths[pattern_i] + 1, pattern_i
+
+
+def find_all(protein_seq, peptides):
+    '''
+    Find every occurrence of each peptide in `protein_seq`.
+
+    Parameters
+    ----------
+    protein_seq: str
+        Full parent protein sequence.
+    peptides: list like
+        Unmodified peptide sequences.
+
+    Returns
+    -------
+    starts: dict
+        Key value pairs of peptides and a tuple of start indices in `protein_seq`.
+    '''
+
+    _peptides = list(set(peptides))
+    ret = {p: list() for p in _peptides}
+    for start, pattern_i in AhoCorasick(_peptides).finditer(str(protein_seq)):
+        ret[_peptides[pattern_i]].append(start)
+    return {k: tuple(v) for k, v in ret.items()}
+
+
+def map_all(peptides, records):
+    '''
+    Map all peptides to their parent proteins.
+
+    Each distinct peptide sequence is normalized once and all peptides
+    of each protein are located in a single pass over its sequence.
+
+    Parameters
+    ----------
+    peptides: iterable
+        (protein_id, peptide_sequence) pairs.
+    records: dict
+        Key value pairs of protein IDs and ProteinRecord.ProteinRecord objects.
+
+    Returns
+    -------
+    matches: dict
+        Key value pairs of (protein_id, peptide_sequence) and PeptideMatch objects.
+        The value is None if the peptide sequence could not be parsed.
+        PeptideMatch.starts and PeptideMatch.sites are None if the protein record is None.
+    '''
+
+    ret = dict()
+    normalized = dict()
+    by_protein = dict()
+    for protein_id, sequence in peptides:
+        if sequence not in normalized:
+            normalized[sequence] = normalize_peptide(sequence)
+        if normalized[sequence] is None:
+            ret[(protein_id, sequence)] = None
+        else:
+            by_protein.setdefault(protein_id, set()).add(sequence)
+
+    for protein_id, sequences in by_protein.items():
+        record = records.get(protein_id)
+        starts = None
+        if record is not None:
+            starts = find_all(record.sequence, [normalized[s][1] for s in sequences])
+        for s in sequences:
+            _sequence, bare, mod_locs = normalized[s]
+            if starts is None:
+                ret[(protein_id, s)] = PeptideMatch(_sequence, bare, mod_locs, None, None)
+            else:
+                ret[(protein_id, s)] = PeptideMatch(_sequence, bare, mod_locs, starts[bare],
+                                                    site_positions(starts[bare], mod_locs))
+
+    return ret
+
@@ -0,0 +1,247 @@
+
+import sys
+import struct
+from array import array
+
+_MAGIC = b'CAPR'
+_VERSION = 1
+_HEADER = struct.Struct('<4sH')
+_UINT = struct.Struct('<I')
+_LOCATION_COMMENT = 'SUBCELLULAR LOCATION'
+
+
+def feature_intervals(features):
+    '''
+    Resolve the locations of SwissProt features.
+
+    Features with unknown ('?') or non integer start or end positions are skipped.
+
+    Parameters
+    ----------
+    features: list
+        List of Bio.SeqFeature.SeqFeature objects from a SwissProt record.
+
+    Yields
+    ------
+    start, end, type, label: int, int, str, str
+        label is the annotation string for the feature as it is written in the output.
+    '''
+
+    for feature in features:
+        try:
+            if str(feature.location.start)[0] == '?' or str(feature.location.end)[0] == '?':
+                continue
+            start = int(feature.location.start)
+            end = int(feature.location.end)
+        except TypeError as e:
+            continue
+        yield start, end, str(feature.type), str(feature.type) + '--' + str(feature.qualifiers) + ' || '
+
+
+def _pack_str(s):
+    b = s.encode('utf-8')
+    return _UINT.pack(len(b)) + b
+
+
+def _check_size(buf, offset, n_bytes):
+    if offset + n_bytes > len(buf):
+        raise ValueError('Serialized ProteinRecord is truncated.')
+
+
+def _unpack_str(buf, offset):
+    length = _UINT.unpack_from(buf, offset)[0]
+    offset += _UINT.size
+    _check_size(buf, offset, length)
+    return str(buf[offset:offset + length], 'utf-8'), offset + length
+
+
+def _pack_strs(strs):
+    '''
+    Pack list of strings as an array of lengths followed by a single concatenated string.
+    '''
+    lengths = array('I', [len(x) for x in strs])
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    return _UINT.pack(len(lengths)) + lengths.tobytes() + _pack_str(''.join(strs))
+
+
+def _unpack_strs(buf, offset):
+    n = _UINT.unpack_from(buf, offset)[0]
+    offset += _UINT.size
+    lengths = array('I')
+    _check_size(buf, offset, n * lengths.itemsize)
+    lengths.frombytes(buf[offset:offset + n * lengths.itemsize])
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    offset += n * lengths.itemsize
+    text, offset = _unpack_str(buf, offset)
+    ret = list()
+    begin = 0
+    for length in lengths:
+        ret.append(text[begin:begin + length])
+        begin += length
+    return ret, offset
+
+
+class ProteinRecord():
+    '''
+    Compact protein record holding only the parts of a SwissProt record used for annotation.
+
+    Feature locations are resolved when the record is created and stored in
+    integer arrays along with the feature types and annotation strings. Records
+    can be converted to and from a compact binary representation with
+    to_bytes and from_bytes, which is also used when records are pickled.
+
+    Records with the same contents compare equal. Records are not hashable,
+    since their feature arrays can be changed. Use the protein ID as a key instead.
+
+    Parameters
+    ----------
+    organism: str
+    sequence: str
+    comments: list
+        SUBCELLULAR LOCATION comments.
+    feature_starts: array.array
+    feature_ends: array.array
+    feature_types: list
+    feature_labels: list
+
+    Examples
+    --------
+    >>> record = ProteinRecord.from_swissprot(SwissProt.read(handle))
+    >>> record.organism
+    'Homo sapiens (Human).'
+    >>> ProteinRecord.from_bytes(record.to_bytes()).sequence == record.sequence
+    True
+    '''
+
+    __slots__ = ('organism', 'sequence', 'comments', 'feature_starts', 'feature_ends',
+                 'feature_types', 'feature_labels', '_feature_index')
+
+    def __init__(self, organism='', sequence='', comments=None, feature_starts=None, feature_ends=None,
+                 feature_types=None, feature_labels=None):
+        self.organism = sys.intern(organism)
+        self.sequence = sequence
+        self.comments = tuple() if comments is None else tuple(comments)
+        self.feature_starts = array('i') if feature_starts is None else feature_starts
+        self.feature_ends = array('i') if feature_ends is None else feature_ends
+        self.feature_types = tuple() if feature_types is None else tuple(sys.intern(x) for x in feature_types)
+        self.feature_labels = tuple() if feature_labels is None else tuple(feature_labels)
+        self._feature_index = None
+
+        if not (len(self.feature_starts) == len(self.feature_ends) == len(self.feature_types) == len(self.feature_labels)):
+            raise ValueError('feature arrays must all be same length')
+
+    @classmethod
+    def from_swissprot(cls, record):
+        '''
+        Construct ProteinRecord from Bio.SwissProt.Record.
+        '''
+
+        starts = array('i')
+        ends = array('i')
+        types = list()
+        labels = list()
+        for start, end, feature_type, label in feature_intervals(record.features):
+            starts.append(start)
+            ends.append(end)
+            types.append(feature_type)
+            labels.append(label)
+
+        return cls(organism=record.organism, sequence=record.sequence,
+                   comments=[x for x in record.comments if x.split(':')[0] == _LOCATION_COMMENT],
+                   feature_starts=starts, feature_ends=ends,
+                   feature_types=types, feature_labels=labels)
+
+    def n_features(self):
+        return len(self.feature_labels)
+
+    def iterfeatures(self):
+        '''
+        Iterate over features as (start, end, type, label) tuples.
+        '''
+        return zip(self.feature_starts, self.feature_ends, self.feature_types, self.feature_labels)
+
+    def to_bytes(self):
+        '''
+        Serialize record.
+
+        Returns
+        -------
+        buf: bytes
+        '''
+
+        starts = array('i', self.feature_starts)
+        ends = array('i', self.feature_ends)
+        if sys.byteorder != 'little':
+            starts.byteswap()
+            ends.byteswap()
+
+        return b''.join([_HEADER.pack(_MAGIC, _VERSION),
+                         _pack_str(self.organism),
+                         _pack_str(self.sequence),
+                         _pack_strs(self.comments),
+                         _UINT.pack(len(self.feature_labels)),
+                         starts.tobytes(),
+                         ends.tobytes(),
+                         _pack_strs(self.feature_types),
+                         _pack_strs(self.feature_labels)])
+
+    @classmethod
+    def from_bytes(cls, buf):
+        '''
+        Deserialize record created with to_bytes.
+
+        Raises
+        ------
+        ValueError
+            If `buf` is not a serialized ProteinRecord or is truncated.
+        '''
+
+        buf = memoryview(buf)
+        try:
+            magic, version = _HEADER.unpack_from(buf, 0)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError('Not a serialized ProteinRecord.')
+            offset = _HEADER.size
+
+            organism, offset = _unpack_str(buf, offset)
+            sequence, offset = _unpack_str(buf, offset)
+            comments, offset = _unpack_strs(buf, offset)
+
+            n_features = _UINT.unpack_from(buf, offset)[0]
+            offset += _UINT.size
+            starts = array('i')
+            ends = array('i')
+            n_bytes = n_features * starts.itemsize
+            _check_size(buf, offset, n_bytes * 2)
+            starts.frombytes(buf[offset:offset + n_bytes])
+            offset += n_bytes
+            ends.frombytes(buf[offset:offset + n_bytes])
+            offset += n_bytes
+            if sys.byteorder != 'little':
+                starts.byteswap()
+                ends.byteswap()
+
+            types, offset = _unpack_strs(buf, offset)
+            labels, offset = _unpack_strs(buf, offset)
+        except struct.error:
+            raise ValueError('Serialized ProteinRecord is truncated.') from None
+        if offset != len(buf):
+            raise ValueError('Serialized ProteinRecord has trailing data.')
+
+        return cls(organism=organism, sequence=sequence, comments=comments,
+                   feature_starts=starts, feature_ends=ends,
+                   feature_types=types, feature_labels=labels)
+
+    def __reduce__(self):
+        return (ProteinRecord.from_bytes, (self.to_bytes(),))
+
+    def __eq__(self, rhs):
+        if not isinstance(rhs, ProteinRecord):
+            return NotImplemented
+        return self.to_bytes() == rhs.to_bytes()
+
+    # equal records must have equal hashes, and the contents are mutable
+    __hash__ = None
+
@@ -0,0 +1,187 @@
+
+import os
+import time
+import sqlite3
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'cimage_annotation')
+CACHE_FNAME = 'uniprot_records.sqlite'
+
+class RecordCache():
+    '''
+    Persistent on-disk store of raw UniProt (SwissProt flat file) records.
+
+    Records are stored in a SQLite database keyed by accession along with the time
+    they were fetched and last accessed. Records older than `ttl` are treated as misses
+    and the least recently used records are evicted when the cache grows past `max_size`.
+    Accessions which do not exist in UniProt are stored as negative entries so they
+    are not requested again.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory containing cache database. Created if it does not exist.
+    ttl: float
+        Number of days a record is valid. If None or <= 0, records never expire.
+    max_size: float
+        Maximum size of cached records in MB. If None or <= 0, the cache is not size limited.
+
+    Examples
+    --------
+    >>> cache = RecordCache('~/.cache/cimage_annotation')
+    >>> hits = cache.get_many(['P26641', 'Q9NTZ6'])
+    >>> cache.put('Q15257', raw_text)
+    >>> cache.hits, cache.misses
+    (2, 0)
+    '''
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=30, max_size=1024):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.ttl = None if ttl is None or ttl <= 0 else ttl * 86400
+        self.max_size = None if max_size is None or max_size <= 0 else int(max_size * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.fname = os.path.join(self.cache_dir, CACHE_FNAME)
+        self._conn = sqlite3.connect(self.fname, timeout=60)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS records (
+                              id TEXT PRIMARY KEY,
+                              raw TEXT,
+                              fetched REAL NOT NULL,
+                              accessed REAL NOT NULL,
+                              size INTEGER NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS records_accessed ON records (accessed)')
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def __contains__(self, uniprot_id):
+        return self.get(uniprot_id, count=False)[0]
+
+    def _expired(self, fetched, now):
+        return self.ttl is not None and now - fetched > self.ttl
+
+    def get(self, uniprot_id, count=True):
+        '''
+        Get raw record text for `uniprot_id`.
+
+        Parameters
+        ----------
+        uniprot_id: str
+            UniProt accession.
+        count: bool
+            Should the lookup be added to the hit/miss counts?
+
+        Returns
+        -------
+        found, raw: bool, str
+            found is False if the record is not in the cache or is expired.
+            raw is None if the accession is a cached BAD_ID.
+        '''
+
+        ret = self.get_many([uniprot_id], count=count)
+        if uniprot_id in ret:
+            return True, ret[uniprot_id]
+        return False, None
+
+    def get_many(self, ids, count=True):
+        '''
+        Get raw record text for all cached entries in `ids`.
+
+        Parameters
+        ----------
+        ids: list like
+            UniProt accessions.
+        count: bool
+            Should the lookups be added to the hit/miss counts?
+
+        Returns
+        -------
+        records: dict
+            Key value pairs of IDs and raw record text for IDs which were found.
+            Negative entries have a value of None.
+        '''
+
+        _ids = list(ids)
+        now = time.time()
+        ret = dict()
+        for i in range(0, len(_ids), 500):
+            chunk = _ids[i:i + 500]
+            query = 'SELECT id, raw, fetched FROM records WHERE id IN ({})'.format(','.join('?' * len(chunk)))
+            for uniprot_id, raw, fetched in self._conn.execute(query, chunk):
+                if not self._expired(fetched, now):
+                    ret[uniprot_id] = raw
+
+        if ret:
+            self._conn.executemany('UPDATE records SET accessed = ? WHERE id = ?',
+                                   [(now, k) for k in ret.keys()])
+            self._conn.commit()
+
+        if count:
+            self.hits += len(ret)
+            self.misses += len(set(_ids)) - len(ret)
+        return ret
+
+    def put(self, uniprot_id, raw):
+        '''
+        Add record to cache. A `raw` value of None stores a negative entry.
+        '''
+        self.put_many({uniprot_id: raw})
+
+    def put_many(self, records):
+        '''
+        Add records to cache and evict least recently used records if the cache is too large.
+
+        Parameters
+        ----------
+        records: dict
+            Key value pairs of IDs and raw record text.
+        '''
+
+        if not records:
+            return
+        now = time.time()
+        self._conn.executemany('INSERT OR REPLACE INTO records (id, raw, fetched, accessed, size) VALUES (?, ?, ?, ?, ?)',
+                               [(k, v, now, now, 0 if v is None else len(v)) for k, v in records.items()])
+        self._conn.commit()
+        self.evict()
+
+    def size(self):
+        ''' Total size of cached records in bytes. '''
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM records').fetchone()[0]
+
+    def evict(self):
+        '''
+        Remove expired records and least recently used records until
+        the cache is smaller than max_size.
+
+        Returns
+        -------
+        n_evicted: int
+            Number of records removed.
+        '''
+
+        n_evicted = 0
+        if self.ttl is not None:
+            n_evicted += self._conn.execute('DELETE FROM records WHERE fetched < ?',
+                                            (time.time() - self.ttl,)).rowcount
+
+        if self.max_size is not None:
+            excess = self.size() - self.max_size
+            if excess > 0:
+                remove = list()
+                for uniprot_id, size in self._conn.execute('SELECT id, size FROM records ORDER BY accessed ASC'):
+                    if excess <= 0:
+                        break
+                    remove.append((uniprot_id,))
+                    excess -= size
+                self._conn.executemany('DELETE FROM records WHERE id = ?', remove)
+                n_evicted += len(remove)
+
+        self._conn.commit()
+        return n_evicted
+
+    def close(self):
+        self._conn.close()
+
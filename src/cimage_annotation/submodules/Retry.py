@@ -0,0 +1,341 @@
+
+import sys
+import time
+import random
+import asyncio
+import threading
+import concurrent.futures
+from http.client import HTTPException
+
+RETRY_ON = (OSError, HTTPException, EOFError, asyncio.TimeoutError)
+
+class Throttled(Exception):
+    '''
+    Raised by a request function when the server asks the client to slow down (HTTP 429 or 503).
+
+    Parameters
+    ----------
+    retry_after: str
+        Value of Retry-After header if the server sent one.
+    '''
+
+    def __init__(self, retry_after=None):
+        super().__init__('Request throttled. Retry-After: {}'.format(retry_after))
+        try:
+            self.retry_after = None if retry_after is None else float(retry_after)
+        except ValueError:
+            # Retry-After can also be an HTTP date. Fall back to normal backoff.
+            self.retry_after = None
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker():
+    '''
+    Fail fast after `threshold` consecutive failures.
+
+    Once open, requests are rejected until `reset_timeout` seconds have passed.
+    Then a single trial request is allowed. The breaker closes if it succeeds
+    and opens again if it fails. If the trial request ends any other way
+    (it is throttled, cancelled, or raises an error which is not retried),
+    release_trial must be called so the next request can be the trial.
+    '''
+
+    def __init__(self, threshold=20, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release_trial(self):
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self.threshold > 0 and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class AdaptiveLimiter():
+    '''
+    Concurrency limit which is halved each time the server throttles requests
+    and slowly restored after successful requests.
+    '''
+
+    def __init__(self, limit, increase_after=10):
+        self.max_limit = max(1, limit)
+        self.limit = self.max_limit
+        self.increase_after = increase_after
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def throttle(self):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+
+    def success(self):
+        with self._cond:
+            if self.limit < self.max_limit:
+                self._successes += 1
+                if self._successes >= self.increase_after:
+                    self.limit += 1
+                    self._successes = 0
+                    self._cond.notify_all()
+
+
+class RetryScheduler():
+    '''
+    Make requests with exponential backoff, per request timeouts, hedged
+    duplicate requests, an adaptive concurrency limit, and a circuit breaker.
+
+    Parameters
+    ----------
+    n_retry: int
+        Number of times to retry request if an error occurs
+    timeout: float
+        Per request timeout in seconds.
+    hedge_after: float
+        If a request has not finished after `hedge_after` seconds a duplicate request
+        is made and whichever finishes first is used. If 0 or None, requests are not hedged.
+    base_delay: float
+        Initial backoff delay in seconds. The delay is doubled after each failed
+        attempt up to `max_delay` and a random jitter is applied.
+    max_delay: float
+        Maximum backoff delay in seconds.
+    breaker_threshold: int
+        Number of consecutive failures before the circuit breaker opens.
+    breaker_reset: float
+        Seconds before a trial request is allowed after the circuit breaker opens.
+    retry_on: tuple
+        Exception types which should be retried.
+    verbose: bool
+        Verbose output?
+
+    Examples
+    --------
+    >>> scheduler = RetryScheduler(n_retry=5, timeout=30)
+    >>> scheduler.set_concurrency(8)
+    >>> ok, result = scheduler.call(lambda timeout: urlopen(url, timeout=timeout).read(), 'P26641')
+    '''
+
+    def __init__(self, n_retry=10, timeout=60, hedge_after=5, base_delay=0.5, max_delay=30,
+                 breaker_threshold=20, breaker_reset=60, retry_on=RETRY_ON, verbose=False):
+        self.n_retry = n_retry if n_retry > 0 else 1
+        self.timeout = timeout
+        self.hedge_after = hedge_after if hedge_after else None
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+        self.verbose = verbose
+        self.breaker = CircuitBreaker(threshold=breaker_threshold, reset_timeout=breaker_reset)
+        self.limiter = AdaptiveLimiter(1)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def set_concurrency(self, n):
+        ''' Reset the concurrency limit to `n` concurrent requests. '''
+        self.limiter = AdaptiveLimiter(n)
+        self.shutdown()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def delay(self, attempt, retry_after=None):
+        ''' Backoff delay in seconds before retry number `attempt`. '''
+        ret = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            ret = max(ret, retry_after)
+        return ret
+
+    def _write_retry(self, key, attempt, e):
+        if self.verbose:
+            sys.stderr.write('Retry {} of {} for {}\n\t{}\n'.format(attempt, self.n_retry, key, e))
+
+    def _write_error(self, key, e):
+        sys.stderr.write('ERROR: Request for {} failed and will not be retried\n\t{}: {}\n'.format(
+                         key, type(e).__name__, e))
+
+    def _hedged(self, fn):
+        if self.hedge_after is None:
+            return fn(self.timeout)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.limiter.max_limit * 2)
+        futures = [self._executor.submit(fn, self.timeout)]
+        done, _ = concurrent.futures.wait(futures, timeout=self.hedge_after)
+        if not done:
+            futures.append(self._executor.submit(fn, self.timeout))
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    return f.result()
+                error = f.exception() if error is None else error
+        raise error
+
+    def call(self, fn, key):
+        '''
+        Call `fn` with retries and block until it succeeds or all attempts fail.
+
+        Parameters
+        ----------
+        fn: callable
+            Function which makes a request. It is called with a timeout in seconds as
+            its only argument and should raise Throttled if the server throttles the request.
+        key: str
+            Name of request for log messages.
+
+        Returns
+        -------
+        ok, result:
+            ok is False if all attempts failed, the circuit breaker is open,
+            or the request raised an exception which is not in retry_on.
+        '''
+
+        for attempt in range(self.n_retry):
+            if not self.breaker.allow():
+                self._write_retry(key, attempt, CircuitOpen('Circuit breaker is open.'))
+                return False, None
+            self.limiter.acquire()
+            try:
+                result = self._hedged(fn)
+            except Throttled as e:
+                self.breaker.release_trial()
+                self.limiter.throttle()
+                delay = self.delay(attempt, e.retry_after)
+                self._write_retry(key, attempt, e)
+            except self.retry_on as e:
+                self.breaker.record_failure()
+                delay = self.delay(attempt)
+                self._write_retry(key, attempt, e)
+            except Exception as e:
+                # Errors which are not in retry_on would fail again, so the request is not retried.
+                self.breaker.release_trial()
+                self._write_error(key, e)
+                return False, None
+            else:
+                self.breaker.record_success()
+                self.limiter.success()
+                return True, result
+            finally:
+                self.limiter.release()
+            if attempt + 1 < self.n_retry:
+                time.sleep(delay)
+
+        return False, None
+
+    async def _hedged_async(self, coro_fn):
+        if self.hedge_after is None:
+            return await asyncio.wait_for(coro_fn(False), self.timeout)
+
+        tasks = [asyncio.ensure_future(asyncio.wait_for(coro_fn(False), self.timeout))]
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+        if not done:
+            tasks.append(asyncio.ensure_future(asyncio.wait_for(coro_fn(True), self.timeout)))
+        pending = set(tasks)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        return t.result()
+                    error = t.exception() if error is None else error
+        finally:
+            for t in pending:
+                t.cancel()
+        raise error
+
+    async def call_async(self, coro_fn, key):
+        '''
+        Await coroutines returned by `coro_fn` with retries.
+
+        Parameters
+        ----------
+        coro_fn: callable
+            Function which returns a coroutine making the request. It is called with
+            a single bool argument which is True for hedged duplicate requests.
+        key: str
+            Name of request for log messages.
+
+        Returns
+        -------
+        ok, result:
+            ok is False if all attempts failed, the circuit breaker is open,
+            or the request raised an exception which is not in retry_on.
+        '''
+
+        for attempt in range(self.n_retry):
+            if not self.breaker.allow():
+                self._write_retry(key, attempt, CircuitOpen('Circuit breaker is open.'))
+                return False, None
+            try:
+                result = await self._hedged_async(coro_fn)
+            except Throttled as e:
+                self.breaker.release_trial()
+                self.limiter.throttle()
+                delay = self.delay(attempt, e.retry_after)
+                self._write_retry(key, attempt, e)
+            except self.retry_on as e:
+                self.breaker.record_failure()
+                delay = self.delay(attempt)
+                self._write_retry(key, attempt, e)
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                self.breaker.release_trial()
+                self._write_error(key, e)
+                return False, None
+            else:
+                self.breaker.record_success()
+                self.limiter.success()
+                return True, result
+            if attempt + 1 < self.n_retry:
+                await asyncio.sleep(delay)
+
+        return False, None
+
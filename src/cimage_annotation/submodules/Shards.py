@@ -0,0 +1,249 @@
+
+import os
+import re
+import heapq
+from itertools import zip_longest
+from xml.sax.saxutils import unescape
+
+from .dataframe import open_file
+
+# Weight used for proteins whose sequence length is not known
+DEFAULT_SEQUENCE_LENGTH = 500
+
+SHARD_DIR = 'shards'
+
+_SEQ_LEN_RE = re.compile(r'^SQ   SEQUENCE\s+([0-9]+) AA;', re.MULTILINE)
+
+# Pattern for the first line of each protein record, pattern for the protein ID, and
+# the number of bytes before the first line which belong to the record
+# (fasta entries are written with a leading newline)
+_RECORD_FORMATS = {'fasta': (re.compile(rb'>'), re.compile(rb'^>[^|]*\|([^|\n]*)'), 1),
+                   'txt': (re.compile(rb'H\tquery_length\t'), re.compile(rb'^H\tquery_id\t([^\r\n]*)'), 0),
+                   'xml': (re.compile(rb'<BlastOutput>'), re.compile(rb'<Iteration_query-ID>(.*?)</Iteration_query-ID>'), 0)}
+
+
+def shard_ids_fname(shard_dir, shard):
+    return os.path.join(shard_dir, 'shard_ids_{}.txt'.format(shard))
+
+
+def shard_wd(shard_dir, shard):
+    return os.path.join(shard_dir, 'shard_{}'.format(shard))
+
+
+def sequence_lengths(ids, cache=None, dat_index=None):
+    '''
+    Get sequence lengths of proteins from locally available UniProt records.
+
+    No network requests are made. Proteins which are not in `dat_index` or `cache` are skipped.
+
+    Parameters
+    ----------
+    ids: list like
+        UniProt IDs.
+    cache: RecordCache.RecordCache
+        Persistent record cache.
+    dat_index: SwissProtIndex.SwissProtIndex
+        Index of local UniProt flat file.
+
+    Returns
+    -------
+    lengths: dict
+        Key value pairs of IDs and sequence lengths.
+    '''
+
+    raw = dict()
+    if dat_index is not None:
+        raw = {k: dat_index.get_raw(k) for k in ids}
+    elif cache is not None:
+        raw = cache.get_many(ids, count=False)
+
+    ret = dict()
+    for k, text in raw.items():
+        match = None if text is None else _SEQ_LEN_RE.search(text)
+        if match:
+            ret[k] = int(match.group(1))
+    return ret
+
+
+def partition(weights, n_shards):
+    '''
+    Split items into shards with about the same total weight.
+
+    Items are assigned from heaviest to lightest to the shard with the smallest total weight.
+
+    Parameters
+    ----------
+    weights: dict
+        Key value pairs of items and weights.
+    n_shards: int
+        Number of shards.
+
+    Returns
+    -------
+    shards: list
+        List of `n_shards` sorted lists of items.
+    '''
+
+    heap = [(0, i) for i in range(n_shards)]
+    shards = [list() for _ in range(n_shards)]
+    for item in sorted(weights, key=lambda x: (-weights[x], x)):
+        total, i = heapq.heappop(heap)
+        shards[i].append(item)
+        heapq.heappush(heap, (total + weights[item], i))
+    return [sorted(x) for x in shards]
+
+
+def write_shard_ids(fname, ids):
+    with open(fname, 'w') as outF:
+        for x in ids:
+            outF.write('{}\n'.format(x))
+
+
+def read_shard_ids(fname):
+    with open(fname, 'r') as inF:
+        return set(line.strip() for line in inF if line.strip())
+
+
+def merge_output(shard_fnames, shard_ids, ofname, id_col='id'):
+    '''
+    Merge output files from shards.
+
+    Each shard output has the same lines as the input file, with annotations only
+    for peptides of the proteins in the shard. Each line of the merged file is taken
+    from the shard containing the protein on that line, so the merged file is the same
+    as the output of an unsharded run.
+
+    Parameters
+    ----------
+    shard_fnames: list
+        Paths to shard output files.
+    shard_ids: list
+        Set of protein IDs in each shard.
+    ofname: str
+        Path to merged output file.
+    id_col: str
+        Name of protein ID column in output files.
+
+    Returns
+    -------
+    ids: list
+        Protein IDs in the order they first appear in the merged file.
+
+    Raises
+    ------
+    RuntimeError
+        If the shard output files do not have the same lines,
+        or a line has a protein ID which is not in any shard.
+    '''
+
+    owners = dict()
+    for i, ids in enumerate(shard_ids):
+        for x in ids:
+            owners[x] = i
+
+    files = [open_file(fname, 'r') for fname in shard_fnames]
+    try:
+        with open_file(ofname, 'w') as outF:
+            header = files[0].readline()
+            for f in files[1:]:
+                if f.readline() != header:
+                    raise RuntimeError('Headers of shard output files do not match!')
+            id_index = header.rstrip('\n').split('\t').index(id_col)
+            outF.write(header)
+
+            ids = list()
+            seen = set()
+            for line_number, lines in enumerate(zip_longest(*files), 2):
+                if None in lines:
+                    raise RuntimeError('Shard output files have different numbers of lines!')
+                fields = lines[0].split('\t')
+                protein_id = fields[id_index].strip() if len(fields) > id_index else None
+                if protein_id not in owners:
+                    raise RuntimeError('Protein ID "{}" on line {} is not in any shard!'.format(protein_id, line_number))
+                if protein_id not in seen:
+                    seen.add(protein_id)
+                    ids.append(protein_id)
+                outF.write(lines[owners[protein_id]])
+    finally:
+        for f in files:
+            f.close()
+    return ids
+
+
+def _index_records(fname, file_format):
+    '''
+    Find the offset and length of each protein record in a sequence or alignment file.
+
+    Returns
+    -------
+    records: list
+        List of (id, offset, length) tuples in file order.
+    '''
+
+    start_re, id_re, lead = _RECORD_FORMATS[file_format]
+    records = list()
+    offset = 0
+    with open(fname, 'rb') as inF:
+        for line in inF:
+            if start_re.match(line):
+                records.append([None, max(offset - lead, 0), None])
+            if records and records[-1][0] is None:
+                match = id_re.search(line)
+                if match:
+                    records[-1][0] = unescape(match.group(1).decode('utf-8'))
+            offset += len(line)
+
+    for i, record in enumerate(records):
+        if record[0] is None:
+            raise RuntimeError('Protein ID of record at byte {} in {} not found!'.format(record[1], fname))
+        end = records[i + 1][1] if i + 1 < len(records) else offset
+        record[2] = end - record[1]
+    return [tuple(x) for x in records]
+
+
+def merge_records(fnames, ids, ofname, file_format):
+    '''
+    Merge sequence or alignment files from shards.
+
+    Records are written in the order of `ids`, so the merged file is the same
+    as the file written by an unsharded run.
+
+    Parameters
+    ----------
+    fnames: list
+        Paths to shard files. Files which do not exist are skipped.
+    ids: list
+        Protein IDs in the order records should be written.
+    ofname: str
+        Path to merged file.
+    file_format: str
+        One of 'fasta', 'txt' or 'xml'.
+
+    Raises
+    ------
+    RuntimeError
+        If a record has a protein ID which is not in `ids`.
+    '''
+
+    id_set = set(ids)
+    records = dict()
+    for i, fname in enumerate(fnames):
+        if not os.path.isfile(fname):
+            continue
+        for protein_id, offset, length in _index_records(fname, file_format):
+            if protein_id not in id_set:
+                raise RuntimeError('Protein ID "{}" in {} is not in merged output!'.format(protein_id, fname))
+            records.setdefault(protein_id, list()).append((i, offset, length))
+
+    files = dict()
+    try:
+        with open(ofname, 'wb') as outF:
+            for protein_id in ids:
+                for i, offset, length in records.get(protein_id, []):
+                    if i not in files:
+                        files[i] = open(fnames[i], 'rb')
+                    files[i].seek(offset)
+                    outF.write(files[i].read(length))
+    finally:
+        for f in files.values():
+            f.close()
@@ -0,0 +1,182 @@
+
+import os
+import sys
+import re
+import mmap
+import socket
+
+class SwissProtIndex():
+    '''
+    Random access to records in a local UniProt flat file (uniprot_sprot.dat or uniprot_trembl.dat).
+
+    The first time a file is opened, it is scanned once to build a byte offset index
+    of every accession in the file. The index is written to a sidecar file
+    (`fname` + INDEX_EXT by default) so later runs only have to read the index.
+    Records are sliced out of a memory map of the flat file, so looking up
+    an accession does not require reading the rest of the file.
+
+    Parameters
+    ----------
+    fname: str
+        Path to uncompressed UniProt flat file.
+    index_fname: str
+        Path to sidecar index file. If None, `fname` + INDEX_EXT is used.
+    rebuild: bool
+        Rebuild the index even if an up to date sidecar file exists?
+    verbose: bool
+        Verbose output?
+
+    Examples
+    --------
+    >>> index = SwissProtIndex('uniprot_sprot.dat')
+    >>> 'P26641' in index
+    True
+    >>> record = SwissProt.read(io.StringIO(index.get_raw('P26641')))
+    '''
+
+    INDEX_EXT = '.idx'
+    _INDEX_HEADER = '#cimage_annotation_swissprot_index_v2'
+    _INDEX_TRAILER = '#end'
+    _LINE_RE = re.compile(rb'^(ID|AC|//)(.*)$', re.MULTILINE)
+
+    def __init__(self, fname, index_fname=None, rebuild=False, verbose=False):
+        self.fname = os.path.abspath(fname)
+        self.index_fname = index_fname if index_fname is not None else self.fname + self.INDEX_EXT
+        self._offsets = dict()
+
+        self._file = open(self.fname, 'rb')
+        # empty files can not be memory mapped
+        if os.path.getsize(self.fname) > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mm = b''
+
+        if rebuild or not self._read_index():
+            sys.stdout.write('Building index for {}...'.format(self.fname))
+            self._build_index()
+            sys.stdout.write('Done!\n')
+            self._write_index(verbose=verbose)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, uniprot_id):
+        return uniprot_id in self._offsets
+
+    def _file_stats(self):
+        stat = os.stat(self.fname)
+        return str(stat.st_size), str(int(stat.st_mtime))
+
+    def _build_index(self):
+        '''
+        Scan flat file and populate self._offsets with (offset, length)
+        of the record for each primary and secondary accession.
+        '''
+
+        self._offsets = dict()
+        primary = set()
+        begin = None
+        accessions = list()
+        for match in self._LINE_RE.finditer(self._mm):
+            tag = match.group(1)
+            if tag == b'ID':
+                begin = match.start()
+                accessions = list()
+            elif tag == b'AC':
+                accessions += [x.strip().decode('utf-8') for x in match.group(2).split(b';') if x.strip()]
+            elif begin is not None:
+                end = match.end() + 1
+                for i, ac in enumerate(accessions):
+                    # primary accessions take precedence over secondary accessions of other records
+                    if i == 0:
+                        self._offsets[ac] = (begin, end - begin)
+                        primary.add(ac)
+                    elif ac not in primary:
+                        self._offsets[ac] = (begin, end - begin)
+                begin = None
+
+    def _read_index(self):
+        '''
+        Read sidecar index file.
+
+        Returns
+        -------
+        success: bool
+            False if the index file does not exist, is out of date or is incomplete.
+        '''
+
+        if not os.path.isfile(self.index_fname):
+            return False
+
+        with open(self.index_fname, 'r') as inF:
+            header = inF.readline().rstrip('\n').split('\t')
+            if header[:-1] != [self._INDEX_HEADER, *self._file_stats()]:
+                return False
+            offsets = dict()
+            complete = False
+            try:
+                n_entries = int(header[-1])
+                for line in inF:
+                    fields = line.rstrip('\n').split('\t')
+                    if fields[0] == self._INDEX_TRAILER:
+                        complete = int(fields[1]) == n_entries
+                        break
+                    ac, offset, length = fields
+                    offsets[ac] = (int(offset), int(length))
+            except ValueError:
+                return False
+
+        if not complete or len(offsets) != n_entries:
+            return False
+        self._offsets = offsets
+        return True
+
+    def _write_index(self, verbose=False):
+        '''
+        Write sidecar index file.
+
+        The index is written to a temporary file which is renamed to self.index_fname,
+        so other processes reading the index never see a partially written file.
+        '''
+        tmp_fname = os.path.join(os.path.dirname(os.path.abspath(self.index_fname)),
+                                 '.{}.{}.{}.tmp'.format(os.path.basename(self.index_fname),
+                                                        socket.gethostname(), os.getpid()))
+        try:
+            with open(tmp_fname, 'w') as outF:
+                outF.write('\t'.join([self._INDEX_HEADER, *self._file_stats(), str(len(self._offsets))]) + '\n')
+                for ac, (offset, length) in self._offsets.items():
+                    outF.write('{}\t{}\t{}\n'.format(ac, offset, length))
+                outF.write('{}\t{}\n'.format(self._INDEX_TRAILER, len(self._offsets)))
+            os.replace(tmp_fname, self.index_fname)
+        except OSError as e:
+            if os.path.isfile(tmp_fname):
+                os.remove(tmp_fname)
+            if verbose:
+                sys.stderr.write('WARN: Could not write index file {}\n\t{}\n'.format(self.index_fname, e))
+
+    def get_raw(self, uniprot_id):
+        '''
+        Get flat file text of record.
+
+        Parameters
+        ----------
+        uniprot_id: str
+            UniProt accession.
+
+        Returns
+        -------
+        raw: str
+            Record text. None if `uniprot_id` is not in the file.
+        '''
+
+        entry = self._offsets.get(uniprot_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._mm[offset:offset + length].decode('utf-8')
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
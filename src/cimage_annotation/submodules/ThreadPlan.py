@@ -0,0 +1,71 @@
+
+from collections import namedtuple
+
+# Network requests spend most of their time waiting, so more threads than cores are used.
+NET_THREADS_PER_CORE = 2
+MAX_NET_THREADS = 32
+
+# blastp scales poorly past a few threads, so large core counts are split
+# between more processes rather than more threads per process.
+CORES_PER_BLAST_THREAD = 8
+MAX_BLAST_THREADS = 4
+
+ThreadPlan = namedtuple('ThreadPlan', ['net_threads', 'blast_procs', 'blast_threads'])
+ThreadPlan.__doc__ = '''
+Concurrency settings for each stage of a run.
+
+net_threads: int
+    Number of concurrent UniProt requests.
+blast_procs: int
+    Number of blastp processes run in parallel.
+blast_threads: int
+    Number of threads used by each blastp process (blastp -num_threads).
+'''
+
+
+def plan_threads(n_cores, net_threads=None, blast_procs=None, blast_threads=None):
+    '''
+    Split `n_cores` between network requests and BLAST.
+
+    Settings which are not None are used as is and the remaining
+    settings are chosen so the BLAST stage uses about `n_cores` cores.
+
+    Parameters
+    ----------
+    n_cores: int
+        Number of cores available.
+    net_threads: int
+        Number of concurrent UniProt requests.
+    blast_procs: int
+        Number of blastp processes.
+    blast_threads: int
+        Number of threads for each blastp process.
+
+    Returns
+    -------
+    plan: ThreadPlan
+
+    Examples
+    --------
+    >>> plan_threads(32)
+    ThreadPlan(net_threads=32, blast_procs=8, blast_threads=4)
+    >>> plan_threads(8)
+    ThreadPlan(net_threads=16, blast_procs=8, blast_threads=1)
+    '''
+
+    _n_cores = max(1, n_cores)
+
+    _net_threads = net_threads
+    if _net_threads is None:
+        _net_threads = min(MAX_NET_THREADS, _n_cores * NET_THREADS_PER_CORE)
+
+    _blast_threads = blast_threads
+    _blast_procs = blast_procs
+    if _blast_threads is None and _blast_procs is None:
+        _blast_threads = max(1, min(MAX_BLAST_THREADS, _n_cores // CORES_PER_BLAST_THREAD))
+    if _blast_threads is None:
+        _blast_threads = max(1, _n_cores // max(1, _blast_procs))
+    if _blast_procs is None:
+        _blast_procs = max(1, _n_cores // _blast_threads)
+
+    return ThreadPlan(max(1, _net_threads), max(1, _blast_procs), max(1, _blast_threads))
@@ -1,14 +1,24 @@
 
 import sys
+import io
 import re
-from urllib.error import URLError
-from http.client import BadStatusLine
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
 from multiprocessing.pool import ThreadPool as Pool
 from multiprocessing import cpu_count
 from tqdm import tqdm
 import functools
-from Bio import ExPASy, SwissProt
+from bisect import bisect_left, bisect_right
+from Bio import SwissProt
 
+from . import AsyncFetch, Retry, ProteinRecord, PeptideMapper
+
+
+# Number of UniProt IDs in each WorkQueue task
+QUEUE_CHUNK_SIZE = 25
+
+# Number of retrieved records written to the record cache at once
+CACHE_FLUSH_SIZE = 100
 
 features_list = ['CA_BIND', 'ZN_FING', 'DNA_BIND', 'NP_BIND',
                  'ACT_SITE', 'METAL', 'BINDING', 'SITE',
@@ -17,20 +27,81 @@ features_list = ['CA_BIND', 'ZN_FING', 'DNA_BIND', 'NP_BIND',
                  'UNSURE', 'CONFLICT', 'REGION']
 
 
-def _parse_record(handle):
+def _parse_record(raw):
 
     record = None
-    if handle is not None:
+    if raw is not None:
         try:
-            record = SwissProt.read(handle)
+            record = ProteinRecord.ProteinRecord.from_swissprot(SwissProt.read(io.StringIO(raw)))
         except ValueError as e:
             pass
     return record
 
 
+def _request_raw(uniprot_id, timeout):
+    request = Request(AsyncFetch.UNIPROT_URL.format(uniprot_id), headers={'User-Agent': AsyncFetch.USER_AGENT})
+    try:
+        with urlopen(request, timeout=timeout) as handle:
+            return handle.read().decode('utf-8')
+    except HTTPError as e:
+        if e.code in (400, 404):
+            return None
+        if e.code in (429, 503):
+            raise Retry.Throttled(e.headers.get('Retry-After')) from None
+        raise
+
+
+def fetch_raw(uniprot_id, verbose=True, scheduler=None):
+    '''
+    Retrieve raw UniProt record and retry if an http error occurs.
+
+    Parameters
+    ----------
+    uniprot_id: str
+        Uniprot ID to retrieve.
+    verbose: bool
+        Verbose output?
+    scheduler: Retry.RetryScheduler
+        Scheduler used to retry failed requests. If None, a scheduler with the default settings is used.
+
+    Returns
+    -------
+    ok, raw: bool, str
+        ok is False if the request failed after all retries.
+        raw is the SwissProt flat file text of the record, or None if
+        `uniprot_id` does not exist.
+    '''
+
+    _scheduler = Retry.RetryScheduler(verbose=verbose) if scheduler is None else scheduler
+    ok, raw = _scheduler.call(functools.partial(_request_raw, uniprot_id), uniprot_id)
+    if ok and raw is None and verbose:
+        sys.stderr.write('No UniProt page found for {}\n'.format(uniprot_id))
+    return ok, raw
+
+
+def fetch_task(payload):
+    '''
+    Retrieve raw UniProt records for a WorkQueue task.
+
+    Parameters
+    ----------
+    payload: dict
+        'ids' is a list of UniProt IDs. 'n_retry' and 'timeout' are passed to Retry.RetryScheduler.
+
+    Returns
+    -------
+    results: list
+        [uniprot_id, ok, raw] list for each ID. See fetch_raw.
+    '''
+    scheduler = Retry.RetryScheduler(n_retry=payload['n_retry'], timeout=payload['timeout'])
+    ret = [[k, *fetch_raw(k, verbose=False, scheduler=scheduler)] for k in payload['ids']]
+    scheduler.shutdown()
+    return ret
+
+
 def make_request(uniprot_id, verbose=True, n_retry=10):
     '''
-    ExPASy get_sprot_raw wrapper to make retries if an http error occurs.
+    Retrieve and parse a UniProt record.
 
     Parameters
     ----------
@@ -39,28 +110,19 @@ def make_request(uniprot_id, verbose=True, n_retry=10):
 
     n_retry: int
         Number of times to retry request if an error occurs
-    '''
 
-    n_iter = n_retry if n_retry > 0 else 1
-    ret = None
-    for i in range(n_iter):
-        try:
-            handle = ExPASy.get_sprot_raw(uniprot_id)
-        except ValueError as e:
-            if verbose:
-                sys.stderr.write('No UniProt page found for {}\n'.format(uniprot_id))
-            break
-        except (BadStatusLine, URLError) as e:
-            if verbose:
-                sys.stderr.write('Retry {} of {} for {}\n\t{}\n'.format(i, n_iter, uniprot_id, e))
-            continue
-        else:
-            return _parse_record(handle)
+    Returns
+    -------
+    record: ProteinRecord.ProteinRecord
+        Parsed record. None if the request failed or `uniprot_id` does not exist.
+    '''
 
-    return ret
+    return _parse_record(fetch_raw(uniprot_id, verbose=verbose,
+                                   scheduler=Retry.RetryScheduler(n_retry=n_retry, verbose=verbose))[1])
 
 
-def get_uniprot_records(ids, nThread, verbose=False, show_bar=True):
+def get_uniprot_records(ids, nThread, verbose=False, show_bar=True, cache=None, dat_index=None,
+                        engine='thread', max_in_flight=None, scheduler=None, journal=None, queue=None):
     '''
     Get a dict of UniProt records.
 
@@ -74,38 +136,136 @@ def get_uniprot_records(ids, nThread, verbose=False, show_bar=True):
         Verbose output?
     show_bar: bool
         Shouold status bar be shown?
+    cache: RecordCache.RecordCache
+        Persistent record cache. If not None, records are looked up in the cache
+        first and only missing records are requested from UniProt. Retrieved records
+        are added to the cache in batches of CACHE_FLUSH_SIZE as requests complete.
+    dat_index: SwissProtIndex.SwissProtIndex
+        Index of local UniProt flat file. If not None, records are read from
+        the local file and no network requests are made.
+    engine: str
+        Engine used to make requests. 'thread' makes requests in a thread pool.
+        'async' makes requests with asyncio over a pool of keep-alive connections.
+    max_in_flight: int
+        Maximum number of concurrent requests for the 'async' engine.
+        If None, `nThread` is used.
+    scheduler: Retry.RetryScheduler
+        Scheduler used to retry failed requests. If None, a scheduler with the default settings is used.
+    journal: Journal.Journal
+        Run journal. If not None, records in the journal are not requested again
+        and each retrieved record is recorded as soon as the request completes.
+    queue: WorkQueue.WorkQueue
+        Shared work queue. If not None, requests are made by worker processes
+        (cimage_annotation worker) instead of in this process.
 
     Return
     ------
     records: dict
-        Key value paris of IDs and records.
+        Key value paris of IDs and ProteinRecord.ProteinRecord objects.
     '''
 
+    if engine not in ('thread', 'async'):
+        raise ValueError('{} is an unknown engine.'.format(engine))
+
+    _ids = list(ids)
+    if dat_index is not None:
+        raw = {k: dat_index.get_raw(k) for k in _ids}
+        n_missing = sum(1 for v in raw.values() if v is None)
+        sys.stdout.write('Found {} of {} record(s) in {}\n'.format(len(_ids) - n_missing, len(_ids), dat_index.fname))
+        return {k: _parse_record(v) for k, v in raw.items()}
+
+    records = dict()
+    to_fetch = _ids
+    if journal is not None:
+        to_fetch = list()
+        for k in _ids:
+            if k in journal.uniprot:
+                records[k] = _parse_record(journal.uniprot[k])
+            else:
+                to_fetch.append(k)
+    if cache is not None:
+        cached = cache.get_many(to_fetch)
+        to_fetch = [x for x in to_fetch if x not in cached]
+        sys.stdout.write('UniProt cache: {} hit(s), {} miss(es)\n'.format(len(cached), len(to_fetch)))
+        for k, text in cached.items():
+            records[k] = _parse_record(text)
+
     #calculate number of threads required
     _nThread = int(1)
-    listLen = len(ids)
+    listLen = len(to_fetch)
     cpuCount = cpu_count()
     if nThread is None:
         _nThread = cpuCount if cpuCount < listLen else listLen
     else:
         _nThread = nThread
 
-    sys.stdout.write('Searching for data with {} thread(s)...\n'.format(_nThread))
-    ret = list()
-    if show_bar:
-        with Pool(processes=_nThread) as pool:
-            ret = list(tqdm(pool.imap(functools.partial(make_request, verbose=verbose), ids),
-                                 total = listLen,
-                                 miniters=1,
-                                 file = sys.stdout))
-    else:
-        length = len(ids)
-        for i, it in enumerate(ids):
-            sys.stdout.write('Working on {} of {}\n'.format(i, length))
-            ret.append(make_request(it, verbose=verbose))
+    _scheduler = Retry.RetryScheduler(verbose=verbose) if scheduler is None else scheduler
+
+    # records are parsed as soon as each request completes
+    fetched = dict()
+    failed = list()
+    def _add_result(k, ok, text):
+        records[k] = _parse_record(text)
+        if not ok:
+            failed.append(k)
+            return
+        if cache is not None:
+            fetched[k] = text
+            if len(fetched) >= CACHE_FLUSH_SIZE:
+                cache.put_many(fetched)
+                fetched.clear()
+        if journal is not None:
+            journal.add_uniprot(k, text)
+
+    if listLen > 0:
+        if queue is not None:
+            sys.stdout.write('Waiting for workers to retrieve records from {}...\n'.format(queue.queue_dir))
+            chunks = [to_fetch[i:i + QUEUE_CHUNK_SIZE] for i in range(0, listLen, QUEUE_CHUNK_SIZE)]
+            payloads = [{'ids': x, 'n_retry': _scheduler.n_retry, 'timeout': _scheduler.timeout} for x in chunks]
+            with tqdm(total=listLen, miniters=1, file=sys.stdout, disable=not show_bar) as bar:
+                for _, results in queue.map('uniprot', payloads):
+                    for k, ok, text in results:
+                        _add_result(k, ok, text)
+                    bar.update(len(results))
+
+        elif engine == 'async':
+            _max_in_flight = _nThread if max_in_flight is None else max_in_flight
+            sys.stdout.write('Searching for data with {} concurrent connection(s)...\n'.format(_max_in_flight))
+            fetcher = AsyncFetch.AsyncFetcher(url=AsyncFetch.UNIPROT_URL, max_in_flight=_max_in_flight,
+                                              scheduler=_scheduler, verbose=verbose)
+            with tqdm(total=listLen, miniters=1, file=sys.stdout, disable=not show_bar) as bar:
+                def _callback(k, ok, text):
+                    _add_result(k, ok, text)
+                    bar.update()
+                fetcher.fetch_all(to_fetch, callback=_callback)
+
+        elif show_bar:
+            sys.stdout.write('Searching for data with {} thread(s)...\n'.format(_nThread))
+            _scheduler.set_concurrency(_nThread)
+            with Pool(processes=_nThread) as pool:
+                for k, (ok, text) in zip(to_fetch, tqdm(pool.imap(functools.partial(fetch_raw, verbose=verbose,
+                                                                                     scheduler=_scheduler), to_fetch),
+                                                        total = listLen,
+                                                        miniters=1,
+                                                        file = sys.stdout)):
+                    _add_result(k, ok, text)
+        else:
+            sys.stdout.write('Searching for data with {} thread(s)...\n'.format(_nThread))
+            _scheduler.set_concurrency(1)
+            for i, it in enumerate(to_fetch):
+                sys.stdout.write('Working on {} of {}\n'.format(i, listLen))
+                _add_result(it, *fetch_raw(it, verbose=verbose, scheduler=_scheduler))
+        _scheduler.shutdown()
+
+    assert(len(records) == len(set(_ids)))
+    if failed:
+        sys.stderr.write('WARN: Failed to retrieve {} UniProt record(s){}:\n\t{}\n'.format(len(failed),
+                         ' (UniProt appears to be unavailable)' if _scheduler.breaker.is_open() else '',
+                         '\n\t'.join(sorted(failed))))
+    if cache is not None:
+        cache.put_many(fetched)
 
-    assert(len(ids) == len(ret))
-    return {k: record for k, record in zip(ids, ret)}
+    return {k: records[k] for k in _ids}
 
 
 def protein_location(record):
@@ -148,6 +308,94 @@ def cys_position(protein_seq, peptide_seq, mod_loc):
     return cys_loc
 
 
+class FeatureIndex():
+    '''
+    Interval index over the features in a SwissProt record.
+
+    Feature locations are checked and converted once when the index is built.
+    The sequence is split into segments at every feature start and end, and the
+    annotation strings for the domains, simplified feature list and all features
+    overlapping each segment are joined ahead of time. Looking up a residue is then
+    a binary search for the segment containing it.
+
+    Parameters
+    ----------
+    intervals: iterable
+        Feature locations as (start, end, type, label) tuples.
+        (See ProteinRecord.feature_intervals)
+    '''
+
+    def __init__(self, intervals):
+        _intervals = list()
+        for start, end, feature_type, label in intervals:
+            if start >= end:
+                continue
+            feature_type = feature_type.upper()
+            is_domain = feature_type == 'DOMAIN'
+            is_simple = feature_type == 'DISULFID' or (feature_type in features_list and (end - start) <= 10)
+            _intervals.append((start, end, label, is_domain, is_simple))
+        intervals = _intervals
+
+        self._breakpoints = sorted(set([x[0] for x in intervals] + [x[1] for x in intervals]))
+        n_segments = max(0, len(self._breakpoints) - 1)
+        domains = [list() for _ in range(n_segments)]
+        simple = [list() for _ in range(n_segments)]
+        everything = [list() for _ in range(n_segments)]
+
+        # intervals are added in record order so the annotation strings are in the same order as the features
+        for start, end, label, is_domain, is_simple in intervals:
+            for i in range(bisect_left(self._breakpoints, start), bisect_left(self._breakpoints, end)):
+                everything[i].append(label)
+                if is_domain:
+                    domains[i].append(label)
+                if is_simple:
+                    simple[i].append(label)
+
+        self._domains = [''.join(x) for x in domains]
+        self._simple = [''.join(x) for x in simple]
+        self._all = [''.join(x) for x in everything]
+
+    def __len__(self):
+        return len(self._all)
+
+    def lookup(self, position, all_features=False):
+        '''
+        Get feature and domain annotations at `position`.
+
+        Parameters
+        ----------
+        position: int
+            Index (starting from 0) of the residue of interest.
+        all_features: bool
+            Should all features or simplified list be used?
+
+        Returns
+        -------
+        res_features, domains: str, str
+        '''
+
+        i = bisect_right(self._breakpoints, int(position)) - 1
+        if i < 0 or i >= len(self._all):
+            return '', ''
+        return (self._all[i] if all_features else self._simple[i]), self._domains[i]
+
+
+def get_feature_index(record):
+    '''
+    Get FeatureIndex for `record`.
+    The index is built the first time it is requested and stored on the record.
+    '''
+
+    index = getattr(record, '_feature_index', None)
+    if index is None:
+        if isinstance(record, ProteinRecord.ProteinRecord):
+            index = FeatureIndex(record.iterfeatures())
+        else:
+            index = FeatureIndex(ProteinRecord.feature_intervals(record.features))
+        record._feature_index = index
+    return index
+
+
 def res_features(record, position, all_features=False):
     '''
     Get residue function annotation at `position` if it exists in `record`.
@@ -156,7 +404,7 @@ def res_features(record, position, all_features=False):
     ----------
     position: int
         Index (starting from 0) of the residue of interest.
-    record: Bio.SwissProt.Record
+    record: ProteinRecord.ProteinRecord or Bio.SwissProt.Record
         Record to get data from.
     all_features: bool
         Should all features or simplified list be used?
@@ -165,35 +413,11 @@ def res_features(record, position, all_features=False):
     -------
     res_features: str
         Annotaton for cysteine function.
+    domains: str
+        Domain annotation at `position`.
     '''
 
-    ret = ''
-    domains = ''
-    for feature in record.features:
-        try:
-            if feature.type.upper() == 'DOMAIN' and \
-                 str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
-                 int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
-                     domains += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
-            if all_features:
-                if str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
-                   int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
-                    ret += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
-            else:
-                if feature.type.upper() == 'DISULFID' and \
-                   str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
-                   int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
-                    ret += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
-
-                elif feature.type.upper() in features_list and \
-                     str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
-                     (int(feature.location.end) - int(feature.location.start)) <= 10 and \
-                     int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
-                    ret += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
-        except TypeError as e:
-            continue
-
-    return ret, domains
+    return get_feature_index(record).lookup(position, all_features=all_features)
 
 def parse_domains(domain_s):
     ret = ''
@@ -202,12 +426,51 @@ def parse_domains(domain_s):
         ret = '|'.join(set(m))
     return ret
 
-def ExPasy(sequence, record, all_features=False, res_sep='|', fxn_sep='!', combine_method=1):
+def _combine_sites(positions, functions, domains, res_sep, fxn_sep, domain_parser=None):
+    '''
+    Combine annotations of each modified site in a peptide.
+    '''
+
+    function = ''
+    domain = ''
+    position = res_sep.join(positions)
+    if ''.join(functions):
+        function = functions[0] if len(functions) == 1 else fxn_sep.join(['{}:{}'.format(p, s) for p, s in zip(positions, functions)])
+    if ''.join(domains):
+        domain = domains[0] if len(domains) == 1 else fxn_sep.join(['{}:{}'.format(p, s) for p, s in zip(positions, domains)])
+        domain = parse_domains(domain) if domain_parser is None else domain_parser(domain)
+    return position, function, domain
+
+
+def ExPasy(sequence, record, all_features=False, res_sep='|', fxn_sep='!', combine_method=1, sites=None):
+    '''
+    Get UniProt annotations for peptide.
+
+    Parameters
+    ----------
+    sequence: str
+        Peptide sequence with modified residues marked by '*'.
+    record: ProteinRecord.ProteinRecord
+        Parent protein record.
+    all_features: bool
+        Should all features or simplified list be used?
+    res_sep: str
+        Separator for multiple positions.
+    fxn_sep: str
+        Separator for annotations of multiple positions.
+    sites: tuple
+        Index of each modified residue in the parent protein (starting from 0), or -1
+        if the peptide was not found (see PeptideMapper.map_all). If None, the sites
+        are found by searching for every occurrence of `sequence` in the protein.
+
+    Returns
+    -------
+    organism, position, function, domain, full_sequence, pro_location: str
+    '''
 
     if combine_method != 1:
         raise NotImplementedError('combine_method {} not implemented.'.format(combine_method))
 
-    seq_no_mod = sequence.replace('*', '')
     position = ''
     function = ''
     domain = ''
@@ -220,12 +483,16 @@ def ExPasy(sequence, record, all_features=False, res_sep='|', fxn_sep='!', combi
         pro_location = protein_location(record)
         full_sequence = record.sequence
 
+        if sites is None:
+            seq_no_mod = sequence.replace('*', '')
+            mod_locs = [x.start() - (i + 1) for i, x in enumerate(re.finditer(r'\*', sequence))]
+            sites = PeptideMapper.site_positions(PeptideMapper.find_all(full_sequence, [seq_no_mod])[seq_no_mod],
+                                                 mod_locs)
+
         positions = list()
         functions = list()
         domains = list()
-        for i, x in enumerate(re.finditer('\*', sequence)):
-            mod_loc = x.start()-(i+1)
-            cys_pos = cys_position(full_sequence, seq_no_mod, mod_loc)
+        for cys_pos in sites:
             if cys_pos == -1:
                 positions.append('RESIDUE_NOT_FOUND')
             else:
@@ -234,14 +501,125 @@ def ExPasy(sequence, record, all_features=False, res_sep='|', fxn_sep='!', combi
                 functions.append(functions_t)
                 domains.append(domains_t)
 
-        position = res_sep.join(positions)
-        if ''.join(functions):
-            function = functions[0] if len(functions) == 1 else fxn_sep.join(['{}:{}'.format(p, s) for p, s in zip(positions, functions)])
-        if ''.join(domains):
-            domain = domains[0] if len(domains) == 1 else fxn_sep.join(['{}:{}'.format(p, s) for p, s in zip(positions, domains)])
-            domain = parse_domains(domain)
+        position, function, domain = _combine_sites(positions, functions, domains, res_sep, fxn_sep)
 
     else:
         position = 'BAD_ID'
     return organism, position, function, domain, full_sequence, pro_location
 
+
+class Annotator():
+    '''
+    Annotate peptides grouped by parent protein.
+
+    Protein level data (organism, subcellular location, sequence and feature index)
+    is computed once for each protein. Residue annotations are memoized by
+    (protein, position) and peptide annotations by (protein, sites), so
+    repeated peptides and sites are only looked up once.
+
+    Parameters
+    ----------
+    records: dict
+        Key value pairs of protein IDs and ProteinRecord.ProteinRecord objects.
+    all_features: bool
+        Should all features or simplified list be used?
+    res_sep: str
+        Separator for multiple positions.
+    fxn_sep: str
+        Separator for annotations of multiple positions.
+
+    Examples
+    --------
+    >>> annotator = Annotator(record_dict)
+    >>> organism, position, function, domain, sequence, location = annotator.annotate('P26641', match.sites)
+    '''
+
+    def __init__(self, records, all_features=False, res_sep='|', fxn_sep='!'):
+        self.records = records
+        self.all_features = all_features
+        self.res_sep = res_sep
+        self.fxn_sep = fxn_sep
+        self._proteins = dict()
+        self._sites = dict()
+        self._peptides = dict()
+        self._domains = dict()
+
+    def protein(self, uniprot_id):
+        '''
+        Get protein level data.
+
+        Returns
+        -------
+        organism, location, sequence: str, str, str
+            None if there is no record for `uniprot_id`.
+        '''
+
+        if uniprot_id not in self._proteins:
+            record = self.records.get(uniprot_id)
+            if record is None:
+                self._proteins[uniprot_id] = None
+            else:
+                get_feature_index(record)
+                self._proteins[uniprot_id] = (record.organism, protein_location(record), record.sequence)
+        return self._proteins[uniprot_id]
+
+    def site(self, uniprot_id, position):
+        '''
+        Get residue annotation at `position` (starting from 0) in protein.
+
+        Returns
+        -------
+        res_features, domains: str, str
+        '''
+
+        key = (uniprot_id, position)
+        if key not in self._sites:
+            self._sites[key] = res_features(self.records[uniprot_id], position, all_features=self.all_features)
+        return self._sites[key]
+
+    def _parse_domains(self, domain_s):
+        if domain_s not in self._domains:
+            self._domains[domain_s] = parse_domains(domain_s)
+        return self._domains[domain_s]
+
+    def annotate(self, uniprot_id, sites):
+        '''
+        Get annotations for a peptide.
+
+        Parameters
+        ----------
+        uniprot_id: str
+            Parent protein ID.
+        sites: tuple
+            Index of each modified residue in the parent protein (starting from 0), or -1
+            if the peptide was not found (see PeptideMapper.map_all).
+
+        Returns
+        -------
+        organism, position, function, domain, full_sequence, pro_location: str
+            Same values as ExPasy.
+        '''
+
+        protein = self.protein(uniprot_id)
+        if protein is None:
+            return '', 'BAD_ID', '', '', '', ''
+
+        key = (uniprot_id, tuple(sites))
+        if key not in self._peptides:
+            positions = list()
+            functions = list()
+            domains = list()
+            for cys_pos in sites:
+                if cys_pos == -1:
+                    positions.append('RESIDUE_NOT_FOUND')
+                else:
+                    positions.append(str(cys_pos + 1)) # convert to 1 based indexing here
+                    functions_t, domains_t = self.site(uniprot_id, cys_pos)
+                    functions.append(functions_t)
+                    domains.append(domains_t)
+            self._peptides[key] = _combine_sites(positions, functions, domains, self.res_sep, self.fxn_sep,
+                                                 domain_parser=self._parse_domains)
+
+        organism, pro_location, full_sequence = protein
+        position, function, domain = self._peptides[key]
+        return organism, position, function, domain, full_sequence, pro_location
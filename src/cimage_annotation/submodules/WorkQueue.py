@@ -0,0 +1,393 @@
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import threading
+import traceback
+
+TASK_DIR = 'tasks'
+CLAIMED_DIR = 'claimed'
+RESULT_DIR = 'results'
+
+DEFAULT_LEASE = 600
+DEFAULT_POLL = 1
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class TaskFailed(RuntimeError):
+    ''' Raised by WorkQueue.map when a task failed on every attempt. '''
+    pass
+
+
+def _write_atomic(fname, data):
+    ''' Write data to a temporary file and rename it to fname so readers never see a partial file. '''
+    tmp = os.path.join(os.path.dirname(fname), '.{}.{}.{}.tmp'.format(os.path.basename(fname),
+                                                                       socket.gethostname(), os.getpid()))
+    with open(tmp, 'w') as outF:
+        json.dump(data, outF, separators=(',', ':'))
+        outF.flush()
+        os.fsync(outF.fileno())
+    os.rename(tmp, fname)
+
+
+def _read(fname):
+    with open(fname, 'r') as inF:
+        return json.load(inF)
+
+
+def _remove(fname):
+    try:
+        os.remove(fname)
+    except FileNotFoundError:
+        pass
+
+
+class WorkQueue():
+    '''
+    Task queue in a directory on a shared file system.
+
+    The coordinating process writes each task to a file in `tasks/`.
+    A worker claims a task by renaming its file to `claimed/`, which only one
+    worker can do successfully. While a task is running, the worker touches the
+    claimed file every few seconds. Claimed tasks which have not been touched for
+    `lease` seconds belong to a dead worker and are moved back to `tasks/`.
+    Results are written to `results/` with an atomic rename.
+
+    Each claim counts as an attempt. A task which fails (its handler raises or
+    its lease expires) after `max_attempts` attempts is not run again. An error
+    result is written for it instead, and map raises TaskFailed.
+
+    A worker whose lease expired may still finish its task after the task was
+    given to another worker. complete and fail are passed the attempt number of
+    the worker's claim and do nothing unless the claimed file is still from that
+    attempt, so only the current claim can finish or requeue the task.
+
+    Parameters
+    ----------
+    queue_dir: str
+        Path to queue directory. Created if it does not exist.
+    lease: float
+        Number of seconds after the last heartbeat before a claimed task is given to another worker.
+    poll: float
+        Number of seconds to wait between checks for new tasks or results.
+    max_attempts: int
+        Maximum number of times a task is claimed. Stored in each task submitted by this queue.
+
+    Examples
+    --------
+    Coordinator:
+    >>> queue = WorkQueue('/shared/queue')
+    >>> for i, result in queue.map('uniprot', payloads):
+    ...     pass
+
+    Worker:
+    >>> queue = WorkQueue('/shared/queue')
+    >>> task_id, task = queue.claim()
+    >>> queue.complete(task_id, handlers[task['kind']](task['payload']), task['attempts'])
+    '''
+
+    def __init__(self, queue_dir, lease=DEFAULT_LEASE, poll=DEFAULT_POLL, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.lease = lease
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self._run_id = uuid.uuid4().hex[:12]
+        self._n_tasks = 0
+        for d in (TASK_DIR, CLAIMED_DIR, RESULT_DIR):
+            os.makedirs(os.path.join(self.queue_dir, d), exist_ok=True)
+
+    def _path(self, d, task_id):
+        return os.path.join(self.queue_dir, d, '{}.json'.format(task_id))
+
+    def submit(self, kind, payload):
+        '''
+        Add task to queue.
+
+        Parameters
+        ----------
+        kind: str
+            Task type. Used by workers to choose the task handler.
+        payload: object
+            JSON serializable task arguments.
+
+        Returns
+        -------
+        task_id: str
+        '''
+        task_id = '{}-{:08d}'.format(self._run_id, self._n_tasks)
+        self._n_tasks += 1
+        _write_atomic(self._path(TASK_DIR, task_id), {'kind': kind, 'payload': payload, 'attempts': 0,
+                                                      'max_attempts': self.max_attempts})
+        return task_id
+
+    def _retry(self, task_id, claimed, error, attempt=None):
+        '''
+        Move a failed claimed task back to the queue, or write an error result
+        if it has no attempts left.
+
+        Returns
+        -------
+        requeued: bool
+        '''
+        try:
+            task = _read(claimed)
+        except (FileNotFoundError, ValueError):
+            # finished or handled by another process
+            return False
+        if attempt is not None and task.get('attempts') != attempt:
+            # claimed again by another worker
+            return False
+        if task.get('attempts', 0) >= task.get('max_attempts', DEFAULT_MAX_ATTEMPTS):
+            _write_atomic(self._path(RESULT_DIR, task_id),
+                          {'error': error, 'attempts': task.get('attempts', 0)})
+            _remove(claimed)
+            return False
+        try:
+            os.rename(claimed, self._path(TASK_DIR, task_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def requeue_expired(self):
+        '''
+        Move claimed tasks with expired leases back to the queue.
+        Tasks with no attempts left get an error result instead.
+
+        Returns
+        -------
+        n_requeued: int
+        '''
+        n_requeued = 0
+        now = time.time()
+        for name in os.listdir(os.path.join(self.queue_dir, CLAIMED_DIR)):
+            if not name.endswith('.json'):
+                continue
+            claimed = os.path.join(self.queue_dir, CLAIMED_DIR, name)
+            try:
+                expired = now - os.path.getmtime(claimed) > self.lease
+            except FileNotFoundError:
+                # task finished or was requeued by another process
+                continue
+            if expired and self._retry(name[:-len('.json')], claimed, 'lease expired'):
+                n_requeued += 1
+        return n_requeued
+
+    def claim(self):
+        '''
+        Claim the oldest task in the queue.
+
+        Returns
+        -------
+        task: tuple
+            (task_id, task) tuple where task is a dict with 'kind' and 'payload' keys,
+            or None if there are no tasks.
+        '''
+        for name in sorted(x for x in os.listdir(os.path.join(self.queue_dir, TASK_DIR)) if x.endswith('.json')):
+            pending = os.path.join(self.queue_dir, TASK_DIR, name)
+            claimed = os.path.join(self.queue_dir, CLAIMED_DIR, name)
+            try:
+                # start the lease before the claim so the claimed file is never expired
+                os.utime(pending)
+                os.rename(pending, claimed)
+                task = _read(claimed)
+            except FileNotFoundError:
+                # claimed by another worker
+                continue
+            task['attempts'] = task.get('attempts', 0) + 1
+            _write_atomic(claimed, task)
+            return name[:-len('.json')], task
+        return None
+
+    def heartbeat(self, task_id):
+        ''' Renew the lease of a claimed task. '''
+        try:
+            os.utime(self._path(CLAIMED_DIR, task_id))
+        except FileNotFoundError:
+            pass
+
+    def _is_claimed(self, task_id, attempt=None):
+        '''
+        Is the task still claimed? If `attempt` is given, the claim must also be from that attempt.
+        '''
+        try:
+            task = _read(self._path(CLAIMED_DIR, task_id))
+        except (FileNotFoundError, ValueError):
+            # finished or requeued by another process
+            return False
+        return attempt is None or task.get('attempts') == attempt
+
+    def complete(self, task_id, result, attempt=None):
+        '''
+        Write the result of a claimed task and remove it from the queue.
+
+        Parameters
+        ----------
+        task_id: str
+            ID of claimed task.
+        result: object
+            JSON serializable task result.
+        attempt: int
+            Attempt number of the claim, from the task returned by claim.
+            If None, any claim of the task is completed.
+
+        Returns
+        -------
+        completed: bool
+            False if the task is no longer claimed by this attempt. The result is discarded.
+        '''
+        if not self._is_claimed(task_id, attempt):
+            return False
+        _write_atomic(self._path(RESULT_DIR, task_id), {'result': result})
+        _remove(self._path(CLAIMED_DIR, task_id))
+        return True
+
+    def fail(self, task_id, error, attempt=None):
+        '''
+        Give up a claimed task whose handler raised an exception.
+        The task is given to another worker unless it has no attempts left.
+
+        Parameters
+        ----------
+        task_id: str
+            ID of claimed task.
+        error: str
+            Description of the error.
+        attempt: int
+            Attempt number of the claim, from the task returned by claim.
+            If None, any claim of the task is given up.
+        '''
+        self._retry(task_id, self._path(CLAIMED_DIR, task_id), error, attempt=attempt)
+
+    def map(self, kind, payloads):
+        '''
+        Submit a task for each payload and wait for workers to finish them.
+
+        Parameters
+        ----------
+        kind: str
+            Task type.
+        payloads: list
+            JSON serializable task arguments.
+
+        Yields
+        ------
+        result: tuple
+            (index, result) tuple for each payload in the order the tasks finish.
+
+        Raises
+        ------
+        TaskFailed
+            If a task failed on every attempt.
+        '''
+
+        task_ids = dict()
+        for i, payload in enumerate(payloads):
+            task_ids[self.submit(kind, payload)] = i
+
+        result_dir = os.path.join(self.queue_dir, RESULT_DIR)
+        try:
+            while task_ids:
+                finished = list()
+                for name in os.listdir(result_dir):
+                    if not name.endswith('.json'):
+                        continue
+                    task_id = name[:-len('.json')]
+                    if task_id in task_ids:
+                        finished.append(task_id)
+                    elif task_id.startswith(self._run_id + '-'):
+                        # late result of a task which has already finished
+                        _remove(os.path.join(result_dir, name))
+                for task_id in finished:
+                    result = _read(self._path(RESULT_DIR, task_id))
+                    _remove(self._path(RESULT_DIR, task_id))
+                    _remove(self._path(TASK_DIR, task_id))
+                    index = task_ids.pop(task_id)
+                    if 'error' in result:
+                        raise TaskFailed('{} task {} (payload {}) failed after {} attempt(s):\n{}'.format(
+                                         kind, task_id, index, result['attempts'], result['error']))
+                    yield index, result['result']
+                if not finished:
+                    self.requeue_expired()
+                    time.sleep(self.poll)
+        finally:
+            # don't leave unfinished tasks in the queue
+            for task_id in task_ids:
+                for d in (TASK_DIR, CLAIMED_DIR, RESULT_DIR):
+                    _remove(self._path(d, task_id))
+
+
+def run_worker(queue, handlers, n_threads=1, idle_timeout=0, verbose=False):
+    '''
+    Claim and run tasks from `queue` until it has been empty for `idle_timeout` seconds.
+
+    Parameters
+    ----------
+    queue: WorkQueue
+        Queue to claim tasks from.
+    handlers: dict
+        Key value pairs of task kinds and functions which take a task payload
+        and return a JSON serializable result.
+    n_threads: int
+        Number of tasks to run at the same time.
+    idle_timeout: float
+        Number of seconds without tasks before exiting. If <= 0, run until killed.
+
+    Returns
+    -------
+    n_tasks: int
+        Number of tasks finished.
+    '''
+
+    lock = threading.Lock()
+    state = {'n_tasks': 0, 'last_task': time.time(), 'running': 0}
+
+    def _heartbeat(task_id, stop):
+        while not stop.wait(max(0.1, queue.lease / 4)):
+            queue.heartbeat(task_id)
+
+    def _loop():
+        while True:
+            claimed = queue.claim()
+            if claimed is None:
+                with lock:
+                    idle = state['running'] == 0 and time.time() - state['last_task'] > idle_timeout
+                if idle_timeout > 0 and idle:
+                    return
+                queue.requeue_expired()
+                time.sleep(queue.poll)
+                continue
+
+            task_id, task = claimed
+            with lock:
+                state['running'] += 1
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat, args=(task_id, stop), daemon=True)
+            heartbeat.start()
+            try:
+                if verbose:
+                    sys.stdout.write('Running {} task {}\n'.format(task['kind'], task_id))
+                result = handlers[task['kind']](task['payload'])
+                if not queue.complete(task_id, result, task['attempts']) and verbose:
+                    sys.stdout.write('Discarded result of {} task {}. Its lease expired.\n'.format(task['kind'], task_id))
+            except Exception:
+                error = traceback.format_exc()
+                sys.stderr.write('ERROR: {} task {} failed on attempt {}:\n{}'.format(task['kind'], task_id,
+                                                                                     task['attempts'], error))
+                queue.fail(task_id, error, task['attempts'])
+            finally:
+                stop.set()
+                heartbeat.join()
+                with lock:
+                    state['running'] -= 1
+                    state['n_tasks'] += 1
+                    state['last_task'] = time.time()
+
+    threads = [threading.Thread(target=_loop) for _ in range(max(1, n_threads))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return state['n_tasks']
@@ -1,3 +1,4 @@
 
-from .dataframe import DataFrame
-from .dataframe import read_tsv
+from .dataframe import DataFrame, RowView
+from .dataframe import StringColumn, NumericColumn
+from .dataframe import read_tsv, open_file, resolve_compression
@@ -1,6 +1,280 @@
 
+import os
 import sys
 import csv
+import gzip
+import importlib.util
+import operator
+import itertools
+
+import numpy as np
+
+
+# Size of write buffer for uncompressed files
+_WRITE_BUFFER_SIZE = 1 << 20
+
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+
+def resolve_compression(fname, compression='infer'):
+    '''
+    Get compression used by open_file for `fname`.
+
+    Returns
+    -------
+    compression: str
+        'gzip', 'zstd' or None.
+
+    Raises
+    ------
+    ValueError
+        If `compression` is not a known compression.
+    RuntimeError
+        If `compression` is zstd and the zstandard package is not installed.
+    '''
+
+    if compression == 'infer':
+        compression = COMPRESSION_EXTENSIONS.get(os.path.splitext(fname)[1].lower())
+    if compression not in (None, 'gzip', 'zstd'):
+        raise ValueError('Unknown compression: {}'.format(compression))
+    if compression == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        raise RuntimeError('zstd compression requires the zstandard package. '
+                           'Install it with: pip install zstandard')
+    return compression
+
+
+def open_file(fname, mode='r', compression='infer'):
+    '''
+    Open text file with optional gzip or zstd compression.
+
+    Parameters
+    ----------
+    fname: str
+        Path to file.
+    mode: str
+        'r', 'w' or 'a'.
+    compression: str
+        'gzip', 'zstd', None or 'infer'. If 'infer', the compression is chosen from the
+        file extension (.gz or .zst) and files with other extensions are not compressed.
+
+    Returns
+    -------
+    file: file object
+        Text file object.
+
+    Raises
+    ------
+    ValueError
+        If `compression` is not a known compression.
+    RuntimeError
+        If `compression` is zstd and the zstandard package is not installed.
+    '''
+
+    compression = resolve_compression(fname, compression)
+    if compression == 'gzip':
+        return gzip.open(fname, mode + 't', compresslevel=6)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.open(fname, mode + 't')
+    return open(fname, mode, buffering=_WRITE_BUFFER_SIZE)
+
+
+def _is_number(x):
+    return isinstance(x, (int, float, np.integer, np.floating)) and not isinstance(x, (bool, np.bool_))
+
+
+class StringColumn(object):
+    '''
+    Column of strings.
+
+    Each distinct value is stored once and rows store an integer code for their value,
+    so columns with many repeated values (protein IDs, blank annotation columns) are small.
+    Values which are not strings are converted with str.
+
+    Parameters
+    ----------
+    values: list like
+        Column values.
+    '''
+
+    def __init__(self, values=()):
+        self._lookup = dict()
+        self.categories = list()
+        self.codes = self._encode(values)
+
+    @classmethod
+    def full(cls, n, value):
+        ''' Make column of length `n` where every row is `value`. '''
+        ret = cls()
+        ret.codes = np.full(n, ret._code(value), dtype=np.int32)
+        return ret
+
+    def _code(self, value):
+        value = value if isinstance(value, str) else str(value)
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.categories)
+            self._lookup[value] = code
+            self.categories.append(value)
+        return code
+
+    def _encode(self, values):
+        lookup = self._lookup
+        new = list(set(values).difference(lookup))
+        if set(map(type, new)) <= {str}:
+            lookup.update(zip(new, range(len(self.categories), len(self.categories) + len(new))))
+            self.categories.extend(new)
+        else:
+            for x in new:
+                self._code(x)
+        try:
+            return np.fromiter(map(lookup.__getitem__, values), dtype=np.int32, count=len(values))
+        except KeyError:
+            # values which are not strings
+            return np.fromiter(map(self._code, values), dtype=np.int32, count=len(values))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.categories[self.codes[i]]
+
+    def __setitem__(self, i, value):
+        self.codes[i] = self._code(value)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def tolist(self, start=0, stop=None):
+        categories = self.categories
+        return [categories[x] for x in self.codes[start:stop].tolist()]
+
+    def set_values(self, index, values):
+        ''' Set rows at each position in `index` to the corresponding value in `values`. '''
+        self.codes[index] = self._encode(values)
+
+    def take(self, index):
+        '''
+        Make new column with rows at each position in `index`.
+
+        The new column shares the table of distinct values with this column.
+        Codes are never reassigned, so values added to either column do not change the other.
+        '''
+        ret = StringColumn()
+        ret._lookup = self._lookup
+        ret.categories = self.categories
+        ret.codes = self.codes[index]
+        return ret
+
+
+class NumericColumn(object):
+    '''
+    Column of numbers stored in a NumPy array.
+
+    Parameters
+    ----------
+    values: list like
+        Column values.
+    '''
+
+    def __init__(self, values=()):
+        self.values = np.asarray(values)
+        if self.values.dtype.kind not in 'iuf':
+            self.values = self.values.astype(float)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i].item()
+
+    def __setitem__(self, i, value):
+        self.set_values([i], [value])
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def tolist(self, start=0, stop=None):
+        return self.values[start:stop].tolist()
+
+    def set_values(self, index, values):
+        ''' Set rows at each position in `index` to the corresponding value in `values`. '''
+        values = np.asarray(values)
+        if values.dtype.kind == 'f' and self.values.dtype.kind != 'f':
+            self.values = self.values.astype(float)
+        self.values[index] = values
+
+    def take(self, index):
+        ''' Make new column with rows at each position in `index`. '''
+        return NumericColumn(self.values[index])
+
+
+def _make_column(values):
+    '''
+    Make NumericColumn if all `values` are numbers and StringColumn otherwise.
+    '''
+    if isinstance(values, (StringColumn, NumericColumn)):
+        return values
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iuf':
+        return NumericColumn(values)
+    if len(values) > 0 and all(_is_number(x) for x in values):
+        return NumericColumn(values)
+    return StringColumn(values)
+
+
+class RowView(object):
+    '''
+    Read only view of one DataFrame row with dict style access.
+
+    DataFrame.iterrows yields the same RowView for every row, so the
+    values of a previous row can not be accessed after moving to the next row.
+    Use dict(row) to keep a copy.
+
+    Parameters
+    ----------
+    keys: dict
+        Key value pairs of column names and the index of each column in the row.
+    '''
+
+    __slots__ = ('_keys', '_row')
+
+    def __init__(self, keys):
+        self._keys = keys
+        self._row = ()
+
+    def __getitem__(self, key):
+        return self._row[self._keys[key]]
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, key, default=None):
+        i = self._keys.get(key)
+        return default if i is None else self._row[i]
+
+    def keys(self):
+        return self._keys.keys()
+
+    def values(self):
+        return list(self._row)
+
+    def items(self):
+        return list(zip(self._keys, self._row))
 
 
 class DataFrame(object):
@@ -9,6 +283,10 @@ class DataFrame(object):
     functionality as a Pandas.DataFrame without having to
     import the entire Pandas library.
 
+    Columns are stored by type. Columns where every value is a number are stored
+    in a NumPy array (NumericColumn). All other columns are stored as strings, with
+    each distinct string stored once (StringColumn).
+
     Parameters
     ----------
     data: dict, default None
@@ -63,9 +341,21 @@ class DataFrame(object):
     QSVSC*DEC*IPLPR
     DFTPVC*TTELGR
         ...
+
+    Set many values of a column at once with set_values.
+
+    >>> dat.set_values('another_column', [0, 2], ['a', 'b'])
+
+    Select rows with a boolean mask or list of row indices with filter,
+    and get the row indices for each value of a column with groupby.
+
+    >>> dat.filter(np.array(dat['another_column'].tolist()) != '')
+    >>> dat.groupby('ID')
+    {'P26641': array([0]), 'Q9NTZ6': array([1]), ...
     '''
 
     _MAX_REPR_PRINT = 100
+    _BLOCK_SIZE = 4096
 
     def __init__(self, data=None):
         self.columns = list()
@@ -81,7 +371,7 @@ class DataFrame(object):
                     raise ValueError('arrays must all be same length')
                 self.columns.append(k)
                 self._keys[k] = i
-                self._data.append(v)
+                self._data.append(_make_column(v))
             self.nrow = len(self._data[0])
             self.ncol = len(self.columns)
 
@@ -106,9 +396,10 @@ class DataFrame(object):
         return ret
 
     def __setitem__(self, col, value):
-        if not isinstance(value, list):
+        if not isinstance(value, (list, np.ndarray, StringColumn, NumericColumn)):
             raise ValueError('value must be of type {}. Received {}'.format(type(self._data),
                                                                             type(value)))
+        value = _make_column(value)
         if not self.empty():
             if len(value) != len(self._data[0]):
                 raise ValueError('Attempting to add column of length {}'
@@ -124,6 +415,92 @@ class DataFrame(object):
             self._data.append(list())
         self._data[self._keys[col]] = value
 
+    def set_values(self, col, index, values):
+        '''
+        Set values of column at each row in `index`.
+
+        If `col` is not already in the DataFrame, it is added with '' in every row.
+        A NumericColumn is converted to a StringColumn if any of `values` are not numbers.
+
+        Parameters
+        ----------
+        col: str
+            Column name.
+        index: list like
+            Row indices.
+        values: list like
+            Value for each row in `index`.
+        '''
+
+        index = np.asarray(index, dtype=np.intp)
+        if len(index) != len(values):
+            raise ValueError('index and values must be the same length')
+        if col not in self._keys:
+            self[col] = StringColumn.full(self.nrow, '')
+
+        column = self._data[self._keys[col]]
+        if isinstance(column, NumericColumn) and not all(_is_number(x) for x in values):
+            column = StringColumn(column.tolist())
+            self._data[self._keys[col]] = column
+        column.set_values(index, values)
+
+    def filter(self, rows):
+        '''
+        Select rows.
+
+        Parameters
+        ----------
+        rows: list like
+            Boolean mask with an element for each row, or row indices.
+
+        Returns
+        -------
+        dataframe: DataFrame
+            New DataFrame with selected rows.
+        '''
+
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            if len(rows) != self.nrow:
+                raise ValueError('Boolean mask must have an element for each row')
+            rows = np.flatnonzero(rows)
+        rows = rows.astype(np.intp)
+
+        ret = DataFrame()
+        for c in self.columns:
+            ret[c] = self._data[self._keys[c]].take(rows)
+        return ret
+
+    def groupby(self, col):
+        '''
+        Group rows by the value of a column.
+
+        Parameters
+        ----------
+        col: str
+            Column name.
+
+        Returns
+        -------
+        groups: dict
+            Key value pairs of column values and arrays of row indices in ascending order.
+            Keys are in order of first appearance.
+        '''
+
+        column = self[col]
+        if isinstance(column, StringColumn):
+            codes = column.codes
+            labels = column.categories
+        else:
+            labels, codes = np.unique(column.values, return_inverse=True)
+            labels = labels.tolist()
+
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        groups = {int(sorted_codes[s]): g for s, g in zip(starts, np.split(order, starts[1:]))}
+        return {labels[c]: groups[c] for c in sorted(groups, key=lambda x: groups[x][0])}
+
     def _format_r_rows(self, r, print_header=True, delim=' '):
         '''
         Return formatted string with rows in range `r`.
@@ -161,29 +538,70 @@ class DataFrame(object):
         sys.stdout.write(self._format_r_rows(range(n), delim=delim))
 
 
-    def iterrows(self):
+    def iterrows(self, columns=None):
         '''
-        Iterate over DataFrame rows as (index, dict) pairs.
+        Iterate over DataFrame rows as (index, RowView) pairs.
+
+        The same RowView is updated and yielded for every row.
+        Values are read in blocks of rows, so values set while iterating
+        may not be seen in the following rows. Collect values and set them
+        with set_values after iterating instead.
+
+        Parameters
+        ----------
+        columns: list, default None
+            Columns to include in each row. If None, all columns are included.
 
         Yields
         ------
         index: int
             Row number starting from 0.
-        dat: dict
-            Dictionary with data from row.
+        dat: RowView
+            Dict like view of data from row.
+
+        Raises
+        ------
+        KeyError
+            If any of `columns` are not in DataFrame.
         '''
-        for i in range(self.nrow):
-            if i < self.nrow:
-                yield i, {col: self.__getitem__(col)[i] for col in self.columns}
 
-    def to_tsv(self, fname, sep='\t'):
+        columns = self.columns if columns is None else list(dict.fromkeys(columns))
+        for c in columns:
+            if c not in self._keys:
+                raise KeyError('{} is not a column in DataFrame!'.format(c))
+
+        row = RowView({c: i for i, c in enumerate(columns)})
+        for i, values in enumerate(self._iter_rows(columns)):
+            row._row = values
+            yield i, row
+
+    def _iter_rows(self, columns=None):
+        '''
+        Iterate over DataFrame rows as tuples.
+        Values are read from the columns in blocks of self._BLOCK_SIZE rows.
+        '''
+        columns = [self._data[self._keys[c]] for c in (self.columns if columns is None else columns)]
+        if not columns:
+            yield from (() for _ in range(self.nrow))
+            return
+        for start in range(0, self.nrow, self._BLOCK_SIZE):
+            stop = start + self._BLOCK_SIZE
+            yield from zip(*[c.tolist(start, stop) for c in columns])
+
+    def to_tsv(self, fname, sep='\t', header=True, mode='w', compression='infer'):
         '''
         Write DataFrame to file.
 
         Parameters
         ----------
-        fname: str
-            Path to file to write to.
+        fname: str or file object
+            Path to file to write to, or open text file.
+        header: bool
+            Write column names on the first line?
+        mode: str
+            Mode to open `fname` with. Use 'a' to append rows to an existing file.
+        compression: str
+            'gzip', 'zstd', None or 'infer'. See open_file.
 
         Raises
         ------
@@ -191,19 +609,162 @@ class DataFrame(object):
             If output directory does not exist.
         '''
 
-        with open(fname, 'w') as outF:
-            outF.write('{}'.format(sep).join(self.columns))
+        if not isinstance(fname, str):
+            self._write_tsv(fname, sep, header)
+            return
+        with open_file(fname, mode, compression=compression) as outF:
+            self._write_tsv(outF, sep, header)
+
+    def _write_tsv(self, outF, sep, header):
+        '''
+        Write DataFrame to open file in blocks of self._BLOCK_SIZE rows.
+        '''
+        if header:
+            outF.write(sep.join(self.columns))
+            outF.write('\n')
+
+        columns = [self._data[self._keys[c]] for c in self.columns]
+        for start in range(0, self.nrow, self._BLOCK_SIZE):
+            stop = min(start + self._BLOCK_SIZE, self.nrow)
+            values = [c.tolist(start, stop) if isinstance(c, StringColumn) else
+                      list(map(str, c.tolist(start, stop))) for c in columns]
+            rows = map(sep.join, zip(*values)) if values else [''] * (stop - start)
+            outF.write('\n'.join(rows))
             outF.write('\n')
-            for i in range(self.nrow):
-                for row_i, c in enumerate(self.columns):
-                    if row_i == 0:
-                        outF.write(self.__getitem__(c)[i])
-                    else:
-                        outF.write('{}{}'.format(sep, self.__getitem__(c)[i]))
-                outF.write('\n')
 
 
-def read_tsv(fname, hasHeader=True):
+# Number of lines used to detect the file format
+_SNIFF_LINES = 20
+
+
+def _sniff(inF):
+    '''
+    Detect the csv dialect of the first lines of `inF`.
+    The first line alone is used if the dialect can not be detected from all the lines.
+    Blank files are read as tab separated, so _iter_blocks can report them as empty.
+    '''
+    lines = [x for _, x in zip(range(_SNIFF_LINES), inF)]
+    inF.seek(0)
+    if not ''.join(lines).strip():
+        return csv.excel_tab
+    try:
+        return csv.Sniffer().sniff(''.join(lines))
+    except csv.Error:
+        return csv.Sniffer().sniff(lines[0] if lines else '')
+
+
+def _read_rows(inF, dialect, n_lines):
+    '''
+    Read and split the next `n_lines` lines of `inF`. Blank lines are skipped.
+
+    Lines are split on the delimiter directly unless the block contains the quote
+    character. Then the block (and any following lines of a multi line quoted field)
+    is parsed with csv.reader.
+
+    Returns
+    -------
+    rows: list
+        List of fields in each line.
+    eof: bool
+        True if the end of the file was reached.
+    '''
+
+    lines = list(itertools.islice(inF, n_lines))
+    eof = len(lines) < n_lines
+    quotechar = dialect.quotechar if dialect.quoting != csv.QUOTE_NONE else None
+
+    if dialect.skipinitialspace or dialect.escapechar is not None or \
+            (quotechar is not None and quotechar in ''.join(lines)):
+        lines_iter = iter(lines)
+        rows = list()
+        if lines:
+            for row in csv.reader(itertools.chain(lines_iter, inF), dialect):
+                if row:
+                    rows.append(row)
+                if operator.length_hint(lines_iter) == 0:
+                    break
+        return rows, eof
+
+    delim = dialect.delimiter
+    return [x.rstrip('\n').split(delim) for x in lines if x != '\n'], eof
+
+
+def _iter_blocks(fname, hasHeader, block_size):
+    '''
+    Iterate over blocks of rows in a csv or tsv file.
+
+    Yields
+    ------
+    keys: list
+        Column names.
+    rows: list
+        Up to `block_size` rows. Each row is a list with a value for each column.
+    '''
+
+    with open(fname, 'r') as inF:
+        dialect = _sniff(inF)
+
+        # first non blank line
+        rows, eof = list(), False
+        while not rows and not eof:
+            rows, eof = _read_rows(inF, dialect, 1)
+        if not rows:
+            raise RuntimeError('{} is empty'.format(fname))
+
+        if hasHeader:
+            keys = [x.strip() for x in rows[0]]
+            keys_temp = dict()
+            for key in keys:
+                if key not in keys_temp:
+                    keys_temp[key] = 0
+                keys_temp[key] += 1
+            bad_cols = 0
+            for k, v in keys_temp.items():
+                if v > 1:
+                    sys.stderr.write('Duplicate column name found: {}\n'.format(k))
+                    bad_cols += 1
+            if bad_cols > 0:
+                raise RuntimeError('{} invalid column names in {}'.format(bad_cols, fname))
+            rows = list()
+        else:
+            keys = list(range(len(rows[0])))
+
+        ncol = len(keys)
+        n_rows = len(rows)
+        while True:
+            if not eof:
+                block, eof = _read_rows(inF, dialect, block_size - len(rows))
+                rows += block
+                if len(rows) < block_size and not eof:
+                    continue
+            if set(map(len, rows)) - {ncol}:
+                for i, row in enumerate(rows):
+                    if len(row) > ncol:
+                        raise ValueError('Row {} of {} has {} columns. Expected {}'.format(n_rows + i + 1, fname,
+                                                                                           len(row), ncol))
+                    # missing values at the end of a row are empty
+                    row.extend([''] * (ncol - len(row)))
+            yield keys, rows
+            n_rows += len(rows)
+            rows = list()
+            if eof:
+                break
+
+
+def _read_chunks(fname, hasHeader, chunksize):
+    for i, (keys, rows) in enumerate(_iter_blocks(fname, hasHeader, chunksize)):
+        # a file with no rows is read as one empty DataFrame
+        if rows or i == 0:
+            ret = DataFrame()
+            ret.columns = list(keys)
+            ret._keys = {k: i for i, k in enumerate(keys)}
+            ret._data = [StringColumn(x) for x in zip(*rows)] if rows else [StringColumn() for _ in keys]
+            ret.ncol = len(keys)
+            ret.nrow = len(rows)
+            yield ret
+
+
+def read_tsv(fname, hasHeader=True, chunksize=None):
     '''
     Read csv or tsv file into DataFrame.
     File format and delimiters are detected automatically using csv.Sniffer().
@@ -214,52 +775,36 @@ def read_tsv(fname, hasHeader=True):
         Path to file to read.
     hasHeader: bool
         Does the first line in the file contain column headers?
+    chunksize: int, default None
+        If given, the file is read in blocks of `chunksize` rows and
+        an iterator of DataFrames is returned instead of one DataFrame.
 
     Return
     ------
     dataframe: DataFrame
-        Object with data from `fname`.
+        Object with data from `fname`, or iterator of DataFrames with up to
+        `chunksize` rows if `chunksize` is given.
     '''
 
-    lines = list()
-    with open(fname, 'r') as inF:
-        dialect = csv.Sniffer().sniff(inF.readline())
-        inF.seek(0)
-        for line in csv.reader(inF, dialect):
-            lines.append(line)
+    if chunksize is not None:
+        if chunksize < 1:
+            raise ValueError('chunksize must be >= 1')
+        return _read_chunks(fname, hasHeader, chunksize)
 
     ret = DataFrame()
-
-    # add row keys
-    _keys = dict()
-    if hasHeader:
-        _keys = [x.strip() for x in lines[0]]
-        keys_temp = dict()
-        for key in _keys:
-            if key not in keys_temp:
-                keys_temp[key] = 0
-            keys_temp[key] += 1
-        bad_cols = 0
-        for k, v in keys_temp.items():
-            if v > 1:
-                sys.stderr.write('Duplicate column name found: {}\n'.format(k))
-                bad_cols += 1
-        if bad_cols > 0:
-            raise RuntimeError('{} invalid column names in {}'.format(bad_cols, fname))
-        _start = 1
-    else:
-        _keys = list(range(len(lines[0])))
-        _start = 0
-    ret._data = [list() for x in _keys]
-    ret.columns = _keys
-    ret._keys = {k: i for i, k in enumerate(_keys)}
-    ret.ncol = len(_keys)
-
-    # iterate through lines
-    for i, line in enumerate(lines[_start:]):
-        for j, elem in enumerate(line):
-            ret._data[j].append(elem)
-    ret.nrow = len(ret._data[0])
+    parts = None
+    for keys, rows in _iter_blocks(fname, hasHeader, DataFrame._BLOCK_SIZE):
+        if parts is None:
+            ret.columns = list(keys)
+            ret._keys = {k: i for i, k in enumerate(keys)}
+            ret._data = [StringColumn() for _ in keys]
+            ret.ncol = len(keys)
+            parts = [[c.codes] for c in ret._data]
+        for col, col_parts, values in zip(ret._data, parts, zip(*rows)):
+            col_parts.append(col._encode(values))
+        ret.nrow += len(rows)
+
+    for col, col_parts in zip(ret._data, parts):
+        col.codes = np.concatenate(col_parts)
 
     return ret
-
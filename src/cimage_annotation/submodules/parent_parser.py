@@ -1,6 +1,8 @@
 
 import argparse
 
+from . import RecordCache, Journal, WorkQueue
+
 PARENT_PARSER = argparse.ArgumentParser(add_help=False)
 
 PARENT_PARSER.add_argument('-f', '--file_type', default='cimage', choices=['cimage', 'tsv'],
@@ -20,6 +22,11 @@ PARENT_PARSER.add_argument('--description_col', default='description',
                                 'Only required for query description in alignment output files. '
                                 '"description" is the default.')
 
+PARENT_PARSER.add_argument('--tsv_chunk_size', type=int, default=None,
+                           help='Read tsv input in blocks of TSV_CHUNK_SIZE rows. Only the protein IDs and '
+                                'annotation columns are kept in memory, but the input file is read several times. '
+                                'By default, the whole file is read into memory.')
+
 PARENT_PARSER.add_argument('-s', '--write_seq', action='store_true', default=False,
                            help='Write protein sequences in input to fasta file? 0 is the default.')
 
@@ -28,7 +35,8 @@ PARENT_PARSER.add_argument('--all_features', action='store_true', default=False,
                                 'By default, only a simplified set of features are included.')
 
 PARENT_PARSER.add_argument('--ofname', default='residue_annotation.tsv',
-                           help='Name of file to write results to.')
+                           help='Name of file to write results to. '
+                                'If the name ends in .gz or .zst, the file is compressed with gzip or zstd.')
 
 PARENT_PARSER.add_argument('-a', '--align', action='store_true', default=False,
                            help='Choose whether to blast protein sequences to determine residue conservation. '
@@ -51,6 +59,92 @@ PARENT_PARSER.add_argument('-d', '--database_dir', type=str,
 PARENT_PARSER.add_argument('-o', '--defined_organism', default='none', type=str,
                            help='Define organism to look up function of conserved residues.')
 
+PARENT_PARSER.add_argument('--blast_chunk_size', default=50, type=int,
+                           help='Maximum number of protein sequences aligned by each blastp process. '
+                                'Batching queries avoids starting blastp and loading the database for every protein. '
+                                'If 1, each protein is aligned separately. 50 is the default.')
+
+PARENT_PARSER.add_argument('--blast_format', choices=['xml', 'json'], default='xml',
+                           help='Output format requested from blastp. json is faster to parse and has the same '
+                                'alignments and e-values as xml. xml is the default.')
+
+PARENT_PARSER.add_argument('--blastp_exe', default='blastp', type=str,
+                           help='Name of or path to blastp executable. "blastp" is the default.')
+
+PARENT_PARSER.add_argument('--blast_env', action='append', default=None, metavar='NAME=VALUE',
+                           help='Set environment variable for blastp processes (for example BLASTDB=<path>). '
+                                'Can be specified multiple times.')
+
+PARENT_PARSER.add_argument('--net_threads', default=None, type=int,
+                           help='Number of concurrent UniProt requests. '
+                                'By default, chosen from the number of available cores.')
+
+PARENT_PARSER.add_argument('--blast_procs', default=None, type=int,
+                           help='Number of blastp processes to run in parallel. '
+                                'By default, chosen from the number of available cores.')
+
+PARENT_PARSER.add_argument('--blast_threads', default=None, type=int,
+                           help='Number of threads used by each blastp process (blastp -num_threads). '
+                                'By default, chosen from the number of available cores.')
+
+PARENT_PARSER.add_argument('--cache_dir', default=RecordCache.DEFAULT_CACHE_DIR, type=str,
+                           help='Directory to store persistent UniProt record cache in. '
+                                '"{}" is the default.'.format(RecordCache.DEFAULT_CACHE_DIR))
+
+PARENT_PARSER.add_argument('--cache_ttl', default=30, type=float,
+                           help='Number of days cached UniProt records are valid. '
+                                'If <= 0, records never expire. 30 is the default.')
+
+PARENT_PARSER.add_argument('--cache_size', default=1024, type=float,
+                           help='Maximum size of UniProt record cache in MB. Least recently used records are '
+                                'removed when the cache is larger. If <= 0, the size is unlimited. 1024 is the default.')
+
+PARENT_PARSER.add_argument('--blast_cache_size', default=4096, type=float,
+                           help='Maximum size of BLAST alignment cache in MB. Least recently used alignments are '
+                                'removed when the cache is larger. If <= 0, the size is unlimited. 4096 is the default.')
+
+PARENT_PARSER.add_argument('--no_cache', action='store_true', default=False,
+                           help='Don\'t use persistent UniProt record and BLAST alignment caches.')
+
+PARENT_PARSER.add_argument('--fetch_engine', choices=['thread', 'async'], default='thread',
+                           help='Engine used to retrieve UniProt records. thread makes each request on a new connection '
+                                'in a thread pool. async makes requests with asyncio over a pool of keep-alive connections. '
+                                'thread is the default.')
+
+PARENT_PARSER.add_argument('--max_in_flight', default=None, type=int,
+                           help='Maximum number of concurrent UniProt requests for --fetch_engine async. '
+                                'By default, the number of threads is used.')
+
+PARENT_PARSER.add_argument('--n_retry', default=10, type=int,
+                           help='Number of times to retry a failed UniProt request with exponential backoff. 10 is the default.')
+
+PARENT_PARSER.add_argument('--request_timeout', default=60, type=float,
+                           help='Timeout for each UniProt request in seconds. 60 is the default.')
+
+PARENT_PARSER.add_argument('--hedge_after', default=5, type=float,
+                           help='Make a duplicate request for UniProt records which take longer than HEDGE_AFTER seconds '
+                                'and use whichever response arrives first. If 0, duplicate requests are not made. '
+                                '5 is the default.')
+
+PARENT_PARSER.add_argument('--uniprot_dat', default=None, type=str,
+                           help='Path to local uncompressed UniProt flat file (uniprot_sprot.dat or uniprot_trembl.dat). '
+                                'If specified, UniProt records are read from the file instead of the web. '
+                                'An index is written to a sidecar file the first time the file is used.')
+
+PARENT_PARSER.add_argument('--queue_dir', default=None, type=str,
+                           help='Path to queue directory on a shared file system. If specified, UniProt requests and '
+                                'alignments are performed by worker processes started with '
+                                '"cimage_annotation worker QUEUE_DIR" instead of by this process.')
+
+PARENT_PARSER.add_argument('--queue_lease', default=WorkQueue.DEFAULT_LEASE, type=float,
+                           help='Number of seconds after a worker stops responding before its tasks are given to '
+                                'another worker. {} is the default.'.format(WorkQueue.DEFAULT_LEASE))
+
+PARENT_PARSER.add_argument('--resume', action='store_true', default=False,
+                           help='Resume an interrupted run in the same working directory. UniProt records and alignments '
+                                'which were finished before the run stopped are read from the run journal '
+                                '({}) instead of being repeated.'.format(Journal.DEFAULT_JOURNAL_FNAME))
+
 PARENT_PARSER.add_argument('-v', '--verbose', action='store_true', default=False,
                            help='Print verbose output?')
 
@@ -0,0 +1,43 @@
+
+import sys
+import argparse
+
+from .submodules import WorkQueue, UniProt, Alignments
+
+HANDLERS = {'uniprot': UniProt.fetch_task, 'blast': Alignments.blast_task}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='cimage_annotation worker',
+                                     description='Run UniProt requests and alignments for cimage_annotation runs '
+                                                 'started with --queue_dir. Any number of workers can share a queue '
+                                                 'directory as long as it is on a file system all the workers can access.')
+
+    parser.add_argument('-t', '--nThread', type=int, default=1,
+                        help='Number of tasks to run at the same time. 1 is the default.')
+
+    parser.add_argument('--idle_timeout', type=float, default=0,
+                        help='Exit after no tasks are found for IDLE_TIMEOUT seconds. '
+                             'If 0, the worker runs until it is killed. 0 is the default.')
+
+    parser.add_argument('--queue_lease', type=float, default=WorkQueue.DEFAULT_LEASE,
+                        help='Number of seconds after a worker stops responding before its tasks are given to '
+                             'another worker. {} is the default.'.format(WorkQueue.DEFAULT_LEASE))
+
+    parser.add_argument('-v', '--verbose', action='store_true', default=False,
+                        help='Print verbose output?')
+
+    parser.add_argument('queue_dir', type=str, help='Path to queue directory.')
+
+    args = parser.parse_args(argv)
+
+    queue = WorkQueue.WorkQueue(args.queue_dir, lease=args.queue_lease)
+    sys.stdout.write('Waiting for tasks in {}...\n'.format(queue.queue_dir))
+    n_tasks = WorkQueue.run_worker(queue, HANDLERS, n_threads=args.nThread,
+                                   idle_timeout=args.idle_timeout, verbose=args.verbose)
+    sys.stdout.write('Finished {} task(s)\n'.format(n_tasks))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+
+import os
+import io
+import re
+import sys
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import Alignments
+
+# Two queries aligned in one blastp process. The first has two hits, the second has none.
+QUERIES = [('0', 12, [{'id': 'sp|Q00001|Q1_MOUSE', 'accession': 'Q00001', 'title': 'Homolog 1 OS=Mus musculus', 'len': 14,
+                       'evalue': '1.40523e-05', 'query_from': 2, 'query_to': 11, 'hit_from': 3, 'hit_to': 12, 'align_len': 11,
+                       'qseq': 'CDE-FGHIKLM', 'hseq': 'CDEAFGH-KLC', 'midline': 'CDE FGH KL '},
+                      {'id': 'sp|Q00002|Q2_MOUSE', 'accession': 'Q00002', 'title': 'Homolog 2 OS=Mus musculus', 'len': 12,
+                       'evalue': '0.0223', 'query_from': 1, 'query_to': 4, 'hit_from': 1, 'hit_to': 4, 'align_len': 4,
+                       'qseq': 'ACDE', 'hseq': 'ACDE', 'midline': 'ACDE'}]),
+           ('1', 8, [])]
+
+HSP_TAGS = [('evalue', 'Hsp_evalue'), ('query_from', 'Hsp_query-from'), ('query_to', 'Hsp_query-to'),
+            ('hit_from', 'Hsp_hit-from'), ('hit_to', 'Hsp_hit-to'), ('align_len', 'Hsp_align-len'),
+            ('qseq', 'Hsp_qseq'), ('hseq', 'Hsp_hseq'), ('midline', 'Hsp_midline')]
+
+
+def _xml():
+    lines = ['<?xml version="1.0"?>', '<BlastOutput>',
+             '<BlastOutput_program>blastp</BlastOutput_program>',
+             '<BlastOutput_query-ID>Query_1</BlastOutput_query-ID>',
+             '<BlastOutput_query-def>0</BlastOutput_query-def>',
+             '<BlastOutput_query-len>12</BlastOutput_query-len>',
+             '<BlastOutput_iterations>']
+    for i, (title, length, hits) in enumerate(QUERIES):
+        lines += ['<Iteration>', '<Iteration_iter-num>{}</Iteration_iter-num>'.format(i + 1),
+                  '<Iteration_query-ID>Query_{}</Iteration_query-ID>'.format(i + 1),
+                  '<Iteration_query-def>{}</Iteration_query-def>'.format(title),
+                  '<Iteration_query-len>{}</Iteration_query-len>'.format(length), '<Iteration_hits>']
+        for n, hit in enumerate(hits):
+            lines += ['<Hit>', '<Hit_num>{}</Hit_num>'.format(n + 1), '<Hit_id>{}</Hit_id>'.format(hit['id']),
+                      '<Hit_def>{}</Hit_def>'.format(hit['title']),
+                      '<Hit_accession>{}</Hit_accession>'.format(hit['accession']),
+                      '<Hit_len>{}</Hit_len>'.format(hit['len']), '<Hit_hsps>', '<Hsp>']
+            lines += ['<{0}>{1}</{0}>'.format(tag, hit[key]) for key, tag in HSP_TAGS]
+            lines += ['</Hsp>', '</Hit_hsps>', '</Hit>']
+        lines += ['</Iteration_hits>']
+        if not hits:
+            lines += ['<Iteration_message>No hits found</Iteration_message>']
+        lines += ['</Iteration>']
+    lines += ['</BlastOutput_iterations>', '</BlastOutput>']
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _json():
+    reports = list()
+    for i, (title, length, hits) in enumerate(QUERIES):
+        search = {'query_id': 'Query_{}'.format(i + 1), 'query_title': title, 'query_len': length, 'hits': list()}
+        for n, hit in enumerate(hits):
+            hsp = {key: hit[key] for key, _ in HSP_TAGS}
+            hsp['evalue'] = '@{}@'.format(hit['evalue'])
+            search['hits'].append({'num': n + 1, 'len': hit['len'], 'hsps': [hsp],
+                                   'description': [{k: hit[k] for k in ('id', 'accession', 'title')}]})
+        if not hits:
+            search['message'] = 'No hits found'
+        reports.append({'report': {'program': 'blastp', 'results': {'search': search}}})
+    # write e-values as JSON numbers with the same text as the XML
+    return json.dumps({'BlastOutput2': reports}, indent=1).replace('"@', '').replace('@"', '')
+
+
+class TestJsonOutput(unittest.TestCase):
+    def test_same_results_as_xml(self):
+        xml_results = Alignments.read_blast(io.BytesIO(_xml()))
+        json_results = Alignments.read_json(_json())
+        self.assertEqual([x[0] for x in json_results], ['0', '1'])
+        self.assertEqual([x[0] for x in xml_results], ['0', '1'])
+
+        for (_, xml_result), (_, json_result), (_, length, _) in zip(xml_results, json_results, QUERIES):
+            self.assertEqual(json_result.hits, xml_result.hits)
+            xml_alignment = Alignments.Alignment(xml_result)
+            json_alignment = Alignments.Alignment(json_result)
+            self.assertEqual(json_alignment.get_best_id(), xml_alignment.get_best_id())
+            self.assertEqual(json_alignment.get_best_evalue(), xml_alignment.get_best_evalue())
+            for pos in range(0, length + 2):
+                self.assertEqual(json_alignment.conserved_at_position(pos), xml_alignment.conserved_at_position(pos))
+                self.assertEqual(json_alignment.alignment_at_position(pos), xml_alignment.alignment_at_position(pos))
+
+        self.assertEqual(Alignments.Alignment(json_results[0][1]).get_best_evalue(), 1.40523e-05)
+        self.assertIsNone(Alignments.Alignment(json_results[1][1]).get_best_evalue())
+
+    def test_numbers_are_kept_as_text(self):
+        hsp = Alignments.read_json(_json())[0][1].hits[0][1][0]
+        self.assertEqual(hsp['Hsp_evalue'], '1.40523e-05')
+        self.assertEqual(hsp['Hsp_query-from'], '2')
+
+    def test_truncated_output(self):
+        self.assertEqual(Alignments.read_json(_json()[:-20]), [])
+        self.assertEqual(Alignments.read_json(io.BytesIO(b'')), [])
+
+
+class TestBlastXml(unittest.TestCase):
+    def test_query_header(self):
+        results = Alignments.read_blast(io.BytesIO(_xml()))
+        for i, ((query_def, result), (title, length, _)) in enumerate(zip(results, QUERIES)):
+            self.assertEqual(query_def, title)
+            self.assertEqual(result.header['BlastOutput_program'], 'blastp')
+            self.assertEqual(result.header['BlastOutput_query-ID'], 'Query_{}'.format(i + 1))
+            self.assertEqual(result.header['BlastOutput_query-def'], title)
+            self.assertEqual(result.header['BlastOutput_query-len'], str(length))
+            self.assertEqual(list(result.header)[:4], ['BlastOutput_program', 'BlastOutput_query-ID',
+                                                       'BlastOutput_query-def', 'BlastOutput_query-len'])
+
+    def test_query_header_without_iteration_value(self):
+        data = _xml().replace(b'<BlastOutput_query-len>12</BlastOutput_query-len>',
+                              b'<BlastOutput_query-len>12</BlastOutput_query-len>'
+                              b'<BlastOutput_query-seq>ACDEFGHIKLMN</BlastOutput_query-seq>')
+        data = data.replace(b'<Iteration_query-len>8</Iteration_query-len>', b'')
+        results = Alignments.read_blast(io.BytesIO(data))
+        self.assertEqual(results[0][1].header['BlastOutput_query-len'], '12')
+        self.assertNotIn('BlastOutput_query-len', results[1][1].header)
+        for _, result in results:
+            self.assertNotIn('BlastOutput_query-seq', result.header)
+
+    def test_xml_output(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp, 'out.xml')
+            _, result = Alignments.read_blast(io.BytesIO(_xml()))[0]
+            Alignments.Alignment(result, query_id='P00001', query_description='Protein 1').write(fname, file_format='xml')
+            with open(fname, 'rb') as inF:
+                data = inF.read()
+            self.assertIn(b'<BlastOutput_query-def>0</BlastOutput_query-def>', data)
+            self.assertIn(b'<BlastOutput_query-len>12</BlastOutput_query-len>', data)
+            (query_def, copy), = Alignments.read_blast(io.BytesIO(data))
+            self.assertEqual(query_def, 'Protein 1')
+            self.assertEqual(copy.hits, result.hits)
+        finally:
+            shutil.rmtree(tmp)
+
+
+def _old_maps(qseq, hseq):
+    ''' hit_seq_map and query_seq_map as they were built before the NumPy masks. '''
+    hit_seq_map = list()
+    seq_index = 0
+    for c in hseq:
+        hit_seq_map.append(seq_index)
+        if re.match('[A-Za-z]', c):
+            seq_index += 1
+    query_seq_map = [i for i, c in enumerate(qseq) if re.match('[A-Za-z]', c)]
+    return hit_seq_map, query_seq_map
+
+
+def _old_lookups(hsp, pos):
+    ''' conserved_at_position and alignment_at_position before the NumPy masks. '''
+    hit_seq_map, query_seq_map = _old_maps(hsp['Hsp_qseq'], hsp['Hsp_hseq'])
+    query_from, query_to = int(hsp['Hsp_query-from']), int(hsp['Hsp_query-to'])
+    if pos < query_from or pos > query_to:
+        return False, (None, None)
+    align_index = pos - query_from
+    query_index = query_seq_map[align_index]
+    conserved = False if query_index == -1 else hsp['Hsp_hseq'][query_index] == hsp['Hsp_qseq'][query_index]
+    res_temp = hsp['Hsp_hseq'][align_index]
+    if not re.match('[A-Za-z]', res_temp):
+        return conserved, (None, None)
+    return conserved, (res_temp, hit_seq_map[align_index] + int(hsp['Hsp_hit-from']))
+
+
+def _hsp(qseq, hseq, query_from=1, hit_from=1):
+    n_query = sum(c.isalpha() for c in qseq)
+    n_hit = sum(c.isalpha() for c in hseq)
+    return {'Hsp_evalue': '1e-10', 'Hsp_query-from': str(query_from), 'Hsp_query-to': str(query_from + n_query - 1),
+            'Hsp_hit-from': str(hit_from), 'Hsp_hit-to': str(hit_from + n_hit - 1), 'Hsp_align-len': str(len(qseq)),
+            'Hsp_qseq': qseq, 'Hsp_hseq': hseq}
+
+
+class TestHspMaps(unittest.TestCase):
+    def check(self, hsps):
+        result = Alignments.BlastResult({'Iteration_query-ID': 'Query_1', 'Iteration_query-def': '0'},
+                                        [({'Hit_num': '1', 'Hit_accession': 'Q00001'}, hsps)])
+        alignment = Alignments.Alignment(result)
+        # fields of later hsps replace those of the first, as in the XML element search used before
+        merged = dict()
+        for hsp in hsps:
+            merged.update(hsp)
+
+        hit_seq_map, query_seq_map = _old_maps(merged['Hsp_qseq'], merged['Hsp_hseq'])
+        for pos in range(int(merged['Hsp_query-from']) - 2, int(merged['Hsp_query-to']) + 3):
+            conserved, aligned = _old_lookups(merged, pos)
+            self.assertEqual(alignment.conserved_at_position(pos), conserved, pos)
+            self.assertEqual(alignment.alignment_at_position(pos), aligned, pos)
+        self.assertEqual(alignment._hsp['hit_seq_map'].tolist(), hit_seq_map)
+        self.assertEqual(alignment._hsp['query_seq_map'].tolist(), query_seq_map)
+        self.assertEqual(alignment._hsp['hit_seq_map'].dtype.name, 'int32')
+        self.assertEqual(alignment._hsp['query_seq_map'].dtype.name, 'int32')
+
+    def test_ungapped(self):
+        self.check([_hsp('ACDCEFGHC', 'ACDAEFGHC', query_from=3, hit_from=10)])
+
+    def test_gaps_in_query_and_hit(self):
+        self.check([_hsp('AC--DCEF-GHCK', 'ACKLD-EFCG--K', query_from=5, hit_from=2)])
+        self.check([_hsp('-CDCE', 'AC-CE', query_from=1, hit_from=1)])
+        self.check([_hsp('CDCE--', 'C--CEA', query_from=7, hit_from=4)])
+
+    def test_lower_case_and_masked_residues(self):
+        self.check([_hsp('ACxcDC*EF', 'ACXcD-*EF', query_from=2, hit_from=3)])
+
+    def test_multiple_hsps(self):
+        self.check([_hsp('ACDC', 'ACDC', query_from=1, hit_from=1), _hsp('GH-CK', 'GHACK', query_from=20, hit_from=30)])
+
+    def test_random_gapped_hsps(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            length = rng.randint(1, 80)
+            qseq = ''.join(rng.choice('ACDC' + '-' * rng.randint(0, 2)) for _ in range(length))
+            hseq = ''.join(rng.choice('ACDC' + '-' * rng.randint(0, 2)) for _ in range(length))
+            if not any(c.isalpha() for c in qseq) or not any(c.isalpha() for c in hseq):
+                continue
+            self.check([_hsp(qseq, hseq, query_from=rng.randint(1, 50), hit_from=rng.randint(1, 50))])
+
+    def test_empty_alignment(self):
+        alignment = Alignments.Alignment(Alignments.BlastResult(dict(), list()))
+        self.assertFalse(alignment.conserved_at_position(1))
+        self.assertEqual(alignment.alignment_at_position(1), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+
+import os
+import sys
+import threading
+import unittest
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import AsyncFetch, Retry
+
+
+def _record(uniprot_id):
+    return 'ID   {}\nAC   {};\n//\n'.format(uniprot_id, uniprot_id)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    '''
+    Stand-in for the UniProt REST API.
+
+    /uniprotkb/<id>.txt returns a record, except for these IDs:
+    MISSING: 404
+    REDIRECT_<id>: 302 with a relative Location header to <id>
+    THROTTLED_<id>: 429 on the first request, then the record
+    CHUNKED_<id>: record sent with chunked transfer encoding
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        uniprot_id = self.path.split('/')[-1][:-len('.txt')]
+
+        if uniprot_id == 'MISSING':
+            self._send(404)
+        elif uniprot_id.startswith('REDIRECT_'):
+            self._send(302, headers={'Location': '{}.txt'.format(uniprot_id[len('REDIRECT_'):])})
+        elif uniprot_id.startswith('THROTTLED_') and self.path not in self.server.throttled:
+            self.server.throttled.add(self.path)
+            self._send(429, headers={'Retry-After': '0'})
+        elif uniprot_id.startswith('CHUNKED_'):
+            body = _record(uniprot_id).encode()
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(body), 5):
+                chunk = body[i:i + 5]
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode() + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self._send(200, _record(uniprot_id).encode())
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestAsyncFetcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server(('127.0.0.1', 0), _Handler)
+        cls.server.requests = list()
+        cls.server.throttled = set()
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = 'http://127.0.0.1:{}/uniprotkb/{{}}.txt'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def fetcher(self, max_in_flight=4):
+        scheduler = Retry.RetryScheduler(n_retry=3, timeout=5, hedge_after=None, base_delay=0.01, max_delay=0.05)
+        return AsyncFetch.AsyncFetcher(url=self.url, max_in_flight=max_in_flight, scheduler=scheduler)
+
+    def test_fetch_all(self):
+        ids = ['P{:05d}'.format(i) for i in range(20)]
+        results = self.fetcher().fetch_all(ids)
+        self.assertEqual(results, {x: (True, _record(x)) for x in ids})
+
+    def test_missing_record(self):
+        self.assertEqual(self.fetcher().fetch_all(['MISSING']), {'MISSING': (True, None)})
+
+    def test_relative_redirect(self):
+        results = self.fetcher().fetch_all(['REDIRECT_P12345'])
+        self.assertEqual(results, {'REDIRECT_P12345': (True, _record('P12345'))})
+
+    def test_throttled_request_is_retried(self):
+        results = self.fetcher().fetch_all(['THROTTLED_P1', 'THROTTLED_P2'])
+        self.assertEqual(results, {x: (True, _record(x)) for x in ('THROTTLED_P1', 'THROTTLED_P2')})
+
+    def test_chunked_response(self):
+        results = self.fetcher(max_in_flight=1).fetch_all(['CHUNKED_P1', 'P2'])
+        self.assertEqual(results, {x: (True, _record(x)) for x in ('CHUNKED_P1', 'P2')})
+
+    def test_callback(self):
+        seen = list()
+        ret = self.fetcher().fetch_all(['P1', 'MISSING'], callback=lambda *x: seen.append(x))
+        self.assertEqual(ret, dict())
+        self.assertEqual(sorted(seen), [('MISSING', True, None), ('P1', True, _record('P1'))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,460 @@
+
+import os
+import csv
+import sys
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import MSParser
+from cimage_annotation.submodules.dataframe import DataFrame, StringColumn, NumericColumn, read_tsv, open_file
+
+HAS_ZSTD = importlib.util.find_spec('zstandard') is not None
+
+
+def _old_read_tsv(fname):
+    ''' read_tsv before typed columns. Returns the column names and a list of values for each column. '''
+    with open(fname, 'r') as inF:
+        dialect = csv.Sniffer().sniff(inF.readline())
+        inF.seek(0)
+        lines = list(csv.reader(inF, dialect))
+    columns = [x.strip() for x in lines[0]]
+    data = [list() for _ in columns]
+    for line in lines[1:]:
+        for j, elem in enumerate(line):
+            data[j].append(elem)
+    return columns, data
+
+
+def _old_to_tsv(fname, columns, data, sep='\t'):
+    ''' DataFrame.to_tsv before typed columns. '''
+    with open(fname, 'w') as outF:
+        outF.write('{}'.format(sep).join(columns))
+        outF.write('\n')
+        for i in range(len(data[0]) if data else 0):
+            for row_i, values in enumerate(data):
+                if row_i == 0:
+                    outF.write(values[i])
+                else:
+                    outF.write('{}{}'.format(sep, values[i]))
+            outF.write('\n')
+
+
+def _tsv_text(rng, n_rows, n_proteins=30):
+    ''' Random peptide tsv file with a protein ID column and repeated proteins. '''
+    lines = ['protein_ID\tdescription\tsequence\tcharge\tratio']
+    for i in range(n_rows):
+        protein = 'P{:05d}'.format(rng.randint(0, n_proteins))
+        peptide = ''.join(rng.choice('ACDEFGHIK') for _ in range(rng.randint(4, 12)))
+        lines.append('\t'.join([protein, 'Protein {}, isoform {}'.format(protein, rng.randint(1, 3)),
+                                'K.{}C*.R'.format(peptide), str(rng.randint(1, 4)), '{:.3f}'.format(rng.random())]))
+    return '\n'.join(lines) + '\n'
+
+
+def _old_annotated_tsv(fname, ofname, updates):
+    ''' Tsv_file read, set_peptide_value and write before typed columns. '''
+    columns, data = _old_read_tsv(fname)
+    for col in MSParser.ADDED_COLUMNS:
+        columns.append(col)
+        data.append(['' for _ in data[0]])
+    for i, key, value in updates:
+        if key not in columns:
+            columns.append(key)
+            data.append(['' for _ in data[0]])
+        data[columns.index(key)][i] = value
+    _old_to_tsv(ofname, columns, data)
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_text(self, name, text):
+        fname = os.path.join(self.tmp, name)
+        with open(fname, 'w', newline='') as outF:
+            outF.write(text)
+        return fname
+
+    def read_bytes(self, name):
+        with open(os.path.join(self.tmp, name), 'rb') as inF:
+            return inF.read()
+
+
+class TestColumns(unittest.TestCase):
+    def test_string_column(self):
+        values = ['b', 'a', 'b', '', 'c', '']
+        column = StringColumn(values)
+        self.assertEqual(column.tolist(), values)
+        self.assertEqual(list(column), values)
+        self.assertEqual(len(column), 6)
+        self.assertEqual(column.tolist(1, 4), values[1:4])
+        self.assertEqual(sorted(column.categories), ['', 'a', 'b', 'c'])
+        self.assertEqual(column.codes.dtype, np.int32)
+
+        column[0] = 'd'
+        column.set_values([1, 5], ['a', 7])
+        self.assertEqual(column.tolist(), ['d', 'a', 'b', '', 'c', '7'])
+        self.assertEqual(len(column.categories), len(set(column.categories)))
+
+    def test_string_column_converts_values(self):
+        column = StringColumn(['a', 1, 2.5, None, True])
+        self.assertEqual(column.tolist(), ['a', '1', '2.5', 'None', 'True'])
+        self.assertEqual(StringColumn.full(3, 0).tolist(), ['0'] * 3)
+
+    def test_string_column_take(self):
+        column = StringColumn(['a', 'b', 'c'])
+        copy = column.take([2, 0])
+        self.assertEqual(copy.tolist(), ['c', 'a'])
+        copy[0] = 'x'
+        column[1] = 'y'
+        self.assertEqual(copy.tolist(), ['x', 'a'])
+        self.assertEqual(column.tolist(), ['a', 'y', 'c'])
+
+    def test_numeric_column(self):
+        column = NumericColumn([1, 2, 3])
+        self.assertEqual(column.tolist(), [1, 2, 3])
+        self.assertIsInstance(column[0], int)
+        column.set_values([0], [4])
+        self.assertEqual(column.values.dtype.kind, 'i')
+        column[1] = 0.5
+        self.assertEqual(column.tolist(), [4.0, 0.5, 3.0])
+        self.assertEqual(column.take([2, 2]).tolist(), [3.0, 3.0])
+
+    def test_column_types(self):
+        dat = DataFrame({'s': ['a', 'b'], 'i': [1, 2], 'f': np.array([0.5, 1.0]), 'b': [True, False],
+                         'm': [1, 'x'], 'e': StringColumn(['', ''])})
+        types = {c: type(dat[c]) for c in dat.columns}
+        self.assertEqual(types, {'s': StringColumn, 'i': NumericColumn, 'f': NumericColumn, 'b': StringColumn,
+                                 'm': StringColumn, 'e': StringColumn})
+        self.assertEqual(dat['b'].tolist(), ['True', 'False'])
+        self.assertEqual(dat['m'].tolist(), ['1', 'x'])
+
+
+class TestDataFrame(unittest.TestCase):
+    def setUp(self):
+        self.dat = DataFrame({'id': ['P1', 'P2', 'P1', 'P3', 'P2'], 'n': [5, 4, 3, 2, 1]})
+
+    def test_set_values(self):
+        self.dat.set_values('id', [4, 0], ['P9', 'P8'])
+        self.assertEqual(self.dat['id'].tolist(), ['P8', 'P2', 'P1', 'P3', 'P9'])
+        self.dat.set_values('new', [1], ['x'])
+        self.assertEqual(self.dat['new'].tolist(), ['', 'x', '', '', ''])
+        self.assertEqual(self.dat.columns, ['id', 'n', 'new'])
+
+        self.dat.set_values('n', [0], [1.5])
+        self.assertEqual(self.dat['n'].tolist(), [1.5, 4, 3, 2, 1])
+        self.dat.set_values('n', [1], ['x'])
+        self.assertIsInstance(self.dat['n'], StringColumn)
+        self.assertEqual(self.dat['n'].tolist(), ['1.5', 'x', '3.0', '2.0', '1.0'])
+
+        with self.assertRaises(ValueError):
+            self.dat.set_values('id', [0, 1], ['a'])
+
+    def test_filter(self):
+        rows = self.dat.filter(np.array(self.dat['id'].tolist()) == 'P1')
+        self.assertEqual(rows['id'].tolist(), ['P1', 'P1'])
+        self.assertEqual(rows['n'].tolist(), [5, 3])
+        self.assertEqual(self.dat.filter([4, 0])['n'].tolist(), [1, 5])
+        self.assertEqual(self.dat.filter([]).nrow, 0)
+        with self.assertRaises(ValueError):
+            self.dat.filter([True, False])
+
+    def test_groupby(self):
+        groups = self.dat.groupby('id')
+        self.assertEqual(list(groups), ['P1', 'P2', 'P3'])
+        self.assertEqual({k: v.tolist() for k, v in groups.items()}, {'P1': [0, 2], 'P2': [1, 4], 'P3': [3]})
+        dat = DataFrame({'n': [2, 1, 2]})
+        self.assertEqual({k: v.tolist() for k, v in dat.groupby('n').items()}, {2: [0, 2], 1: [1]})
+
+
+class TestIterrows(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(9)
+        self.data = {'id': ['P{}'.format(rng.randint(0, 5)) for _ in range(23)],
+                     'n': [rng.randint(0, 100) for _ in range(23)],
+                     'x': [rng.choice(['', 'a', 'b']) for _ in range(23)]}
+        self.dat = DataFrame(self.data)
+        # several blocks, with a partial block at the end
+        self.dat._BLOCK_SIZE = 5
+
+    def test_same_as_dict_rows(self):
+        rows = list()
+        for i, row in self.dat.iterrows():
+            rows.append((i, dict(row)))
+        self.assertEqual(rows, [(i, {c: self.data[c][i] for c in self.data}) for i in range(23)])
+
+    def test_same_row_view(self):
+        views = {id(row) for _, row in self.dat.iterrows()}
+        self.assertEqual(len(views), 1)
+
+    def test_columns(self):
+        for i, row in self.dat.iterrows(columns=['x', 'id', 'x']):
+            self.assertEqual(list(row), ['x', 'id'])
+            self.assertEqual(row.items(), [('x', self.data['x'][i]), ('id', self.data['id'][i])])
+            self.assertNotIn('n', row)
+        with self.assertRaises(KeyError):
+            next(self.dat.iterrows(columns=['id', 'missing']))
+        self.assertEqual([dict(row) for _, row in self.dat.iterrows(columns=[])], [dict()] * 23)
+
+    def test_row_view(self):
+        i, row = next(self.dat.iterrows())
+        self.assertEqual(len(row), 3)
+        self.assertEqual(list(row.keys()), ['id', 'n', 'x'])
+        self.assertEqual(row.values(), [self.data[c][0] for c in ('id', 'n', 'x')])
+        self.assertEqual(row['n'], self.data['n'][0])
+        self.assertEqual(row.get('n'), self.data['n'][0])
+        self.assertEqual(row.get('missing', 'default'), 'default')
+        self.assertIn('id', row)
+        self.assertEqual(repr(row), repr({c: self.data[c][0] for c in self.data}))
+        with self.assertRaises(KeyError):
+            row['missing']
+        with self.assertRaises(TypeError):
+            row['id'] = 'P1'
+
+    def test_empty(self):
+        self.assertEqual(list(DataFrame().iterrows()), [])
+        self.assertEqual(list(self.dat.filter([]).iterrows()), [])
+
+
+def _frame_rows(dat):
+    return [list(row.values()) for _, row in dat.iterrows()]
+
+
+class TestReadTsv(TempDirTestCase):
+    def check_chunks(self, fname, expected_columns, expected_rows, **kwargs):
+        dat = read_tsv(fname, **kwargs)
+        self.assertEqual(dat.columns, expected_columns)
+        self.assertEqual(_frame_rows(dat), expected_rows)
+        for chunksize in (1, 2, 3, 7, len(expected_rows), len(expected_rows) + 1):
+            chunks = list(read_tsv(fname, chunksize=max(chunksize, 1), **kwargs))
+            self.assertGreater(len(chunks), 0)
+            for chunk in chunks:
+                self.assertEqual(chunk.columns, expected_columns)
+                self.assertLessEqual(chunk.nrow, max(chunksize, 1))
+            for chunk in chunks[:-1]:
+                self.assertEqual(chunk.nrow, max(chunksize, 1))
+            self.assertEqual([row for chunk in chunks for row in _frame_rows(chunk)], expected_rows)
+
+    def test_same_as_csv_reader(self):
+        fname = self.write_text('input.tsv', _tsv_text(random.Random(6), 50))
+        with open(fname) as inF:
+            lines = list(csv.reader(inF, delimiter='\t'))
+        self.check_chunks(fname, lines[0], lines[1:])
+
+    def test_quoted_fields(self):
+        lines = [['id', 'description', 'sequence']]
+        for i in range(20):
+            description = ['Protein {}'.format(i), 'Protein, "isoform" {}'.format(i),
+                           'Protein\nspanning lines {}'.format(i), '', 'P\t{}'.format(i)][i % 5]
+            lines.append(['P{}'.format(i), description, 'K.AC*{}.R'.format('D' * i)])
+        for delimiter in (',', '\t'):
+            fname = os.path.join(self.tmp, 'quoted.txt')
+            with open(fname, 'w', newline='') as outF:
+                csv.writer(outF, delimiter=delimiter, lineterminator='\n').writerows(lines)
+            self.check_chunks(fname, lines[0], lines[1:])
+
+    def test_short_and_long_rows(self):
+        fname = self.write_text('short.tsv', 'a\tb\tc\n1\t2\t3\n4\t5\n6\n\n7\t8\t9\n')
+        self.check_chunks(fname, ['a', 'b', 'c'], [['1', '2', '3'], ['4', '5', ''], ['6', '', ''], ['7', '8', '9']])
+
+        fname = self.write_text('long.tsv', 'a\tb\n1\t2\n3\t4\n5\t6\t7\n')
+        with self.assertRaisesRegex(ValueError, 'Row 3 of .* has 3 columns. Expected 2'):
+            read_tsv(fname)
+        with self.assertRaisesRegex(ValueError, 'Row 3 of'):
+            list(read_tsv(fname, chunksize=2))
+
+    def test_no_header(self):
+        fname = self.write_text('no_header.tsv', '1\t2\n3\t4\n')
+        self.check_chunks(fname, [0, 1], [['1', '2'], ['3', '4']], hasHeader=False)
+
+    def test_header_only(self):
+        fname = self.write_text('header.tsv', 'a\tb\n')
+        dat = read_tsv(fname)
+        self.assertEqual((dat.columns, dat.nrow), (['a', 'b'], 0))
+        chunks = list(read_tsv(fname, chunksize=10))
+        self.assertEqual([(x.columns, x.nrow) for x in chunks], [(['a', 'b'], 0)])
+
+    def test_invalid_files(self):
+        with self.assertRaises(RuntimeError):
+            read_tsv(self.write_text('empty.tsv', ''))
+        with self.assertRaises(RuntimeError):
+            read_tsv(self.write_text('blank.tsv', '\n\n'))
+        with self.assertRaises(RuntimeError):
+            read_tsv(self.write_text('duplicate.tsv', 'a\tb\ta\n1\t2\t3\n'))
+        with self.assertRaises(ValueError):
+            read_tsv(self.write_text('valid.tsv', 'a\tb\n1\t2\n'), chunksize=0)
+
+
+class TestToTsv(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(10)
+        n = 23
+        self.data = {'id': ['P{}'.format(rng.randint(0, 5)) for _ in range(n)],
+                     'count': [rng.randint(0, 100) for _ in range(n)],
+                     'ratio': [rng.choice([0.1, 1e-5, 2.0, 1 / 3]) for _ in range(n)],
+                     'x': [rng.choice(['', 'a b', 'c,d']) for _ in range(n)]}
+
+    def make_frame(self, n_rows=None):
+        dat = DataFrame({k: v[:n_rows] for k, v in self.data.items()})
+        # several blocks, with a partial block at the end
+        dat._BLOCK_SIZE = 5
+        return dat
+
+    def test_same_as_old(self):
+        for n_rows in (0, 1, 5, 6, 10, 23):
+            for sep in ('\t', ','):
+                data = {k: v[:n_rows] for k, v in self.data.items()}
+                _old_to_tsv(os.path.join(self.tmp, 'old.tsv'), list(data), list(data.values()), sep=sep)
+                self.make_frame(n_rows).to_tsv(os.path.join(self.tmp, 'new.tsv'), sep=sep)
+                self.assertEqual(self.read_bytes('new.tsv'), self.read_bytes('old.tsv'), (n_rows, sep))
+
+    def test_append_to_open_file(self):
+        dat = self.make_frame()
+        dat.to_tsv(os.path.join(self.tmp, 'whole.tsv'))
+        with open(os.path.join(self.tmp, 'blocks.tsv'), 'w') as outF:
+            for start in range(0, dat.nrow, 7):
+                dat.filter(range(start, min(start + 7, dat.nrow))).to_tsv(outF, header=start == 0)
+        self.assertEqual(self.read_bytes('blocks.tsv'), self.read_bytes('whole.tsv'))
+
+        dat.filter(range(10)).to_tsv(os.path.join(self.tmp, 'append.tsv'))
+        dat.filter(range(10, dat.nrow)).to_tsv(os.path.join(self.tmp, 'append.tsv'), header=False, mode='a')
+        self.assertEqual(self.read_bytes('append.tsv'), self.read_bytes('whole.tsv'))
+
+    def test_read_after_write(self):
+        dat = self.make_frame()
+        fname = os.path.join(self.tmp, 'out.tsv')
+        dat.to_tsv(fname)
+        copy = read_tsv(fname)
+        self.assertEqual(copy.columns, dat.columns)
+        self.assertEqual(_frame_rows(copy), [[str(x) for x in row] for row in _frame_rows(dat)])
+
+    def test_gzip(self):
+        dat = self.make_frame()
+        dat.to_tsv(os.path.join(self.tmp, 'out.tsv'))
+        expected = self.read_bytes('out.tsv')
+        for name, compression in (('out.tsv.gz', 'infer'), ('OUT.TSV.GZ', 'infer'), ('out.txt', 'gzip')):
+            fname = os.path.join(self.tmp, name)
+            dat.to_tsv(fname, compression=compression)
+            with gzip.open(fname, 'rb') as inF:
+                self.assertEqual(inF.read(), expected, name)
+            with open_file(fname, 'r', compression=compression) as inF:
+                self.assertEqual(inF.read().encode(), expected, name)
+        dat.to_tsv(os.path.join(self.tmp, 'plain.gz'), compression=None)
+        self.assertEqual(self.read_bytes('plain.gz'), expected)
+
+    def test_gzip_output_files(self):
+        fname = self.write_text('input.tsv', _tsv_text(random.Random(6), 50))
+        for chunksize in (None, 7):
+            tsv = MSParser.Tsv_file(chunksize=chunksize)
+            tsv.read(fname, 'mouse')
+            tsv.set_peptide_values('position', [0, 10], ['11', '12'])
+            tsv.write(os.path.join(self.tmp, 'out.tsv'))
+            tsv.write(os.path.join(self.tmp, 'out.tsv.gz'))
+            with gzip.open(os.path.join(self.tmp, 'out.tsv.gz'), 'rb') as inF:
+                self.assertEqual(inF.read(), self.read_bytes('out.tsv'))
+
+    @unittest.skipUnless(HAS_ZSTD, 'zstandard is not installed')
+    def test_zstd(self):
+        import zstandard
+        dat = self.make_frame()
+        dat.to_tsv(os.path.join(self.tmp, 'out.tsv'))
+        for name, compression in (('out.tsv.zst', 'infer'), ('out.txt', 'zstd')):
+            fname = os.path.join(self.tmp, name)
+            dat.to_tsv(fname, compression=compression)
+            with zstandard.open(fname, 'rb') as inF:
+                self.assertEqual(inF.read(), self.read_bytes('out.tsv'), name)
+
+    @unittest.skipIf(HAS_ZSTD, 'zstandard is installed')
+    def test_zstd_not_installed(self):
+        with self.assertRaisesRegex(RuntimeError, 'zstandard'):
+            self.make_frame().to_tsv(os.path.join(self.tmp, 'out.tsv.zst'))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'out.tsv.zst')))
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            self.make_frame().to_tsv(os.path.join(self.tmp, 'out.tsv'), compression='bz2')
+
+
+class TestTsvFile(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fname = self.write_text('input.tsv', _tsv_text(random.Random(6), 500))
+        rng = random.Random(8)
+        self.updates = list()
+        for i in range(500):
+            for key in rng.sample(MSParser.ADDED_COLUMNS + ['mouse_evalue', 'human_conserved'], 3):
+                self.updates.append((i, key, rng.choice(['', '12', 'DOMAIN--{}'.format(i), 'True', 1e-5, 3])))
+
+    def test_read_same_as_old(self):
+        columns, data = _old_read_tsv(self.fname)
+        dat = read_tsv(self.fname)
+        self.assertEqual(dat.columns, columns)
+        self.assertEqual([dat[c].tolist() for c in columns], data)
+        self.assertEqual(dat.nrow, len(data[0]))
+
+    def test_write_same_as_old(self):
+        _old_annotated_tsv(self.fname, os.path.join(self.tmp, 'old.tsv'), self.updates)
+
+        tsv = MSParser.Tsv_file()
+        tsv.read(self.fname, 'mouse')
+        buffer = MSParser.ColumnBuffer()
+        for i, key, value in self.updates:
+            if i % 2:
+                tsv.set_peptide_value(i, key, value)
+            else:
+                buffer.set(i, key, value)
+        buffer.flush(tsv)
+        tsv.write(os.path.join(self.tmp, 'new.tsv'))
+        self.assertEqual(self.read_bytes('new.tsv'), self.read_bytes('old.tsv'))
+        self.assertEqual(tsv.unique_ids, set(read_tsv(self.fname)['protein_ID']))
+
+    def test_iterpeptides(self):
+        columns, data = _old_read_tsv(self.fname)
+        tsv = MSParser.Tsv_file()
+        tsv.read(self.fname, 'mouse')
+        for i, row in tsv.iterpeptides(columns=('protein_ID', 'description', 'missing', 'position')):
+            self.assertEqual(list(row), ['protein_ID', 'description', 'position'])
+            self.assertEqual(row['description'], data[columns.index('description')][i])
+            self.assertEqual(row['position'], '')
+        self.assertEqual(i, len(data[0]) - 1)
+
+    def test_chunks_same_as_whole_file(self):
+        _old_annotated_tsv(self.fname, os.path.join(self.tmp, 'old.tsv'), self.updates)
+        whole = MSParser.Tsv_file()
+        whole.read(self.fname, 'mouse')
+        for chunksize in (1, 7, 128, 500, 1000):
+            tsv = MSParser.Tsv_file(chunksize=chunksize)
+            tsv.read(self.fname, 'mouse')
+            self.assertEqual(len(tsv), 500)
+            self.assertEqual(tsv.unique_ids, whole.unique_ids)
+            self.assertEqual(tsv.dat.columns, MSParser.ADDED_COLUMNS)
+
+            rows = [(i, dict(row)) for i, row in tsv.iterpeptides(columns=('protein_ID', 'sequence', 'position'))]
+            self.assertEqual(rows, [(i, dict(row)) for i, row in whole.iterpeptides(columns=('protein_ID', 'sequence', 'position'))])
+
+            buffer = MSParser.ColumnBuffer()
+            for i, key, value in self.updates:
+                buffer.set(i, key, value)
+            buffer.flush(tsv)
+            tsv.write(os.path.join(self.tmp, 'chunks.tsv'))
+            self.assertEqual(self.read_bytes('chunks.tsv'), self.read_bytes('old.tsv'), chunksize)
+
+    def test_missing_column(self):
+        for chunksize in (None, 10):
+            with self.assertRaises(KeyError):
+                MSParser.Tsv_file(seq_col='peptide', chunksize=chunksize).read(self.fname, 'mouse')
+
+
+if __name__ == '__main__':
+    unittest.main()
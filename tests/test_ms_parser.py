@@ -0,0 +1,241 @@
+
+import os
+import sys
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import MSParser
+from cimage_annotation.submodules.Alignments import organism_list
+
+DEFINED_ORGANISM = 'mouse'
+CIMAGE_HEADER = ['index', 'ipi', 'description', 'symbol', 'sequence', 'mass', 'run', 'scan', 'charge', 'R:1', 'INT', 'link']
+
+
+class _OldCimage_file():
+    ''' Cimage_file read and write before residue_peptides and CimageRow. '''
+
+    def __init__(self):
+        self.peptides = list()
+        self.residues = list()
+        self.header = dict()
+        self.defined_organism = str()
+
+    def set_peptide_value(self, index, key, value):
+        self.peptides[index][key] = value
+
+    @staticmethod
+    def _parser(line, organism_list, defined_organism):
+        line_list = line.split('\t')
+        line_dict = {}
+        dict_terms = ['index', 'id', 'description', 'symbol', 'sequence', 'mass']
+
+        i = 0
+        for item in dict_terms:
+            line_dict[item] = line_list[i]
+            i += 1
+
+        n = 1
+        m = len(line_dict)
+        while n + m <= len(line_list):
+            line_dict[n] = line_list[n + m -1]
+            n += 1
+
+        header = line_dict['description'].strip() == 'description'
+        line_dict['id'] = 'id' if header else line_dict['id']
+        for key, label in (('protein_location', 'protein location'), ('position', 'residue position'),
+                           ('res_function', 'residue function'), ('domains', 'domains')):
+            line_dict[key] = label if header else ''
+        for x in MSParser.ALLIGNMENT_COLUMNS:
+            line_dict['{}_{}'.format(defined_organism, x)] = '{}_{}'.format(defined_organism, x) if header else ''
+        for organism in organism_list:
+            line_dict[organism + '_conserved'] = organism + '_conserved' if header else ''
+        return line_dict
+
+    def read(self, fname, defined_organism):
+        self.defined_organism = defined_organism
+        with open(fname, 'r') as inF:
+            lines = inF.readlines()
+
+        index_temp = ''
+        for i, line in enumerate(lines):
+            line_dict = self._parser(line, organism_list, defined_organism)
+
+            if line_dict['index'].strip() == 'index':
+                self.header = line_dict
+            elif line_dict['index'].strip() != '':
+                index_temp = line_dict['index'].strip()
+                self.residues.append(line_dict)
+            else:
+                self.peptides.append(line_dict)
+                self.peptides[-1]['index'] = index_temp
+
+    @staticmethod
+    def _write_line(outF, line_dict, defined_organism):
+        outF.write('\t'.join([line_dict[x] for x in MSParser.PRINT_COLS]))
+        for organism in organism_list:
+            outF.write('\t{}'.format(line_dict[organism + '_conserved']))
+        outF.write('\t')
+        outF.write('\t'.join([str(line_dict['{}_{}'.format(defined_organism, x)]) for x in MSParser.ALLIGNMENT_COLUMNS]))
+        n = 1
+        while n < (len(line_dict) - 20):
+            outF.write(('\t{}'.format(line_dict[n].strip())))
+            n += 1
+        outF.write('\n')
+
+    def write(self, fname):
+        with open(fname, 'w') as outF:
+            self._write_line(outF, self.header, self.defined_organism)
+            for residue in self.residues:
+                self._write_line(outF, residue, self.defined_organism)
+                for peptide in self.peptides:
+                    if peptide['index'].strip() == residue['index'].strip():
+                        self._write_line(outF, peptide, self.defined_organism)
+
+
+def _cimage_text(rng, n_residues, newline='\n'):
+    '''
+    Random cimage file. Includes residues without peptides, peptides before the first residue
+    and a residue index which is used twice.
+    '''
+    lines = ['\t'.join(CIMAGE_HEADER)]
+    lines.append('\tP99999\tProtein P99999\tSYM99999\tK.AC*K.R\t1000.5\trun1\t0\t2\t1.0\t10\t')
+    for i in range(n_residues):
+        protein = 'P{:05d}'.format(rng.randint(0, 20))
+        protein_cols = [protein, 'Protein {}'.format(protein), 'SYM{}'.format(protein[1:])]
+        index = '2' if i == n_residues - 1 else str(i + 1)
+        lines.append('\t'.join([index] + protein_cols + ['', '', '', '', '', '1.5', '3', '']))
+        for j in range(rng.choice([0, 1, 3, 6])):
+            peptide = ''.join(rng.choice('ACDEFGHIK') for _ in range(rng.randint(4, 12)))
+            lines.append('\t'.join([''] + protein_cols + ['K.{}C*.R'.format(peptide), '{:.1f}'.format(rng.uniform(500, 3000)),
+                                                          'run1', str(j), '2', '{:.2f}'.format(rng.random()), '100', '']))
+    return newline.join(lines) + newline
+
+
+class TestCimageFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp, 'input.txt')
+        with open(self.fname, 'w', newline='') as outF:
+            outF.write(_cimage_text(random.Random(2), 40))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read_both(self, fname=None):
+        new = MSParser.Cimage_file()
+        new.read(fname or self.fname, DEFINED_ORGANISM)
+        old = _OldCimage_file()
+        old.read(fname or self.fname, DEFINED_ORGANISM)
+        return new, old
+
+    def assertSameOutput(self, new, old):
+        new.write(os.path.join(self.tmp, 'new.txt'))
+        old.write(os.path.join(self.tmp, 'old.txt'))
+        with open(os.path.join(self.tmp, 'new.txt'), 'rb') as inF:
+            new_bytes = inF.read()
+        with open(os.path.join(self.tmp, 'old.txt'), 'rb') as inF:
+            self.assertEqual(new_bytes, inF.read())
+        return new_bytes
+
+    def test_write_same_as_old(self):
+        new, old = self.read_both()
+        self.assertEqual(len(new), len(old.peptides))
+        self.assertGreater(len(self.assertSameOutput(new, old)), 0)
+
+    def test_write_annotated_same_as_old(self):
+        new, old = self.read_both()
+        rng = random.Random(4)
+        keys = MSParser.ADDED_COLUMNS + ['{}_conserved'.format(o) for o in organism_list] + \
+               ['{}_{}'.format(DEFINED_ORGANISM, x) for x in MSParser.ALLIGNMENT_COLUMNS]
+        buffer = MSParser.ColumnBuffer()
+        for i in range(len(new)):
+            for key in rng.sample(keys, 5):
+                value = rng.choice(['', 'True', 'False', 1e-5, 'DOMAIN--{}'.format(i)])
+                old.set_peptide_value(i, key, value if key.endswith(('_conserved', '_evalue')) else str(value))
+                if rng.random() < 0.5:
+                    new.set_peptide_value(i, key, value if key.endswith(('_conserved', '_evalue')) else str(value))
+                else:
+                    buffer.set(i, key, value if key.endswith(('_conserved', '_evalue')) else str(value))
+        buffer.flush(new)
+        self.assertEqual(buffer.columns, dict())
+        self.assertSameOutput(new, old)
+
+    def test_residue_peptides(self):
+        new, old = self.read_both()
+        for index, rows in new.residue_peptides.items():
+            self.assertEqual(rows, sorted(rows))
+            self.assertEqual(rows, [i for i, p in enumerate(old.peptides) if p['index'] == index])
+        # peptides before the first residue are kept but not written
+        self.assertEqual(new.residue_peptides[''], [0])
+
+    def test_rows_same_as_old_dicts(self):
+        new, old = self.read_both()
+        for new_rows, old_rows in ((new.peptides, old.peptides), (new.residues, old.residues),
+                                   ([new.header], [old.header])):
+            self.assertEqual(len(new_rows), len(old_rows))
+            for new_row, old_row in zip(new_rows, old_rows):
+                for key, value in old_row.items():
+                    self.assertIn(key, new_row)
+                    self.assertEqual(new_row[key], value, key)
+                    self.assertEqual(new_row.get(key), value, key)
+                n_extra = len(new_row.fields) - len(MSParser.CIMAGE_COLS)
+                for key in (0, n_extra + 1, 'unknown', '{}_id'.format('human')):
+                    self.assertNotIn(key, new_row)
+                    self.assertEqual(new_row.get(key, 'missing'), 'missing')
+                    with self.assertRaises(KeyError):
+                        new_row[key]
+        self.assertEqual(new.unique_ids, {p['id'] for p in old.peptides})
+
+    def test_set_value(self):
+        new, old = self.read_both()
+        row = new.peptides[3]
+        self.assertIsNone(row.annotations)
+        row['position'] = '12'
+        row['sequence'] = 'K.AC*K.R'
+        self.assertEqual(row['position'], '12')
+        self.assertEqual(row['sequence'], 'K.AC*K.R')
+        self.assertEqual(new.peptides[4]['position'], '')
+        self.assertEqual(new.header['position'], 'residue position')
+
+    def test_protein_columns_are_interned(self):
+        new, _ = self.read_both()
+        rows = [p for p in new.peptides if p['id'] == new.peptides[1]['id']]
+        self.assertGreater(len(rows), 1)
+        for key in ('id', 'description', 'symbol'):
+            self.assertIs(rows[0][key], rows[-1][key])
+
+    def test_windows_line_endings(self):
+        fname = os.path.join(self.tmp, 'crlf.txt')
+        with open(fname, 'w', newline='') as outF:
+            outF.write(_cimage_text(random.Random(2), 40, newline='\r\n'))
+        new, old = self.read_both(fname)
+        self.assertSameOutput(new, old)
+
+    def test_compressed_output(self):
+        new, old = self.read_both()
+        expected = self.assertSameOutput(new, old)
+        new.write(os.path.join(self.tmp, 'out.txt.gz'))
+        with gzip.open(os.path.join(self.tmp, 'out.txt.gz'), 'rb') as inF:
+            self.assertEqual(inF.read(), expected)
+        if importlib.util.find_spec('zstandard') is not None:
+            import zstandard
+            new.write(os.path.join(self.tmp, 'out.txt.zst'))
+            with zstandard.open(os.path.join(self.tmp, 'out.txt.zst'), 'rb') as inF:
+                self.assertEqual(inF.read(), expected)
+
+    def test_empty_file(self):
+        with open(self.fname, 'w') as outF:
+            outF.write('\t'.join(CIMAGE_HEADER) + '\n')
+        new, old = self.read_both()
+        self.assertEqual(len(new), 0)
+        self.assertSameOutput(new, old)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+
+import os
+import re
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import PeptideMapper, ProteinRecord
+
+# CDEK occurs twice, AAA overlaps itself in AAAAA
+PROTEIN = 'MKCDEKLLAAAAAGCHRCDEKWWC'
+PEPTIDES = ['K.C*DEK.L', 'R.C*DEK.W', 'L.LAAAAAGC*HR.C', 'A.AAAGC*HR.C', 'AAA', 'R.C*DEKWWC*.-',
+            '-.MKC*DEK.L', 'Y.NOTFOUNDC*.K', 'GC*HRC*DEK', 'LLAAAAAGC*HR']
+
+
+def _old_sites(protein_seq, peptide):
+    ''' Sites found by parsing the peptide in main and ExPasy and cys_position before batch mapping. '''
+    sequence = re.match(r'.?\.?([A-z\*]+)\.?/?', peptide).group(1)
+    seq_no_mod = sequence.replace('*', '')
+    ret = list()
+    for i, x in enumerate(re.finditer(r'\*', sequence)):
+        mod_loc = x.start() - (i + 1)
+        peptide_start = str(protein_seq).find(seq_no_mod)
+        ret.append(-1 if peptide_start == -1 else peptide_start + mod_loc)
+    return tuple(ret)
+
+
+def _naive_starts(text, pattern):
+    return tuple(i for i in range(len(text) - len(pattern) + 1) if text.startswith(pattern, i))
+
+
+class TestPeptideMapper(unittest.TestCase):
+    def test_normalize_peptide(self):
+        for peptide in PEPTIDES + ['*ACK', 'K.AC*C*K.-', 'ACDK/2']:
+            sequence, bare, mod_locs = PeptideMapper.normalize_peptide(peptide)
+            old_sequence = re.match(r'.?\.?([A-z\*]+)\.?/?', peptide).group(1)
+            self.assertEqual(sequence, old_sequence)
+            self.assertEqual(bare, old_sequence.replace('*', ''))
+            self.assertEqual(mod_locs, tuple(x.start() - (i + 1) for i, x in enumerate(re.finditer(r'\*', old_sequence))))
+        self.assertIsNone(PeptideMapper.normalize_peptide('123'))
+
+    def test_aho_corasick(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            text = ''.join(rng.choice('ACK') for _ in range(rng.randint(0, 60)))
+            patterns = [''.join(rng.choice('ACK') for _ in range(rng.randint(0, 5))) for _ in range(rng.randint(1, 8))]
+            patterns += [patterns[0], patterns[0][1:]]
+            expected = sorted((start, i) for i, p in enumerate(patterns) if p for start in _naive_starts(text, p))
+            found = list(PeptideMapper.AhoCorasick(patterns).finditer(text))
+            self.assertEqual(sorted(found), expected)
+            self.assertEqual(found, sorted(found, key=lambda x: x[0] + len(patterns[x[1]])))
+
+    def test_find_all(self):
+        starts = PeptideMapper.find_all(PROTEIN, ['CDEK', 'AAA', 'AAAAAGCHR', 'NOTFOUND'])
+        self.assertEqual(starts, {'CDEK': (2, 17), 'AAA': (8, 9, 10), 'AAAAAGCHR': (8,), 'NOTFOUND': ()})
+        for p in starts:
+            self.assertEqual(starts[p], _naive_starts(PROTEIN, p))
+
+    def test_map_all(self):
+        records = {'P1': ProteinRecord.ProteinRecord(sequence=PROTEIN), 'P2': None}
+        peptides = [('P1', p) for p in PEPTIDES] + [('P1', PEPTIDES[0]), ('P2', PEPTIDES[0]), ('P1', '123')]
+        matches = PeptideMapper.map_all(peptides, records)
+
+        self.assertEqual(len(matches), len(set(peptides)))
+        self.assertIsNone(matches[('P1', '123')])
+        self.assertIsNone(matches[('P2', PEPTIDES[0])].sites)
+
+        for peptide in PEPTIDES:
+            match = matches[('P1', peptide)]
+            old = _old_sites(PROTEIN, peptide)
+            self.assertEqual(match.starts, _naive_starts(PROTEIN, match.bare))
+            if len(match.starts) <= 1:
+                # peptides which occur once map to the same sites as before
+                self.assertEqual(match.sites, old, peptide)
+            else:
+                # repeated peptides report every occurrence, starting with the one found before
+                self.assertEqual(match.sites[:len(old)], old, peptide)
+                self.assertEqual(match.sites, tuple(s + m for s in match.starts for m in match.mod_locs))
+
+        self.assertEqual(matches[('P1', 'K.C*DEK.L')].sites, (2, 17))
+        self.assertEqual(matches[('P1', 'A.AAAGC*HR.C')].sites, (14,))
+        self.assertEqual(matches[('P1', 'Y.NOTFOUNDC*.K')].sites, (-1,))
+        self.assertEqual(matches[('P1', 'AAA')].sites, ())
+
+
+if __name__ == '__main__':
+    unittest.main()
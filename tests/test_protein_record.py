@@ -0,0 +1,129 @@
+
+import os
+import io
+import sys
+import pickle
+import unittest
+from array import array
+from Bio import SwissProt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import UniProt, ProteinRecord
+
+FLAT_TEXT = '''ID   TEST_HUMAN              Reviewed;          30 AA.
+AC   P00000;
+DE   RecName: Full=Protein;
+OS   Homo sapiens (Human).
+OC   Eukaryota.
+OX   NCBI_TaxID=9606;
+CC   -!- FUNCTION: Not used for annotation.
+CC   -!- SUBCELLULAR LOCATION: Cytoplasm {ECO:0000269}. Nucleus.
+CC   -!- SUBCELLULAR LOCATION: Isoform 2: Secreted (α-granule).
+FT   DOMAIN          ?..20
+FT                   /note="Kinase"
+FT   DOMAIN          2..?
+FT   DOMAIN          2..25
+FT                   /note="Zinc finger"
+FT   DISULFID        <3..28
+FT   MOD_RES         ?1..7
+FT                   /note="Phosphoserine"
+FT   METAL           28
+FT                   /note="Zinc ion; via tele nitrogen"
+FT   CHAIN           1..>30
+SQ   SEQUENCE   30 AA;  1 MW;  0 CRC64;
+     MACDEFGHIK LMNPQRSTVW YACDEFGCHK
+//
+'''
+
+
+def _old_intervals(features):
+    ''' Features which res_features used before locations were resolved ahead of time. '''
+    ret = list()
+    for feature in features:
+        try:
+            if str(feature.location.start)[0] == '?' or str(feature.location.end)[0] == '?':
+                continue
+            ret.append((int(feature.location.start), int(feature.location.end), feature.type,
+                        str(feature.type) + '--' + str(feature.qualifiers) + ' || '))
+        except TypeError:
+            continue
+    return ret
+
+
+class TestProteinRecord(unittest.TestCase):
+    def setUp(self):
+        self.swissprot = SwissProt.read(io.StringIO(FLAT_TEXT))
+        self.record = ProteinRecord.ProteinRecord.from_swissprot(self.swissprot)
+
+    def assertSameRecord(self, lhs, rhs):
+        for attr in ('organism', 'sequence', 'comments', 'feature_types', 'feature_labels'):
+            self.assertEqual(getattr(lhs, attr), getattr(rhs, attr), attr)
+        self.assertEqual(list(lhs.feature_starts), list(rhs.feature_starts))
+        self.assertEqual(list(lhs.feature_ends), list(rhs.feature_ends))
+
+    def test_from_swissprot(self):
+        self.assertEqual(self.record.organism, self.swissprot.organism)
+        self.assertEqual(self.record.sequence, self.swissprot.sequence)
+        self.assertEqual(UniProt.protein_location(self.record), UniProt.protein_location(self.swissprot))
+        self.assertEqual(list(self.record.iterfeatures()), _old_intervals(self.swissprot.features))
+        self.assertEqual(self.record.n_features(), 5)
+
+    def test_round_trip(self):
+        buf = self.record.to_bytes()
+        self.assertTrue(buf.startswith(b'CAPR'))
+        copy = ProteinRecord.ProteinRecord.from_bytes(buf)
+        self.assertSameRecord(copy, self.record)
+        self.assertEqual(copy, self.record)
+        self.assertEqual(copy.to_bytes(), buf)
+        for position in range(len(self.record.sequence)):
+            for all_features in (False, True):
+                self.assertEqual(UniProt.res_features(copy, position, all_features=all_features),
+                                 UniProt.res_features(self.swissprot, position, all_features=all_features))
+
+    def test_round_trip_from_memoryview(self):
+        copy = ProteinRecord.ProteinRecord.from_bytes(memoryview(bytearray(self.record.to_bytes())))
+        self.assertSameRecord(copy, self.record)
+
+    def test_empty_record(self):
+        record = ProteinRecord.ProteinRecord()
+        copy = ProteinRecord.ProteinRecord.from_bytes(record.to_bytes())
+        self.assertSameRecord(copy, record)
+        self.assertEqual(copy.n_features(), 0)
+        self.assertEqual(UniProt.res_features(copy, 0), ('', ''))
+
+    def test_pickle(self):
+        records = {'P00000': self.record, 'P00001': ProteinRecord.ProteinRecord(organism='Mus musculus (Mouse).')}
+        copy = pickle.loads(pickle.dumps(records))
+        self.assertEqual(copy, records)
+        self.assertSameRecord(copy['P00000'], self.record)
+
+    def test_not_equal(self):
+        other = ProteinRecord.ProteinRecord(organism=self.record.organism, sequence=self.record.sequence[:-1])
+        self.assertNotEqual(other, self.record)
+        self.assertNotEqual(self.record, self.record.to_bytes())
+
+    def test_not_hashable(self):
+        with self.assertRaises(TypeError):
+            hash(self.record)
+        with self.assertRaises(TypeError):
+            {self.record}
+
+    def test_invalid_buffer(self):
+        buf = self.record.to_bytes()
+        with self.assertRaises(ValueError):
+            ProteinRecord.ProteinRecord.from_bytes(b'XXXX' + buf[4:])
+        for n in (0, 3, 10, len(buf) // 2, len(buf) - 1):
+            with self.assertRaises(ValueError):
+                ProteinRecord.ProteinRecord.from_bytes(buf[:n])
+        with self.assertRaises(ValueError):
+            ProteinRecord.ProteinRecord.from_bytes(buf + b'\x00')
+
+    def test_mismatched_features(self):
+        with self.assertRaises(ValueError):
+            ProteinRecord.ProteinRecord(feature_starts=array('i', [1]), feature_ends=array('i', [2]),
+                                        feature_types=['DOMAIN'], feature_labels=[])
+
+
+if __name__ == '__main__':
+    unittest.main()
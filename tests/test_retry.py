@@ -0,0 +1,85 @@
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import Retry
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def scheduler(self):
+        return Retry.RetryScheduler(n_retry=3, timeout=5, hedge_after=None, base_delay=0.01, max_delay=0.05)
+
+    def test_retry_on_error(self):
+        calls = list()
+        def fn(timeout):
+            calls.append(timeout)
+            if len(calls) < 3:
+                raise ConnectionError('reset')
+            return 'ok'
+        self.assertEqual(self.scheduler().call(fn, 'key'), (True, 'ok'))
+        self.assertEqual(len(calls), 3)
+
+    def test_other_error_fails_without_retry(self):
+        calls = list()
+        def fn(timeout):
+            calls.append(timeout)
+            return b'\xff'.decode('utf-8')
+        self.assertEqual(self.scheduler().call(fn, 'key'), (False, None))
+        self.assertEqual(len(calls), 1)
+
+    def test_other_error_fails_without_retry_async(self):
+        calls = list()
+        async def coro(hedge):
+            calls.append(hedge)
+            raise KeyError('key')
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(self.scheduler().call_async(coro, 'key'))
+        finally:
+            loop.close()
+        self.assertEqual(result, (False, None))
+        self.assertEqual(len(calls), 1)
+
+    def test_breaker_recovers_after_throttled_trial(self):
+        scheduler = Retry.RetryScheduler(n_retry=1, timeout=5, hedge_after=None, base_delay=0.01, max_delay=0.05,
+                                         breaker_threshold=1, breaker_reset=0)
+        def fail(timeout):
+            raise ConnectionError('reset')
+        def throttled(timeout):
+            raise Retry.Throttled('0')
+        def fn(timeout):
+            return 'ok'
+
+        self.assertEqual(scheduler.call(fail, 'key'), (False, None))
+        self.assertTrue(scheduler.breaker.is_open())
+        self.assertEqual(scheduler.call(throttled, 'key'), (False, None))
+        self.assertEqual(scheduler.call(fn, 'key'), (True, 'ok'))
+        self.assertFalse(scheduler.breaker.is_open())
+
+    def test_breaker_recovers_after_other_error_in_trial(self):
+        scheduler = Retry.RetryScheduler(n_retry=1, timeout=5, hedge_after=None, base_delay=0.01, max_delay=0.05,
+                                         breaker_threshold=1, breaker_reset=0)
+        async def fail(hedge):
+            raise ConnectionError('reset')
+        async def bad_record(hedge):
+            raise ValueError('bad record')
+        async def coro(hedge):
+            return 'ok'
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(scheduler.call_async(fail, 'key')), (False, None))
+            self.assertTrue(scheduler.breaker.is_open())
+            self.assertEqual(loop.run_until_complete(scheduler.call_async(bad_record, 'key')), (False, None))
+            self.assertEqual(loop.run_until_complete(scheduler.call_async(coro, 'key')), (True, 'ok'))
+        finally:
+            loop.close()
+        self.assertFalse(scheduler.breaker.is_open())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import Shards
+from cimage_annotation.submodules.fasta import fasta
+
+HEADER = 'index\tid\tdescription\tres_function\n'
+LINES = [('1', 'P2', 'Protein 2'), ('', 'P2', 'Protein 2'), ('2', 'P1', 'Protein 1'),
+         ('', 'P1', 'Protein 1'), ('3', 'P3', 'Protein 3'), ('', 'P3', 'Protein 3')]
+SHARD_IDS = [{'P1', 'P3'}, {'P2'}]
+
+
+def _alignment_txt(protein_id):
+    return ('H\tquery_length\t10\nH\tquery_description\tProtein {0}\nH\tquery_id\t{0}\n'
+            '\nM\thit_id\tQ{0}\nA\tHsp_qseq  \tACDC 4\nA\tHsp_midline\tACDC 4\nA\tHsp_hseq  \tACDC 4\n\n'.format(protein_id))
+
+
+def _alignment_xml(protein_id):
+    return ('<BlastOutput><BlastOutput_iterations><Iteration><Iteration_query-ID>{0}</Iteration_query-ID>'
+            '<Iteration_hits /></Iteration></BlastOutput_iterations></BlastOutput>\n'.format(protein_id))
+
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def path(self, *args):
+        return os.path.join(self.wd, *args)
+
+    def write_shard_output(self, shard, ids):
+        fname = self.path('out_{}.tsv'.format(shard))
+        with open(fname, 'w') as outF:
+            outF.write(HEADER)
+            for index, protein_id, description in LINES:
+                function = 'fxn_{}'.format(protein_id) if protein_id in ids else ''
+                outF.write('\t'.join((index, protein_id, description, function)) + '\n')
+        return fname
+
+    def test_merge_output(self):
+        fnames = [self.write_shard_output(i, ids) for i, ids in enumerate(SHARD_IDS)]
+        ids = Shards.merge_output(fnames, SHARD_IDS, self.path('out.tsv'))
+
+        self.assertEqual(ids, ['P2', 'P1', 'P3'])
+        with open(self.path('out.tsv'), 'r') as inF:
+            lines = inF.readlines()
+        self.assertEqual(lines[0], HEADER)
+        self.assertEqual([x.rstrip('\n').split('\t')[3] for x in lines[1:]], ['fxn_{}'.format(x[1]) for x in LINES])
+
+    def test_unknown_id_raises(self):
+        fnames = [self.write_shard_output(i, ids) for i, ids in enumerate(SHARD_IDS)]
+        with self.assertRaises(RuntimeError):
+            Shards.merge_output(fnames, [{'P1'}, {'P2'}], self.path('out.tsv'))
+
+    def test_merge_records(self):
+        ids = ['P2', 'P1', 'P3']
+        single = {'fasta': self.path('single.fasta'), 'txt': self.path('single.txt'), 'xml': self.path('single.xml')}
+        for protein_id in ids:
+            fasta.write_fasta_entry(single['fasta'], protein_id, 'ACDC', description='Protein')
+            with open(single['txt'], 'a') as outF:
+                outF.write(_alignment_txt(protein_id))
+            with open(single['xml'], 'a') as outF:
+                outF.write(_alignment_xml(protein_id))
+
+        for file_format in ('fasta', 'txt', 'xml'):
+            fnames = list()
+            for i, shard in enumerate(SHARD_IDS):
+                fnames.append(self.path('shard_{}.{}'.format(i, file_format)))
+                for protein_id in sorted(shard, reverse=True):
+                    if file_format == 'fasta':
+                        fasta.write_fasta_entry(fnames[-1], protein_id, 'ACDC', description='Protein')
+                    else:
+                        with open(fnames[-1], 'a') as outF:
+                            outF.write(_alignment_txt(protein_id) if file_format == 'txt' else _alignment_xml(protein_id))
+            fnames.append(self.path('missing.{}'.format(file_format)))
+
+            ofname = self.path('merged.{}'.format(file_format))
+            Shards.merge_records(fnames, ids, ofname, file_format)
+            with open(ofname, 'r') as merged, open(single[file_format], 'r') as expected:
+                self.assertEqual(merged.read(), expected.read(), file_format)
+
+            with self.assertRaises(RuntimeError):
+                Shards.merge_records(fnames, ['P1', 'P2'], ofname, file_format)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,292 @@
+
+import os
+import io
+import re
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+import threading
+from Bio import SwissProt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import UniProt, ProteinRecord, PeptideMapper, RecordCache, WorkQueue
+
+SEQUENCE = 'MACDEFGHIKLMNPQRSTVWYACDEFGCHIKLMNPQRSTVWYACDCK'
+
+FEATURES = '''FT   DOMAIN          ?..20
+FT                   /note="Kinase"
+FT   DOMAIN          5..?
+FT                   /note="SH3"
+FT   DOMAIN          2..30
+FT                   /note="Zinc finger"
+FT   DOMAIN          10..14
+FT   DISULFID        <3..28
+FT   DISULFID        ?6..12
+FT   MOD_RES         ?1..7
+FT                   /note="Phosphoserine"
+FT   MOD_RES         3..?9
+FT   METAL           28
+FT                   /note="Zinc"
+FT   BINDING         20..31
+FT   LIPID           30..39
+FT   ACT_SITE        40..>44
+FT   CHAIN           1..47
+FT   HELIX           8..8
+FT   REGION          25..35
+FT                   /note="Disordered"
+'''
+
+
+def _flat_text(features, sequence=SEQUENCE, accession='P00000'):
+    lines = ['ID   TEST_HUMAN              Reviewed;         {} AA.'.format(len(sequence)),
+             'AC   {};'.format(accession),
+             'DE   RecName: Full=Protein;',
+             'OS   Homo sapiens (Human).',
+             'OC   Eukaryota.',
+             'OX   NCBI_TaxID=9606;',
+             'CC   -!- SUBCELLULAR LOCATION: Cytoplasm.']
+    lines += features.splitlines()
+    lines.append('SQ   SEQUENCE   {} AA;  1 MW;  0 CRC64;'.format(len(sequence)))
+    for i in range(0, len(sequence), 60):
+        chunk = sequence[i:i + 60]
+        lines.append('     ' + ' '.join(chunk[j:j + 10] for j in range(0, len(chunk), 10)))
+    lines.append('//')
+    return '\n'.join(lines) + '\n'
+
+
+def _random_features(rng, length, n_features):
+    types = ['DOMAIN', 'DISULFID', 'ACT_SITE', 'METAL', 'BINDING', 'REGION', 'MOD_RES', 'CHAIN', 'HELIX', 'LIPID']
+    lines = list()
+    for k in range(n_features):
+        start = rng.randint(1, length)
+        end = min(length, start + rng.choice([0, 0, 2, 5, 9, 10, 11, 30]))
+        start_s = rng.choice([str(start)] * 8 + ['<{}'.format(start), '?{}'.format(start), '?'])
+        end_s = rng.choice([str(end)] * 8 + ['>{}'.format(end), '?{}'.format(end), '?'])
+        if start_s == '?' and end_s == '?':
+            end_s = str(end)
+        lines.append('FT   {:<15} {}..{}'.format(rng.choice(types), start_s, end_s))
+        if rng.random() > 0.3:
+            lines.append('FT                   /note="{} {}"'.format(rng.choice(['Kinase', 'SH3', 'Zinc finger']), k))
+    return '\n'.join(lines)
+
+
+def _old_res_features(record, position, all_features=False):
+    ''' res_features before features were indexed. '''
+    ret = ''
+    domains = ''
+    for feature in record.features:
+        try:
+            if feature.type.upper() == 'DOMAIN' and \
+                 str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
+                 int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
+                     domains += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
+            if all_features:
+                if str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
+                   int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
+                    ret += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
+            else:
+                if feature.type.upper() == 'DISULFID' and \
+                   str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
+                   int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
+                    ret += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
+
+                elif feature.type.upper() in UniProt.features_list and \
+                     str(feature.location.start)[0] != '?' and str(feature.location.end)[0] != '?' and \
+                     (int(feature.location.end) - int(feature.location.start)) <= 10 and \
+                     int(position) >= int(feature.location.start) and int(position) < int(feature.location.end):
+                    ret += (str(feature.type) + '--' + str(feature.qualifiers) + ' || ')
+        except TypeError as e:
+            continue
+
+    return ret, domains
+
+
+class TestFeatureIndex(unittest.TestCase):
+    def check_record(self, text):
+        swissprot = SwissProt.read(io.StringIO(text))
+        records = [ProteinRecord.ProteinRecord.from_swissprot(swissprot), SwissProt.read(io.StringIO(text))]
+        for position in range(-1, len(swissprot.sequence) + 2):
+            for all_features in (False, True):
+                expected = _old_res_features(swissprot, position, all_features=all_features)
+                for record in records:
+                    self.assertEqual(UniProt.res_features(record, position, all_features=all_features), expected,
+                                     'position {}, all_features={}'.format(position, all_features))
+
+    def test_same_as_feature_scan(self):
+        self.check_record(_flat_text(FEATURES))
+
+    def test_unknown_locations_are_skipped(self):
+        record = ProteinRecord.ProteinRecord.from_swissprot(SwissProt.read(io.StringIO(_flat_text(FEATURES))))
+        labels = ''.join(UniProt.res_features(record, i, all_features=True)[0] for i in range(len(SEQUENCE)))
+        self.assertNotIn('Kinase', labels)
+        self.assertNotIn('SH3', labels)
+        self.assertIn('Zinc finger', labels)
+
+    def test_no_features(self):
+        self.check_record(_flat_text(''))
+
+    def test_random_records(self):
+        rng = random.Random(5)
+        for _ in range(20):
+            sequence = ''.join(rng.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(rng.randint(20, 200)))
+            self.check_record(_flat_text(_random_features(rng, len(sequence), rng.randint(1, 40)), sequence=sequence))
+
+
+def _old_expasy(sequence, record, all_features=False, res_sep='|', fxn_sep='!'):
+    ''' ExPasy before peptides were mapped in a batch and annotated by protein. '''
+    seq_no_mod = sequence.replace('*', '')
+    position = ''
+    function = ''
+    domain = ''
+    organism = ''
+    full_sequence = ''
+    pro_location = ''
+
+    if record is not None:
+        organism = record.organism
+        pro_location = UniProt.protein_location(record)
+        full_sequence = record.sequence
+
+        positions = list()
+        functions = list()
+        domains = list()
+        for i, x in enumerate(re.finditer(r'\*', sequence)):
+            mod_loc = x.start()-(i+1)
+            peptide_start = str(full_sequence).find(seq_no_mod)
+            cys_pos = -1 if peptide_start == -1 else peptide_start + mod_loc
+            if cys_pos == -1:
+                positions.append('RESIDUE_NOT_FOUND')
+            else:
+                positions.append(str(cys_pos + 1))
+                functions_t, domains_t = _old_res_features(record, cys_pos, all_features=all_features)
+                functions.append(functions_t)
+                domains.append(domains_t)
+
+        position = res_sep.join(positions)
+        if ''.join(functions):
+            function = functions[0] if len(functions) == 1 else fxn_sep.join(['{}:{}'.format(p, s) for p, s in zip(positions, functions)])
+        if ''.join(domains):
+            domain = domains[0] if len(domains) == 1 else fxn_sep.join(['{}:{}'.format(p, s) for p, s in zip(positions, domains)])
+            domain = UniProt.parse_domains(domain)
+
+    else:
+        position = 'BAD_ID'
+    return organism, position, function, domain, full_sequence, pro_location
+
+
+def _random_peptides(rng, sequence, n):
+    ret = list()
+    for _ in range(n):
+        start = rng.randint(0, len(sequence) - 8)
+        peptide = sequence[start:start + rng.randint(5, 12)]
+        mods = sorted(rng.sample(range(len(peptide)), rng.randint(1, 3)))
+        modified = ''.join(c + ('*' if i in mods else '') for i, c in enumerate(peptide))
+        ret.append('{}.{}.{}'.format(sequence[start - 1] if start else '-', modified, 'K'))
+    return ret
+
+
+class TestAnnotator(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.swissprot = dict()
+        self.peptides = list()
+        for i in range(10):
+            sequence = ''.join(rng.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(rng.randint(40, 200)))
+            text = _flat_text(_random_features(rng, len(sequence), 40), sequence=sequence)
+            protein_id = 'P{:05d}'.format(i)
+            self.swissprot[protein_id] = SwissProt.read(io.StringIO(text))
+            peptides = _random_peptides(rng, sequence, 15)
+            # repeated rows, peptides which are not found, and the same peptide on another protein
+            peptides += peptides[:5] + ['K.ACDEFC*WWWWWW.K', 'R.C*']
+            self.peptides += [(protein_id, p) for p in peptides]
+        self.peptides += [('MISSING', 'K.AC*K.R'), ('P00000', self.peptides[-1][1])]
+        self.records = {k: ProteinRecord.ProteinRecord.from_swissprot(v) for k, v in self.swissprot.items()}
+        self.records['MISSING'] = None
+        self.swissprot['MISSING'] = None
+
+    def test_same_as_expasy(self):
+        matches = PeptideMapper.map_all(self.peptides, self.records)
+        n_checked = 0
+        for all_features in (False, True):
+            annotator = UniProt.Annotator(self.records, all_features=all_features, res_sep='|', fxn_sep='!')
+            for protein_id, peptide in self.peptides:
+                match = matches[(protein_id, peptide)]
+                result = annotator.annotate(protein_id, match.sites if match.sites is not None else ())
+                sequence = PeptideMapper.normalize_peptide(peptide)[0]
+                self.assertEqual(result, UniProt.ExPasy(sequence, self.records[protein_id], all_features=all_features,
+                                                        res_sep='|', fxn_sep='!', sites=match.sites))
+                if match.starts is None or len(match.starts) <= 1:
+                    self.assertEqual(result, _old_expasy(sequence, self.swissprot[protein_id], all_features=all_features),
+                                     '{} {}'.format(protein_id, peptide))
+                    n_checked += 1
+        self.assertGreater(n_checked, len(self.peptides))
+
+    def test_missing_record(self):
+        annotator = UniProt.Annotator(self.records)
+        self.assertEqual(annotator.annotate('MISSING', (-1,)), _old_expasy('AC*K', None))
+        self.assertIsNone(annotator.protein('MISSING'))
+
+    def test_memoized_results_are_reused(self):
+        annotator = UniProt.Annotator(self.records, all_features=True)
+        protein_id = 'P00001'
+        first = annotator.annotate(protein_id, (3, 7))
+        self.assertEqual(annotator.annotate(protein_id, [3, 7]), first)
+        self.assertEqual(annotator.site(protein_id, 3), UniProt.res_features(self.records[protein_id], 3, all_features=True))
+        self.assertEqual(len(annotator._peptides), 1)
+        self.assertEqual(len(annotator._sites), 2)
+
+
+class _CountingCache(RecordCache.RecordCache):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = list()
+
+    def put_many(self, records):
+        if records:
+            self.batches.append(len(records))
+        super().put_many(records)
+
+
+def _fake_fetch_task(payload):
+    # IDs starting with X fail
+    return [[k, not k.startswith('X'), None if k.startswith('X') else _flat_text('', accession=k)]
+            for k in payload['ids']]
+
+
+class TestGetUniprotRecords(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_cache_is_written_in_batches(self):
+        queue = WorkQueue.WorkQueue(os.path.join(self.tmp, 'queue'), poll=0.01)
+        worker = threading.Thread(target=WorkQueue.run_worker,
+                                  args=(WorkQueue.WorkQueue(queue.queue_dir, poll=0.01), {'uniprot': _fake_fetch_task}),
+                                  kwargs={'idle_timeout': 0.5})
+        worker.start()
+        cache = _CountingCache(os.path.join(self.tmp, 'cache'))
+        ids = ['P{:05d}'.format(i) for i in range(230)] + ['X{:05d}'.format(i) for i in range(20)]
+        try:
+            records = UniProt.get_uniprot_records(ids, 1, show_bar=False, cache=cache, queue=queue)
+        finally:
+            worker.join()
+
+        self.assertEqual(cache.batches, [UniProt.CACHE_FLUSH_SIZE, UniProt.CACHE_FLUSH_SIZE, 30])
+        self.assertEqual(len(cache), 230)
+        self.assertEqual(list(records), ids)
+        self.assertEqual(records['P00001'].sequence, SEQUENCE)
+        self.assertIsNone(records['X00001'])
+
+        # cached records are not requested again
+        records = UniProt.get_uniprot_records(ids[:230], 1, show_bar=False, cache=cache)
+        self.assertEqual(len(cache.batches), 3)
+        self.assertEqual(records['P00002'].sequence, SEQUENCE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cimage_annotation.submodules import WorkQueue
+
+LEASE = 1
+POLL = 0.05
+
+
+def _log_run(queue_dir, name):
+    fd = os.open(os.path.join(queue_dir, 'runs.log'), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, '{}\n'.format(name).encode())
+    finally:
+        os.close(fd)
+
+
+def _read_runs(queue_dir):
+    fname = os.path.join(queue_dir, 'runs.log')
+    if not os.path.isfile(fname):
+        return list()
+    with open(fname, 'r') as inF:
+        return [x.strip() for x in inF]
+
+
+def _square(payload):
+    _log_run(payload['queue_dir'], 'square {}'.format(payload['x']))
+    time.sleep(0.01)
+    return payload['x'] ** 2
+
+
+def _always_fail(payload):
+    _log_run(payload['queue_dir'], 'fail {}'.format(payload['x']))
+    raise ValueError('bad task')
+
+
+HANDLERS = {'square': _square, 'fail': _always_fail}
+
+
+def _worker(queue_dir):
+    queue = WorkQueue.WorkQueue(queue_dir, lease=LEASE, poll=POLL)
+    WorkQueue.run_worker(queue, HANDLERS, n_threads=2, idle_timeout=1)
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue_dir = tempfile.mkdtemp()
+        self.workers = list()
+
+    def tearDown(self):
+        for p in self.workers:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        shutil.rmtree(self.queue_dir)
+
+    def start_workers(self, n):
+        for _ in range(n):
+            p = multiprocessing.Process(target=_worker, args=(self.queue_dir,))
+            p.start()
+            self.workers.append(p)
+
+    def test_each_task_runs_once(self):
+        queue = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+        self.start_workers(4)
+        n = 50
+        results = dict(queue.map('square', [{'queue_dir': self.queue_dir, 'x': x} for x in range(n)]))
+
+        self.assertEqual(results, {x: x ** 2 for x in range(n)})
+        runs = _read_runs(self.queue_dir)
+        self.assertEqual(sorted(runs), sorted('square {}'.format(x) for x in range(n)))
+        for d in (WorkQueue.TASK_DIR, WorkQueue.CLAIMED_DIR, WorkQueue.RESULT_DIR):
+            self.assertEqual(os.listdir(os.path.join(self.queue_dir, d)), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        queue = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+        task_id = queue.submit('square', {'queue_dir': self.queue_dir, 'x': 3})
+
+        # claim the task in a worker which dies without finishing it
+        dead_worker = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+        claimed_id, task = dead_worker.claim()
+        self.assertEqual(claimed_id, task_id)
+        self.assertEqual(task['attempts'], 1)
+        self.assertEqual(queue.requeue_expired(), 0)
+
+        time.sleep(LEASE + 0.2)
+        self.assertEqual(queue.requeue_expired(), 1)
+        self.assertTrue(os.path.isfile(queue._path(WorkQueue.TASK_DIR, task_id)))
+
+        self.start_workers(2)
+        result_fname = queue._path(WorkQueue.RESULT_DIR, task_id)
+        deadline = time.time() + 10
+        while not os.path.isfile(result_fname) and time.time() < deadline:
+            time.sleep(POLL)
+
+        self.assertEqual(WorkQueue._read(result_fname), {'result': 9})
+        self.assertEqual(_read_runs(self.queue_dir), ['square 3'])
+
+    def test_failed_task_is_not_retried_forever(self):
+        queue = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL, max_attempts=2)
+        self.start_workers(2)
+        payloads = [{'queue_dir': self.queue_dir, 'x': 0}]
+        with self.assertRaises(WorkQueue.TaskFailed):
+            list(queue.map('fail', payloads))
+
+        self.assertEqual(_read_runs(self.queue_dir), ['fail 0', 'fail 0'])
+        for d in (WorkQueue.TASK_DIR, WorkQueue.CLAIMED_DIR, WorkQueue.RESULT_DIR):
+            self.assertEqual(os.listdir(os.path.join(self.queue_dir, d)), [])
+
+    def test_lease_expires_on_last_attempt(self):
+        queue = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL, max_attempts=1)
+        queue.submit('square', {'queue_dir': self.queue_dir, 'x': 1})
+        dead_worker = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+        self.assertIsNotNone(dead_worker.claim())
+
+        time.sleep(LEASE + 0.2)
+        self.assertEqual(queue.requeue_expired(), 0)
+        results = os.listdir(os.path.join(self.queue_dir, WorkQueue.RESULT_DIR))
+        self.assertEqual(len(results), 1)
+        self.assertIn('error', WorkQueue._read(os.path.join(self.queue_dir, WorkQueue.RESULT_DIR, results[0])))
+
+    def test_expired_claim_can_not_finish_task(self):
+        queue = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+        task_id = queue.submit('square', {'queue_dir': self.queue_dir, 'x': 2})
+        slow_worker = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+        _, slow_task = slow_worker.claim()
+
+        time.sleep(LEASE + 0.2)
+        self.assertEqual(queue.requeue_expired(), 1)
+        # the task is back in the queue and can not be completed or failed by the slow worker
+        self.assertFalse(slow_worker.complete(task_id, 'stale', slow_task['attempts']))
+        slow_worker.fail(task_id, 'stale', slow_task['attempts'])
+        self.assertTrue(os.path.isfile(queue._path(WorkQueue.TASK_DIR, task_id)))
+
+        new_worker = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+        _, new_task = new_worker.claim()
+        self.assertEqual(new_task['attempts'], 2)
+        self.assertFalse(slow_worker.complete(task_id, 'stale', slow_task['attempts']))
+        slow_worker.fail(task_id, 'stale', slow_task['attempts'])
+        self.assertTrue(os.path.isfile(queue._path(WorkQueue.CLAIMED_DIR, task_id)))
+        self.assertEqual(os.listdir(os.path.join(self.queue_dir, WorkQueue.RESULT_DIR)), [])
+
+        self.assertTrue(new_worker.complete(task_id, 4, new_task['attempts']))
+        self.assertFalse(os.path.isfile(queue._path(WorkQueue.CLAIMED_DIR, task_id)))
+        self.assertEqual(WorkQueue._read(queue._path(WorkQueue.RESULT_DIR, task_id)), {'result': 4})
+        self.assertFalse(new_worker.complete(task_id, 4, new_task['attempts']))
+
+    def test_late_results_are_removed(self):
+        queue = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+
+        def _worker():
+            worker = WorkQueue.WorkQueue(self.queue_dir, lease=LEASE, poll=POLL)
+            for _ in range(2):
+                claimed = None
+                while claimed is None:
+                    time.sleep(POLL)
+                    claimed = worker.claim()
+                task_id, task = claimed
+                worker.complete(task_id, task['payload'] * 2, task['attempts'])
+                result_fname = worker._path(WorkQueue.RESULT_DIR, task_id)
+                while os.path.isfile(result_fname):
+                    time.sleep(POLL)
+                if task['payload'] == 0:
+                    # result written by a worker whose lease expired after the task finished
+                    WorkQueue._write_atomic(result_fname, {'result': -1})
+
+        thread = threading.Thread(target=_worker)
+        thread.start()
+        results = dict(queue.map('double', [0, 1]))
+        thread.join()
+
+        self.assertEqual(results, {0: 0, 1: 2})
+        self.assertEqual(os.listdir(os.path.join(self.queue_dir, WorkQueue.RESULT_DIR)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()